@@ -1,184 +1,57 @@
 # app.py
-import threading
-import queue
+import os
+import multiprocessing
 import json
-import time
 import sys
+import threading
 from pathlib import Path
 from flask import Flask, render_template, request, jsonify, Response
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 导入自定义模块
-from modules.utils import sanitize_filename
-from modules.downloader import MusicDownloader, parse_music_source
 from modules.sorter import MusicSorter
+from modules.library import open_library
+from modules.manager import DownloadManager, MAX_WORKERS, ENGINES, DEFAULT_ENGINE, LYRICS_JOB
+from modules.journal import JobJournal
+from modules import client, metrics, ratelimit
 
 # --- 配置 ---
-MAX_WORKERS = 8
 app = Flask(__name__, template_folder='templates', static_folder='static')
+_manager = None
+_manager_lock = threading.Lock()
 
-class DownloadManager:
-    """管理下载任务的状态和线程"""
-    def __init__(self):
-        self.is_downloading = False
-        self.thread = None
-        self.message_queue = queue.Queue()
-        self.failed_songs = [] 
-        self.current_playlist_dir = None
-        self.stop_event = threading.Event()
-
-    def _emit(self, msg_type, **kwargs):
-        kwargs['type'] = msg_type
-        self.message_queue.put(kwargs)
-
-    def start_task(self, **kwargs):
-        if self.is_downloading:
-            return False, "已有任务在运行中"
-        
-        self.is_downloading = True
-        self.failed_songs.clear()
-        self.stop_event.clear()
-        
-        self.thread = threading.Thread(target=self._run_new_download, kwargs=kwargs, daemon=True)
-        self.thread.start()
-        return True, "下载任务已启动"
-
-    def retry_task(self, **kwargs):
-        if self.is_downloading:
-            return False, "已有任务在运行中"
-        if not self.current_playlist_dir:
-            return False, "无法找到上次下载目录"
-            
-        self.is_downloading = True
-        self.stop_event.clear()
-        self.failed_songs.clear()
-        
-        kwargs['playlist_dir'] = self.current_playlist_dir
-        self.thread = threading.Thread(target=self._run_retry_download, kwargs=kwargs, daemon=True)
-        self.thread.start()
-        return True, "重试任务已启动"
-
-    def stop(self):
-        if not self.is_downloading:
-            return False, "当前无任务运行"
-        self.stop_event.set()
-        self._emit('log', message="正在请求停止下载...")
-        return True, "停止信号已发送"
-
-    # --- 内部逻辑 ---
-
-    def _run_new_download(self, save_dir, playlist_url, parse_type, quality, dl_lyrics, dl_trans, api):
-        try:
-            self._emit('log', message="正在解析链接信息...")
-            data = parse_music_source(parse_type, playlist_url)
-            
-            # --- 关键重构点：识别数据结构 ---
-            base = Path(save_dir)
-            if 'tracks' in data:
-                # 歌单/专辑模式
-                tracks = data['tracks']
-                pl_name = sanitize_filename(data.get('name') or f"PL_{int(time.time())}")
-                sub = 'album' if parse_type == 'album' else 'playlist'
-                dest_dir = base / sub / pl_name
-            else:
-                # 单曲模式：data 只有 {'id': 'xxx'}
-                tracks = [data] # 包装成列表方便循环，但字典里没 name
-                dest_dir = base / 'songs'
-            
-            dest_dir.mkdir(parents=True, exist_ok=True)
-            self.current_playlist_dir = str(dest_dir)
-            
-            self._emit('log', message=f"保存目录: {dest_dir.name}")
-            self._emit('log', message=f"解析成功: 共 {len(tracks)} 首歌曲")
-
-            self._process_common_download(dest_dir, tracks, quality, dl_lyrics, dl_trans, api)
-            
-            # 如果是歌单，保存一下 JSON 供后续排序使用
-            if 'tracks' in data and not self.stop_event.is_set():
-                (dest_dir / f"{pl_name}.json").write_text(
-                    json.dumps(data, ensure_ascii=False, indent=4), encoding='utf-8'
-                )
-
-        except Exception as e:
-            self._emit('error', message=f"下载任务出错: {e}")
-        finally:
-            self.is_downloading = False
-
-    def _run_retry_download(self, playlist_dir, songs_to_retry, quality, dl_lyrics, dl_trans, api):
-        try:
-            self._emit('log', message=f"开始重试下载 {len(songs_to_retry)} 首歌曲...")
-            self._process_common_download(Path(playlist_dir), songs_to_retry, quality, dl_lyrics, dl_trans, api)
-        except Exception as e:
-            self._emit('error', message=f"重试任务出错: {e}")
-        finally:
-            self.is_downloading = False
-
-    def _process_common_download(self, dest_dir, tracks, quality, dl_lyrics, dl_trans, api):
-        downloader = MusicDownloader(dest_dir, quality, api)
-        total = len(tracks)
-        results = []
-        
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_map = {}
-            for t in tracks:
-                # 只有当字典里有 'name' 时，才认为元数据完整
-                # 如果没有 'name'（如单曲模式），则传 None，强制 downloader 去调 API 获取详情
-                track_info_param = t if 'name' in t else None
-                
-                future = executor.submit(
-                    downloader.download_song, 
-                    str(t['id']), 
-                    dl_lyrics, 
-                    api, 
-                    track_info_param, 
-                    dl_trans
-                )
-                future_map[future] = t
-            
-            for i, future in enumerate(as_completed(future_map), 1):
-                if self.stop_event.is_set():
-                    executor.shutdown(wait=False, cancel_futures=True)
-                    break
-                
-                original_track = future_map[future]
-                try:
-                    status, fname, sid = future.result()
-                    
-                    # 确定显示用的名称
-                    if fname:
-                        log_name = fname
-                    elif 'name' in original_track:
-                        log_name = f"{original_track['name']} - {original_track.get('ar', 'Unknown')}"
-                    else:
-                        log_name = f"ID: {sid}"
-
-                    if status == 'failed':
-                        # 记录失败时，如果原数据不全，尝试更新（便于前端显示）
-                        self.failed_songs.append(original_track)
-                        self._emit('log', message=f"✗ 下载失败: {log_name}")
-                    else:
-                        icon = "✓" if status == 'downloaded' else "→"
-                        self._emit('log', message=f"{icon} {status}: {log_name}")
-                    
-                    results.append(status)
-                    
-                except Exception as e:
-                    self.failed_songs.append(original_track)
-                    self._emit('log', message=f"✗ 线程异常: {e}")
-
-                self._emit('progress', progress=(i / total) * 100, status_text=f"进度: {i}/{total}")
+def get_app_base():
+    """程序所在目录（打包后为可执行文件所在目录）"""
+    if getattr(sys, 'frozen', False):
+        return Path(sys.executable).parent
+    return Path(__file__).parent
+
+def get_manager():
+    """
+    首次使用时创建下载管理器。不在导入时创建：标签写入进程池以 spawn 方式启动工作进程，
+    工作进程会重新导入本模块，不能在其中打开任务日志或配置连接池。
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            # 每个主机保留的 keep-alive 连接数，与下载线程数保持一致，避免线程争抢连接
+            client.configure(pool_maxsize=MAX_WORKERS)
+            # 任务队列与每首歌的状态记录在程序目录下的任务日志中，重启后中断的任务自动继续
+            _manager = DownloadManager(journal=JobJournal(get_app_base() / 'jobs.db'))
+        return _manager
 
-        success_cnt = results.count('downloaded') + results.count('skipped')
-        fail_cnt = len(self.failed_songs)
-        evt = 'stopped' if self.stop_event.is_set() else 'done'
-        msg = f"任务{'停止' if evt=='stopped' else '完成'}。成功: {success_cnt}, 失败: {fail_cnt}"
-        
-        self._emit(evt, message=msg, has_failed=(fail_cnt > 0), 
-                   failed_count=fail_cnt, success_count=success_cnt)
+# --- 辅助工具函数 ---
 
-manager = DownloadManager()
+def get_engine(data):
+    """请求中选择的下载引擎，无效值使用默认引擎"""
+    engine = data.get('engine', DEFAULT_ENGINE)
+    return engine if engine in ENGINES else DEFAULT_ENGINE
 
-# --- 辅助工具函数 ---
+def get_priority(data):
+    """请求中的任务优先级，不是整数时返回 None"""
+    try:
+        return int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return None
 
 def find_target_directory(base_dir, folder_name):
     base = Path(base_dir)
@@ -192,63 +65,132 @@ def find_target_directory(base_dir, folder_name):
 
 @app.route('/')
 def index():
-    if getattr(sys, 'frozen', False):
-        app_base = Path(sys.executable).parent
-    else:
-        app_base = Path(__file__).parent
-    default_dir = app_base / 'Music'
+    default_dir = get_app_base() / 'Music'
     return render_template('index.html', default_music_dir=str(default_dir))
 
 @app.route('/stream')
 def stream():
+    # 浏览器自动重连时带 Last-Event-ID 头；手动重连时可用 last_event_id 参数
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    sub = get_manager().events.subscribe(last_id)
+
     def event_stream():
-        while True:
-            try:
-                message = manager.message_queue.get(timeout=20)
-                yield f"data: {json.dumps(message)}\n\n"
-            except queue.Empty:
-                yield ": keep-alive\n\n"
+        try:
+            yield "retry: 3000\n\n"
+            # 订阅者读取过慢被断开时结束响应，浏览器重连后从 Last-Event-ID 补发
+            while not sub.closed:
+                item = sub.get(timeout=20)
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id, message = item
+                yield f"id: {event_id}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            sub.close()
     return Response(event_stream(), mimetype="text/event-stream")
 
 @app.route('/start-download', methods=['POST'])
 def start_download_route():
     data = request.form
-    success, msg = manager.start_task(
+    success, msg = get_manager().start_task(
         save_dir=data.get('save_dir'),
         playlist_url=data.get('playlist_url'),
         parse_type=data.get('parse_method', 'playlist'),
         quality=data.get('quality', 'exhigh'),
         dl_lyrics=data.get('download_lyrics_original') == 'true',
         dl_trans=data.get('download_lyrics_translated') == 'true',
-        api=data.get('download_api', 'vkeys')
+        api=data.get('download_api', 'vkeys'),
+        sync=data.get('sync_mode') == 'true',
+        archive_removed=data.get('archive_removed') == 'true',
+        engine=get_engine(data)
+    )
+    return jsonify({'status': 'success' if success else 'error', 'message': msg})
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs_route():
+    return jsonify({'jobs': get_manager().list_jobs()})
+
+@app.route('/jobs', methods=['POST'])
+def enqueue_job_route():
+    data = request.form if request.form else (request.json or {})
+    parse_type = data.get('parse_method', 'playlist')
+    if parse_type not in ('playlist', 'album', 'link'):
+        return jsonify({'status': 'error', 'message': f"不支持的任务类型: {parse_type}"}), 400
+    priority = get_priority(data)
+    if priority is None:
+        return jsonify({'status': 'error', 'message': "优先级必须是整数"}), 400
+    job = get_manager().enqueue(
+        parse_type,
+        priority=priority,
+        save_dir=data.get('save_dir'),
+        playlist_url=data.get('playlist_url'),
+        parse_type=parse_type,
+        quality=data.get('quality', 'exhigh'),
+        dl_lyrics=str(data.get('download_lyrics_original')).lower() == 'true',
+        dl_trans=str(data.get('download_lyrics_translated')).lower() == 'true',
+        api=data.get('download_api', 'vkeys'),
+        sync=str(data.get('sync_mode')).lower() == 'true',
+        archive_removed=str(data.get('archive_removed')).lower() == 'true',
+        engine=get_engine(data)
     )
+    return jsonify({'status': 'success', 'message': '任务已加入队列', 'job': job.to_dict()})
+
+@app.route('/jobs/<job_id>/<action>', methods=['POST'])
+def job_action_route(job_id, action):
+    if action == 'pause':
+        success, msg = get_manager().pause(job_id)
+    elif action == 'resume':
+        success, msg = get_manager().resume(job_id)
+    elif action == 'cancel':
+        success, msg = get_manager().cancel(job_id)
+    elif action == 'priority':
+        priority = get_priority(request.json or {})
+        if priority is None:
+            success, msg = False, "优先级必须是整数"
+        else:
+            success, msg = get_manager().set_priority(job_id, priority)
+    else:
+        return jsonify({'status': 'error', 'message': f"未知操作: {action}"}), 404
     return jsonify({'status': 'success' if success else 'error', 'message': msg})
 
+@app.route('/metrics')
+def metrics_route():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/limits')
+def limits_route():
+    return jsonify({'hosts': ratelimit.snapshot()})
+
 @app.route('/retry-failed-songs', methods=['POST'])
 def retry_failed_songs_route():
     data = request.json
-    songs = data.get('songs') or manager.failed_songs
+    songs = data.get('songs') or get_manager().failed_songs
     
     if not songs:
         return jsonify({'status': 'error', 'message': '没有需要重试的歌曲'})
 
-    success, msg = manager.retry_task(
+    success, msg = get_manager().retry_task(
         songs_to_retry=list(songs),
         quality=data.get('quality', 'exhigh'),
         dl_lyrics=data.get('download_lyrics', True),
         dl_trans=data.get('download_lyrics_translated', False),
-        api=data.get('download_api', 'vkeys')
+        api=data.get('download_api', 'vkeys'),
+        engine=get_engine(data)
     )
     return jsonify({'status': 'success' if success else 'error', 'message': msg})
 
 @app.route('/stop-download', methods=['POST'])
 def stop_download_route():
-    success, msg = manager.stop()
+    success, msg = get_manager().stop()
     return jsonify({'status': 'success' if success else 'error', 'message': msg})
 
 @app.route('/get-failed-songs')
 def get_failed_songs():
-    return jsonify({'failed_songs': list(manager.failed_songs)})
+    return jsonify({'failed_songs': list(get_manager().failed_songs)})
 
 @app.route('/get-playlists')
 def get_playlists():
@@ -301,7 +243,7 @@ def sort_playlist_route():
             return jsonify({'status': 'error', 'message': "缺少排序所需的JSON文件"}), 404
         pl_data = json.loads(json_file.read_text(encoding='utf-8'))
         tracks = pl_data.get('tracks', [])
-        cnt = MusicSorter().sort_playlist(str(target_dir), tracks, start_num)
+        cnt = MusicSorter(open_library(base_dir)).sort_playlist(str(target_dir), tracks, start_num)
         return jsonify({'status': 'success', 'message': f"排序完成！处理了 {cnt} 首歌曲。"})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f"排序异常: {e}"}), 500
@@ -315,10 +257,37 @@ def remove_numbering_route():
     if not target_dir:
         return jsonify({'status': 'error', 'message': f"未找到目录: {pl_name}"}), 404
     try:
-        cnt = MusicSorter().remove_numbers(str(target_dir))
+        cnt = MusicSorter(open_library(base_dir)).remove_numbers(str(target_dir))
         return jsonify({'status': 'success', 'message': f"去序完成！处理了 {cnt} 个文件。"})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f"去序异常: {e}"}), 500
 
+@app.route('/rebuild-lyrics', methods=['POST'])
+def rebuild_lyrics_route():
+    data = request.json or {}
+    base_dir = data.get('base_dir')
+    if not base_dir or not Path(base_dir).is_dir():
+        return jsonify({'status': 'error', 'message': f"目录不存在: {base_dir}"}), 404
+    # 不指定歌单时重建保存根目录下的所有歌单
+    playlists = data.get('playlists') or ([data['playlist_name']] if data.get('playlist_name') else None)
+    priority = get_priority(data)
+    if priority is None:
+        return jsonify({'status': 'error', 'message': "优先级必须是整数"}), 400
+    job = get_manager().enqueue(
+        LYRICS_JOB,
+        priority=priority,
+        save_dir=base_dir,
+        translated=bool(data.get('translated')),
+        romanized=bool(data.get('romanized')),
+        playlists=playlists
+    )
+    return jsonify({'status': 'success', 'message': f"歌词重建任务已加入队列 (ID: {job.id})", 'job': job.to_dict()})
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    # 打包后的程序启动标签写入进程池需要
+    multiprocessing.freeze_support()
+    debug = True
+    # 调试模式下 reloader 的父进程只负责监控文件变化，任务只在实际提供服务的子进程中恢复
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_manager().start()
+    app.run(host='0.0.0.0', port=5000, debug=debug, threaded=True)
\ No newline at end of file
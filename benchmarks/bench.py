@@ -0,0 +1,170 @@
+# benchmarks/bench.py
+"""
+离线性能测试：在本地模拟的上游接口上运行完整的下载流程和歌单排序，
+输出 歌曲/秒、MB/秒 与峰值内存，用于发现性能退化。
+
+用法（在项目根目录下）:
+    python -m benchmarks.bench                       # 100 / 1000 / 10000 首
+    python -m benchmarks.bench --sizes 100 --audio-kb 1024 --latency-ms 20 --error-rate 0.01
+    python -m benchmarks.bench --json > result.json
+每个规模在独立的子进程中运行，峰值内存互不影响。
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+DEFAULT_SIZES = (100, 1000, 10000)
+# 超过该歌曲数时默认跳过排序测试
+DEFAULT_MAX_SORT_TRACKS = 10000
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _collect_finished(events, finished):
+    while True:
+        item = events.get(timeout=1)
+        if item is not None and item[1].get('type') in ('done', 'stopped'):
+            finished.append(item[1])
+            return
+
+
+def run_one(size, args) -> dict:
+    """在当前进程中运行一个规模的测试"""
+    from modules import ratelimit
+    from modules.downloader import parse_music_source
+    from modules.library import open_library
+    from modules.manager import DownloadManager, DownloadJob, MAX_WORKERS
+    from modules.sorter import MusicSorter
+    from benchmarks.stub_server import StubUpstream, install
+
+    if not args.keep_rate_limits:
+        # 测的是下载器本身，不受线上接口的限速配置影响
+        ratelimit.HOST_RATES.clear()
+
+    stub = StubUpstream(args.audio_kb * 1024, args.latency_ms / 1000, args.error_rate).start()
+    install(stub, pool_maxsize=MAX_WORKERS)
+    root = Path(tempfile.mkdtemp(prefix='ncmtools-bench-'))
+    result = {'tracks': size, 'engine': args.engine}
+    try:
+        # 下载器的调试输出量与歌曲数成正比，测试时丢弃
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            data = parse_music_source(args.parse_type, f"https://music.163.com/{args.parse_type}?id={size}")
+            result['parse_seconds'] = round(time.perf_counter() - start, 3)
+
+            manager = DownloadManager()
+            job = DownloadJob('retry', {})
+            manager.jobs[job.id] = job
+            manager.budget.register(job.id)
+            # 边下载边读取事件，避免订阅者积压被断开
+            events = manager.events.subscribe()
+            finished = []
+            reader = threading.Thread(target=_collect_finished, args=(events, finished), daemon=True)
+            reader.start()
+            dest = root / 'playlist' / data['name']
+
+            start = time.perf_counter()
+            manager._process_common_download(job, root, dest, data['tracks'], args.quality,
+                                             True, args.translated, args.api, args.engine)
+            elapsed = time.perf_counter() - start
+            manager.tagger.shutdown()
+
+            reader.join(timeout=5)
+            done = finished[0] if finished else None
+            summary = done.get('metrics', {}) if done else {}
+            result.update({
+                'download_seconds': round(elapsed, 3),
+                'songs_per_sec': round(size / elapsed, 2),
+                'mb_per_sec': round(summary.get('bytes', 0) / elapsed / 1024 / 1024, 2),
+                'success': done.get('success_count') if done else None,
+                'failed': done.get('failed_count') if done else None,
+                'stages': summary.get('stages', {}),
+            })
+
+            if size <= args.max_sort_tracks:
+                sorter = MusicSorter(open_library(root))
+                start = time.perf_counter()
+                sort_result = sorter.sort_playlist(str(dest), data['tracks'], len(data['tracks']))
+                result['sort_seconds'] = round(time.perf_counter() - start, 3)
+                result['sort_not_found'] = sort_result['not_found']
+            else:
+                result['sort_seconds'] = None
+        result['upstream_requests'] = stub.requests
+        peak = peak_rss_mb()
+        result['peak_rss_mb'] = round(peak, 1) if peak is not None else None
+    finally:
+        stub.stop()
+        shutil.rmtree(root, ignore_errors=True)
+    return result
+
+
+def _format_row(r) -> str:
+    sort = f"{r['sort_seconds']:.2f}s" if r.get('sort_seconds') is not None else 'skipped'
+    rss = f"{r['peak_rss_mb']:.0f} MB" if r.get('peak_rss_mb') is not None else '-'
+    return (f"{r['tracks']:>6} 首 | {r['songs_per_sec']:>8.1f} 首/秒 | {r['mb_per_sec']:>7.1f} MB/秒 | "
+            f"成功 {r['success']} 失败 {r['failed']} | 排序 {sort} | 峰值内存 {rss}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NCM Tools 离线性能测试')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='歌曲数量，逗号分隔')
+    parser.add_argument('--audio-kb', type=int, default=64, help='每首歌的音频大小 (KB)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='每个上游请求的附加延迟 (毫秒)')
+    parser.add_argument('--error-rate', type=float, default=0, help='上游随机返回 503 的比例')
+    parser.add_argument('--engine', default='thread', choices=('thread',), help='下载引擎')
+    parser.add_argument('--api', default='bugpk', help='首选下载地址接口')
+    parser.add_argument('--quality', default='exhigh')
+    parser.add_argument('--parse-type', default='playlist', choices=('playlist', 'album'))
+    parser.add_argument('--translated', action='store_true', help='同时合并翻译歌词')
+    parser.add_argument('--keep-rate-limits', action='store_true', help='保留 ratelimit.HOST_RATES 中的限速配置')
+    parser.add_argument('--max-sort-tracks', type=int, default=DEFAULT_MAX_SORT_TRACKS, help='超过该歌曲数时跳过排序测试')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single is not None:
+        print(json.dumps(run_one(args.single, args), ensure_ascii=False))
+        return 0
+
+    # 每个规模在独立子进程中运行，峰值内存才有意义
+    passthrough = [a for a in (argv if argv is not None else sys.argv[1:]) if a != '--json']
+    results = []
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        proc = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench', *passthrough, '--single', str(size)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            return proc.returncode
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        if not args.json:
+            print(_format_row(result), flush=True)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# benchmarks/bench_lyrics.py
+"""
+歌词解析与合并的微基准：比较 modules.Lyrics 与改写前的实现（逐个时间标签 findall/sub/re.split，
+合并时建两个字典再对时间并集排序）的耗时，并检查两者输出一致。只在内存中运行。
+
+用法（在项目根目录下）:
+    python -m benchmarks.bench_lyrics                 # 10000 首，每首 60 行
+    python -m benchmarks.bench_lyrics --songs 50000 --lines 80 --json
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from modules.Lyrics import LRCParser, merge_lyrics
+
+DEFAULT_SONGS = 10000
+DEFAULT_LINES = 60
+
+
+# --- 改写前的实现，作为对照 ---
+
+_LEGACY_PATTERN = re.compile(r'\[(\d+):(\d+)[.:](\d+)\]')
+
+
+def _legacy_parse_time(time_str):
+    parts = re.split(r'[:.]', time_str.strip('[]'))
+    ms_part = parts[2]
+    millis = int(ms_part) * 10 if len(ms_part) == 2 else int(ms_part[:3])
+    return int(parts[0]) * 60000 + int(parts[1]) * 1000 + millis
+
+
+def legacy_parse(text):
+    if not text or not text.strip():
+        return []
+    lyrics = []
+    for line in text.strip().split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        matches = _LEGACY_PATTERN.findall(line)
+        if matches:
+            content = _LEGACY_PATTERN.sub('', line).strip()
+            for m in matches:
+                lyrics.append({'time': _legacy_parse_time(f"{m[0]}:{m[1]}.{m[2]}"), 'content': content})
+    lyrics.sort(key=lambda x: x['time'])
+    return lyrics
+
+
+def legacy_merge(original_text, translated_text):
+    original = {x['time']: x['content'] for x in legacy_parse(original_text)}
+    translated = {x['time']: x['content'] for x in legacy_parse(translated_text)}
+    lines = []
+    for t in sorted(set(original) | set(translated)):
+        o, tr = original.get(t, ''), translated.get(t, '')
+        tag = LRCParser.format_lrc_time(t)
+        lines.append(f"{tag}{o} / {tr}" if o and tr else f"{tag}{o or tr}")
+    return lines
+
+
+# --- 测试数据 ---
+
+def make_lyrics(rnd, lines):
+    """返回 (原文, 译文)，包含两位/三位毫秒、[mm:ss:xx] 写法、一行多个时间标签、只有时间标签的空行和元数据行"""
+    original, translated = ['[ti:Bench]', '[ar:Artist]', '[by:]'], []
+    t = 0
+    for n in range(lines):
+        t += rnd.randint(1500, 6000)
+        m, s, ms = t // 60000, t // 1000 % 60, t % 1000
+        tag = rnd.choice((f"[{m:02d}:{s:02d}.{ms // 10:02d}]", f"[{m:02d}:{s:02d}.{ms:03d}]", f"[{m:02d}:{s:02d}:{ms // 10:02d}]"))
+        if n % 15 == 14:
+            # 副歌重复：一行带两个时间标签
+            original.append(f"{tag}[{m + 3:02d}:{s:02d}.00]Chorus line {n}")
+        elif n % 10 == 9:
+            original.append(tag)
+        else:
+            original.append(f"{tag}Line {n} of the song lyrics")
+        if rnd.random() < 0.9:
+            translated.append(f"{tag}第 {n} 行歌词的翻译")
+    return '\n'.join(original), '\n'.join(translated)
+
+
+def run(songs, lines, seed=0) -> dict:
+    rnd = random.Random(seed)
+    corpus = [make_lyrics(rnd, lines) for _ in range(songs)]
+
+    def timed(func):
+        start = time.perf_counter()
+        out = [func(o, t) for o, t in corpus]
+        return time.perf_counter() - start, out
+
+    parser = LRCParser()
+    legacy_parse_seconds, legacy_parsed = timed(lambda o, t: legacy_parse(o))
+    parse_seconds, parsed = timed(lambda o, t: parser.parse_lrc(o))
+    legacy_merge_seconds, legacy_merged = timed(legacy_merge)
+    merge_seconds, merged = timed(merge_lyrics)
+
+    parse_equal = all([(x['time'], x['content']) for x in a] == b for a, b in zip(legacy_parsed, parsed))
+    return {
+        'songs': songs,
+        'lines': lines,
+        'legacy_parse_seconds': round(legacy_parse_seconds, 3),
+        'parse_seconds': round(parse_seconds, 3),
+        'parse_speedup': round(legacy_parse_seconds / max(parse_seconds, 1e-9), 2),
+        'legacy_merge_seconds': round(legacy_merge_seconds, 3),
+        'merge_seconds': round(merge_seconds, 3),
+        'merge_speedup': round(legacy_merge_seconds / max(merge_seconds, 1e-9), 2),
+        'songs_per_sec': round(songs / max(merge_seconds, 1e-9)),
+        'identical': parse_equal and legacy_merged == merged,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NCM Tools 歌词解析/合并微基准')
+    parser.add_argument('--songs', type=int, default=DEFAULT_SONGS, help='歌曲数量')
+    parser.add_argument('--lines', type=int, default=DEFAULT_LINES, help='每首歌词的行数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args(argv)
+
+    r = run(args.songs, args.lines)
+    if args.json:
+        print(json.dumps(r, ensure_ascii=False, indent=2))
+    else:
+        print(f"{r['songs']} 首 × {r['lines']} 行 | 解析 {r['legacy_parse_seconds']:.2f}s -> {r['parse_seconds']:.2f}s "
+              f"({r['parse_speedup']}x) | 合并 {r['legacy_merge_seconds']:.2f}s -> {r['merge_seconds']:.2f}s "
+              f"({r['merge_speedup']}x, {r['songs_per_sec']} 首/秒) | 输出一致: {'是' if r['identical'] else '否'}")
+    return 0 if r['identical'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# benchmarks/bench_sort.py
+"""
+排序匹配测试：比较逐个文件 difflib 比较（MusicSorter.find_best_match）
+与索引匹配（FilenameMatcher）的耗时、匹配到正确文件的歌曲数以及两者结果一致率。
+只在内存中运行，不读写文件。
+
+用法（在项目根目录下）:
+    python -m benchmarks.bench_sort                  # 300 / 1000 / 3000 首
+    python -m benchmarks.bench_sort --sizes 3000 --fuzzy-rate 0.3 --json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from modules.sorter import MusicSorter, FilenameMatcher
+from modules.utils import sanitize_filename
+from benchmarks.stub_server import track_name, track_artist
+
+DEFAULT_SIZES = (300, 1000, 3000)
+# 逐个比较的耗时与规模平方成正比，超过该数量时默认跳过
+DEFAULT_MAX_BRUTE_TRACKS = 3000
+
+
+def make_library(size, fuzzy_rate, missing_rate, seed=0):
+    """
+    返回 (歌曲标题列表, {文件名: 扩展名}, {歌曲标题: 对应的文件名})。
+    fuzzy_rate 比例的文件名带编号或有细微差异，missing_rate 比例的歌曲没有对应文件。
+    """
+    rnd = random.Random(seed)
+    titles, files, expected = [], {}, {}
+    for i in range(1, size + 1):
+        title = sanitize_filename(f"{track_name(i)} - {track_artist(i)}")
+        titles.append(title)
+        key = title
+        roll = rnd.random()
+        if roll < missing_rate:
+            continue
+        if roll < missing_rate + fuzzy_rate:
+            variant = rnd.randrange(3)
+            if variant == 0:
+                title = f"{rnd.randint(1, 999)}. {title}"
+            elif variant == 1:
+                title = title.replace(' - ', ' (Live) - ', 1)
+            else:
+                title = title.lower()
+        files[title] = rnd.choice(('.mp3', '.flac'))
+        expected[key] = title
+    return titles, files, expected
+
+
+def match_all(titles, files, indexed) -> tuple:
+    """按 sort_playlist 的顺序逐首匹配，返回 (耗时, 匹配结果列表)"""
+    files = dict(files)
+    sorter = MusicSorter(library=None)
+    matcher = FilenameMatcher(files, sorter.number_pattern) if indexed else None
+    results = []
+    start = time.perf_counter()
+    for title in reversed(titles):
+        found = matcher.match(title) if indexed else sorter.find_best_match(title, files)
+        if found:
+            if indexed:
+                matcher.remove(found[0])
+            else:
+                del files[found[0]]
+        results.append(found)
+    return time.perf_counter() - start, results
+
+
+def run_one(size, args) -> dict:
+    titles, files, expected = make_library(size, args.fuzzy_rate, args.missing_rate)
+    # 与 match_all 的结果顺序一致
+    wanted = [expected.get(title) for title in reversed(titles)]
+    correct = lambda found: sum(1 for r, w in zip(found, wanted) if (r[0] if r else None) == w)
+
+    result = {'tracks': size, 'files': len(files)}
+    indexed_seconds, indexed = match_all(titles, files, indexed=True)
+    result['indexed_seconds'] = round(indexed_seconds, 4)
+    result['indexed_correct'] = correct(indexed)
+    if size <= args.max_brute_tracks:
+        brute_seconds, brute = match_all(titles, files, indexed=False)
+        result['brute_seconds'] = round(brute_seconds, 4)
+        result['brute_correct'] = correct(brute)
+        result['agreement'] = round(sum(1 for a, b in zip(brute, indexed) if a == b) / size, 4)
+        result['speedup'] = round(brute_seconds / max(indexed_seconds, 1e-9), 1)
+    return result
+
+
+def _format_row(r) -> str:
+    indexed = f"{r['tracks']:>6} 首 | 索引 {r['indexed_seconds']:.3f}s (正确 {r['indexed_correct']})"
+    if 'brute_seconds' not in r:
+        return f"{indexed} | 逐个比较 skipped"
+    return (f"{indexed} | 逐个比较 {r['brute_seconds']:.3f}s (正确 {r['brute_correct']}) | "
+            f"一致率 {r['agreement']:.2%} | 加速 {r['speedup']}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NCM Tools 排序匹配测试')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='歌曲数量，逗号分隔')
+    parser.add_argument('--fuzzy-rate', type=float, default=0.2, help='文件名与歌曲标题不完全一致的比例')
+    parser.add_argument('--missing-rate', type=float, default=0.05, help='没有对应文件的歌曲比例')
+    parser.add_argument('--max-brute-tracks', type=int, default=DEFAULT_MAX_BRUTE_TRACKS,
+                        help='超过该歌曲数时跳过逐个比较')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        result = run_one(size, args)
+        results.append(result)
+        if not args.json:
+            print(_format_row(result), flush=True)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# benchmarks/stub_server.py
+"""
+本地模拟的上游接口：歌单、专辑、歌曲详情、歌词、各下载地址接口以及音频/封面文件。
+install() 之后 modules.client 发往这些主机的请求都会被转发到本地服务器，
+下载器的请求构造与数据整理代码按原样执行。
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from requests.adapters import HTTPAdapter
+
+from modules import client
+
+# 被转发到本地服务器的上游主机
+UPSTREAM_HOSTS = (
+    'ncmapi.xpercent.dpdns.org', 'music.163.com', 'api.vkeys.cn',
+    'api.bugpk.com', 'music.meorion.moe', 'iwenwiki.com',
+)
+# 单个 MPEG-1 Layer III 帧（128kbps / 44.1kHz，无填充）的长度，用于生成 mutagen 可以解析的 MP3
+MP3_FRAME_HEADER = b'\xff\xfb\x90\x64'
+MP3_FRAME_SIZE = 417
+COVER_SIZE = 32 * 1024
+WORDS = ('Love', 'Night', 'Rain', 'Summer', 'Dream', 'Light', 'River', 'Star', 'Blue', 'Heart',
+         'Fire', 'Moon', 'City', 'Ocean', 'Wind', 'Snow', 'Road', 'Home', 'Time', 'Sky')
+
+
+def make_mp3(size: int) -> bytes:
+    frame = MP3_FRAME_HEADER + b'\x00' * (MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    return (frame * (size // MP3_FRAME_SIZE + 1))[:size]
+
+
+def etag(data: bytes) -> str:
+    """按内容计算的 ETag，文件内容变化时随之变化"""
+    return f'"{zlib.crc32(data):08x}"'
+
+
+def track_name(i: int) -> str:
+    """可重复生成、彼此不同但有相似词的歌名，用于排序匹配"""
+    rnd = random.Random(i)
+    return f"{' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 3)))} {i}"
+
+
+def track_artist(i: int) -> str:
+    return f"Artist {i % 97}"
+
+
+class StubUpstream:
+    """
+    模拟上游的 HTTP 服务器。
+    歌单/专辑 ID 即歌曲数量（如 playlist?id=1000 返回 1000 首歌）；
+    latency 为每个请求的附加延迟（秒），error_rate 为随机返回 503 的比例，
+    ranges 为 False 时忽略 Range 请求头，总是返回完整文件。
+    文件带有按内容计算的 ETag，If-Range 与之不符时返回完整文件。
+    """
+    def __init__(self, audio_size=256 * 1024, latency=0.0, error_rate=0.0, seed=0, ranges=True):
+        self.audio = make_mp3(audio_size)
+        self.ranges = ranges
+        self.cover = b'\xff\xd8\xff\xe0' + b'\x00' * (COVER_SIZE - 4)
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self.error_rate and self._random.random() < self.error_rate
+
+    # --- 接口数据 ---
+
+    def _song(self, i):
+        return {
+            'id': i, 'name': track_name(i), 'ar': [track_artist(i)], 'album': f"Album {i // 10}",
+            'picUrl': f"{self.base_url}/cover/{i // 10}.jpg", 'duration': 200000,
+        }
+
+    def _song_detail(self, i):
+        return {
+            'id': i, 'name': track_name(i), 'artists': [{'name': track_artist(i)}],
+            'album': {'name': f"Album {i // 10}", 'picUrl': f"{self.base_url}/cover/{i // 10}.jpg"}, 'duration': 200000,
+        }
+
+    def _lyric(self, i):
+        lines = '\n'.join(f"[00:{n:02d}.00]{track_name(i)} line {n}" for n in range(40))
+        trans = '\n'.join(f"[00:{n:02d}.00]翻译 {n}" for n in range(40))
+        return {'lrc': {'lyric': lines}, 'tlyric': {'lyric': trans}, 'romalrc': {'lyric': ''}}
+
+    def route(self, host, path, query):
+        """返回 (状态码, JSON 数据)，未知地址返回 404"""
+        first = lambda key: (query.get(key) or [''])[0]
+        audio_url = lambda sid: f"{self.base_url}/audio/{sid}.mp3"
+        if host == 'ncmapi.xpercent.dpdns.org' and path in ('/playlist', '/album'):
+            count = int(first('id') or 0)
+            songs = [self._song(i) for i in range(1, count + 1)]
+            return 200, {'id': first('id'), 'name': f"Bench {count}", 'songs': songs, 'size': count, 'trackCount': count}
+        if host == 'music.163.com' and path == '/api/song/detail':
+            ids = [int(x) for x in re.findall(r'\d+', first('ids'))]
+            return 200, {'songs': [self._song_detail(i) for i in ids]}
+        if host == 'music.163.com' and path == '/api/song/lyric':
+            return 200, self._lyric(int(first('id')))
+        if host == 'api.vkeys.cn':
+            return 200, {'data': {'quality': 'exhigh', 'size': len(self.audio), 'url': audio_url(first('id'))}}
+        if host == 'api.bugpk.com':
+            return 200, {'level': first('level'), 'size': len(self.audio), 'url': audio_url(first('ids'))}
+        if host == 'music.meorion.moe':
+            return 200, {'size': len(self.audio), 'url': audio_url(first('id'))}
+        if host == 'iwenwiki.com':
+            return 200, {'data': [{'quality': first('level'), 'size': len(self.audio), 'url': audio_url(first('id'))}]}
+        return 404, {}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头与响应体分两次写出，不关闭 Nagle 时每个请求会多出约 40ms 的延迟确认等待
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type, headers=()):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_bytes(self, data):
+                tag = etag(data)
+                headers = [('Accept-Ranges', 'bytes'), ('ETag', tag)]
+                match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+                if_range = self.headers.get('If-Range')
+                if not match or not stub.ranges or (if_range and if_range != tag):
+                    return self._send(200, data, 'application/octet-stream', headers)
+                start = int(match[1])
+                end = min(int(match[2]) if match[2] else len(data) - 1, len(data) - 1)
+                if start >= len(data):
+                    return self._send(416, b'', 'text/plain')
+                self._send(206, data[start:end + 1], 'application/octet-stream',
+                           headers + [('Content-Range', f'bytes {start}-{end}/{len(data)}')])
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub._fail():
+                    return self._send(503, b'', 'text/plain')
+                parts = urlsplit(self.path)
+                if parts.path.startswith('/audio/'):
+                    return self._send_bytes(stub.audio)
+                if parts.path.startswith('/cover/'):
+                    return self._send(200, stub.cover, 'image/jpeg')
+                # 转发来的上游请求：/<主机>/<原路径>
+                host, _, path = parts.path.lstrip('/').partition('/')
+                status, data = stub.route(host, '/' + path, parse_qs(parts.query))
+                self._send(status, json.dumps(data).encode(), 'application/json')
+
+        return Handler
+
+
+def redirect_url(base_url: str, url: str) -> str:
+    """把发往上游主机的地址改写为 本地服务器/<主机>/<路径>，其他地址原样返回"""
+    parts = urlsplit(url)
+    if parts.hostname not in UPSTREAM_HOSTS:
+        return url
+    query = f"?{parts.query}" if parts.query else ''
+    return f"{base_url}/{parts.hostname}{parts.path}{query}"
+
+
+class _RedirectAdapter(HTTPAdapter):
+    """把发往上游主机的请求改写为 本地服务器/<主机>/<路径>"""
+    def __init__(self, base_url, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        request.url = redirect_url(self.base_url, request.url)
+        return super().send(request, **kwargs)
+
+
+def install(stub: StubUpstream, pool_maxsize=client.POOL_MAXSIZE):
+    """让共享会话的请求经过本地模拟服务器"""
+    session = client.get_session()
+    adapter = _RedirectAdapter(stub.base_url, pool_connections=client.POOL_CONNECTIONS,
+                               pool_maxsize=pool_maxsize, pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
@@ -0,0 +1,270 @@
+# cli.py
+"""
+命令行入口（不依赖 Flask），适合定时任务批量同步歌单。
+
+    python cli.py download URL [URL ...] --save-dir D:/Music [--type playlist|album|link]
+    python cli.py sync --file playlists.txt --save-dir D:/Music [--archive-removed]
+    python cli.py sort D:/Music/playlist/歌单名 [--start-number 500]
+    python cli.py remove-numbers D:/Music/playlist/歌单名
+    python cli.py rebuild-lyrics [歌单名 ...] --save-dir D:/Music [--translated] [--romanized]
+
+结果以 JSON 输出到标准输出；-v 时下载日志输出到标准错误。
+退出码: 0 全部成功, 1 部分歌曲失败, 2 参数错误, 3 任务出错, 130 被中断。
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+from pathlib import Path
+
+EXIT_OK = 0
+EXIT_TRACKS_FAILED = 1
+EXIT_USAGE = 2
+EXIT_JOB_ERROR = 3
+EXIT_INTERRUPTED = 130
+
+QUALITIES = ('standard', 'exhigh', 'lossless', 'hires', 'jymaster')
+APIS = ('vkeys', 'bugpk', 'iwenwiki', 'ss22y')
+
+
+def _log(args, message):
+    if args.verbose:
+        print(message, file=sys.stderr, flush=True)
+
+
+def _read_sources(args) -> list:
+    """命令行参数与 --file 中的条目（每行一个，# 开头为注释）"""
+    sources = list(args.sources)
+    if args.file:
+        text = sys.stdin.read() if args.file == '-' else Path(args.file).read_text(encoding='utf-8')
+        sources += [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('#')]
+    return sources
+
+
+@contextlib.contextmanager
+def _quiet(args):
+    """下载器与排序器的调试输出：-v 时转到标准错误，否则丢弃，保证标准输出只有 JSON"""
+    if args.verbose:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+# --- 下载 / 同步 ---
+
+def _wait_jobs(args, manager, sub, jobs):
+    """读取事件直到所有任务结束，返回 {任务ID: 结束事件}"""
+    from modules.manager import FINISHED_STATES
+    finished, last_id = {}, None
+    running = True
+    while True:
+        if sub.closed:
+            sub = manager.events.subscribe(last_id)
+        # 任务状态在结束事件发出后才更新，全部结束后继续读完已排队的事件
+        item = sub.get(timeout=0.5 if running else 0)
+        if item is None:
+            if not running:
+                break
+            running = not all(job.state in FINISHED_STATES for job in jobs)
+            continue
+        last_id, event = item
+        if event.get('type') in ('done', 'stopped', 'error'):
+            finished[event.get('job_id')] = event
+        if event.get('type') in ('log', 'error', 'sync'):
+            _log(args, f"[{event.get('job_id')}] {event.get('message') or event}")
+    sub.close()
+    return finished
+
+
+def cmd_download(args, sync=False) -> int:
+    sources = _read_sources(args)
+    if not sources:
+        print("没有需要下载的链接", file=sys.stderr)
+        return EXIT_USAGE
+
+    from modules import client
+    from modules.manager import DownloadManager, DONE, MAX_WORKERS
+
+    # 与 app.py 一致：每个主机保留的 keep-alive 连接数与下载线程数相同，避免连接池满时丢弃连接
+    client.configure(pool_maxsize=MAX_WORKERS)
+    manager = DownloadManager(max_concurrent_jobs=args.jobs)
+    sub = manager.events.subscribe()
+    jobs = []
+    try:
+        with _quiet(args):
+            for source in sources:
+                jobs.append(manager.enqueue(
+                    args.type, save_dir=args.save_dir, playlist_url=source, parse_type=args.type,
+                    quality=args.quality, dl_lyrics=not args.no_lyrics, dl_trans=args.translated, api=args.api,
+                    sync=sync, archive_removed=getattr(args, 'archive_removed', False), engine=args.engine,
+                ))
+            finished = _wait_jobs(args, manager, sub, jobs)
+    except KeyboardInterrupt:
+        for job in jobs:
+            manager.cancel(job.id)
+        print(json.dumps({'status': 'interrupted'}, ensure_ascii=False))
+        return EXIT_INTERRUPTED
+    finally:
+        manager.tagger.shutdown()
+
+    results, exit_code = [], EXIT_OK
+    for source, job in zip(sources, jobs):
+        event = finished.get(job.id, {})
+        results.append({
+            'source': source, 'job_id': job.id, 'state': job.state, 'playlist_dir': job.playlist_dir,
+            'success': event.get('success_count'), 'failed': len(job.failed_songs),
+            'failed_songs': [{'id': t.get('id'), 'name': t.get('name')} for t in job.failed_songs],
+            'message': job.message, 'metrics': event.get('metrics'),
+        })
+        if job.state != DONE:
+            exit_code = EXIT_JOB_ERROR
+        elif job.failed_songs and exit_code == EXIT_OK:
+            exit_code = EXIT_TRACKS_FAILED
+    print(json.dumps({'status': 'ok' if exit_code == EXIT_OK else 'failed', 'jobs': results},
+                     ensure_ascii=False, indent=args.indent))
+    return exit_code
+
+
+def cmd_rebuild_lyrics(args) -> int:
+    from modules.manager import DownloadManager, LYRICS_JOB, DONE
+
+    if not Path(args.save_dir).is_dir():
+        print(f"目录不存在: {args.save_dir}", file=sys.stderr)
+        return EXIT_USAGE
+    manager = DownloadManager(max_concurrent_jobs=1)
+    sub, job = manager.events.subscribe(), None
+    try:
+        with _quiet(args):
+            # 不指定歌单名时重建保存根目录下的所有歌单
+            job = manager.enqueue(LYRICS_JOB, save_dir=args.save_dir, translated=args.translated,
+                                  romanized=args.romanized, playlists=_read_sources(args) or None)
+            event = _wait_jobs(args, manager, sub, [job]).get(job.id, {})
+    except KeyboardInterrupt:
+        if job:
+            manager.cancel(job.id)
+        print(json.dumps({'status': 'interrupted'}, ensure_ascii=False))
+        return EXIT_INTERRUPTED
+    finally:
+        manager.tagger.shutdown()
+
+    if job.state != DONE:
+        exit_code = EXIT_JOB_ERROR
+    else:
+        exit_code = EXIT_TRACKS_FAILED if event.get('failed_count') else EXIT_OK
+    result = {'status': 'ok' if exit_code == EXIT_OK else 'failed', 'job_id': job.id, 'state': job.state,
+              'message': job.message}
+    result.update({k: event.get(k) for k in ('written', 'unchanged', 'no_lyrics', 'missing_audio', 'failed_count')})
+    print(json.dumps(result, ensure_ascii=False, indent=args.indent))
+    return exit_code
+
+
+# --- 排序 / 去序 ---
+
+def _library_for(playlist_dir: Path, base_dir):
+    from modules.library import open_library
+    # 歌单目录结构为 <保存根目录>/<playlist|album>/<歌单名>
+    return open_library(base_dir or playlist_dir.parent.parent)
+
+
+def cmd_sort(args, remove=False) -> int:
+    sources = _read_sources(args)
+    if not sources:
+        print("没有指定歌单目录", file=sys.stderr)
+        return EXIT_USAGE
+
+    from modules.sorter import MusicSorter
+
+    results, exit_code = [], EXIT_OK
+    for source in sources:
+        playlist_dir = Path(source)
+        entry = {'playlist_dir': str(playlist_dir)}
+        try:
+            if not playlist_dir.is_dir():
+                raise FileNotFoundError(f"目录不存在: {playlist_dir}")
+            sorter = MusicSorter(_library_for(playlist_dir, args.base_dir))
+            with _quiet(args):
+                if remove:
+                    entry.update(sorter.remove_numbers(str(playlist_dir)))
+                else:
+                    json_file = next(playlist_dir.glob('*.json'), None)
+                    if not json_file:
+                        raise FileNotFoundError("缺少排序所需的JSON文件")
+                    tracks = json.loads(json_file.read_text(encoding='utf-8')).get('tracks', [])
+                    entry.update(sorter.sort_playlist(str(playlist_dir), tracks, args.start_number))
+            entry['status'] = 'ok'
+            if entry.get('errors') or entry.get('not_found'):
+                exit_code = max(exit_code, EXIT_TRACKS_FAILED)
+        except Exception as e:
+            entry.update({'status': 'error', 'message': str(e)})
+            exit_code = EXIT_JOB_ERROR
+        results.append(entry)
+    print(json.dumps({'status': 'ok' if exit_code == EXIT_OK else 'failed', 'playlists': results},
+                     ensure_ascii=False, indent=args.indent))
+    return exit_code
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='ncmtools', description='NCM Tools 命令行工具')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('sources', nargs='*', help='链接/ID 或歌单目录')
+    common.add_argument('-f', '--file', help='从文件读取条目，每行一个（- 表示标准输入）')
+    common.add_argument('-v', '--verbose', action='store_true', help='在标准错误输出详细日志')
+    common.add_argument('--indent', type=int, default=None, help='JSON 缩进')
+
+    download = argparse.ArgumentParser(add_help=False)
+    download.add_argument('--save-dir', required=True, help='保存根目录')
+    download.add_argument('--type', default='playlist', choices=('playlist', 'album', 'link'), help='链接类型')
+    download.add_argument('--quality', default='exhigh', choices=QUALITIES)
+    download.add_argument('--api', default='vkeys', choices=APIS, help='首选下载地址接口')
+    download.add_argument('--no-lyrics', action='store_true', help='不下载歌词')
+    download.add_argument('--translated', action='store_true', help='合并翻译歌词')
+    download.add_argument('--engine', default='thread', choices=('thread', 'async'))
+    download.add_argument('--jobs', type=int, default=2, help='同时运行的任务数')
+
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('download', parents=[common, download], help='下载歌单/专辑/单曲')
+    sync = sub.add_parser('sync', parents=[common, download], help='增量同步歌单（只下载新增歌曲）')
+    sync.add_argument('--archive-removed', action='store_true', help='归档已从歌单移除的歌曲')
+
+    sort_parent = argparse.ArgumentParser(add_help=False)
+    sort_parent.add_argument('--base-dir', help='保存根目录（曲库索引所在位置），默认为歌单目录的上两级')
+    sort = sub.add_parser('sort', parents=[common, sort_parent], help='按歌单顺序为文件编号')
+    sort.add_argument('--start-number', type=int, default=500)
+    sub.add_parser('remove-numbers', parents=[common, sort_parent], help='移除文件名中的编号')
+
+    lyrics = sub.add_parser('rebuild-lyrics', parents=[common], help='按新的选项重新生成已下载歌曲的歌词（sources 为歌单名）')
+    lyrics.add_argument('--save-dir', required=True, help='保存根目录')
+    lyrics.add_argument('--translated', action='store_true', help='合并翻译歌词')
+    lyrics.add_argument('--romanized', action='store_true', help='合并罗马音歌词')
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_USAGE
+
+    try:
+        if args.command == 'download':
+            return cmd_download(args)
+        if args.command == 'sync':
+            return cmd_download(args, sync=True)
+        if args.command == 'sort':
+            return cmd_sort(args)
+        if args.command == 'rebuild-lyrics':
+            return cmd_rebuild_lyrics(args)
+        return cmd_sort(args, remove=True)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+
+if __name__ == '__main__':
+    # 打包后的程序启动标签写入进程池需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import re
-from typing import List, Dict, Optional
+from operator import itemgetter
+from typing import List, Dict, Optional, Tuple
+
+_by_time = itemgetter(0)
 
 class LRCParser:
     """LRC歌词解析器（增强兼容版）"""
@@ -7,6 +10,8 @@ class LRCParser:
     # 修复后的正则：支持 [mm:ss.xx] 或 [mm:ss:xx] 格式
     # [(\d+):(\d+)[.:](\d+)] 分别匹配 分:秒[点或冒号]毫秒
     TIME_PATTERN = re.compile(r'\[(\d+):(\d+)[.:](\d+)\]')
+    # 整段文本一次匹配：每个含时间标签的行得到 (第一个标签前的内容, 分, 秒, 毫秒, 标签后的内容)
+    LINE_PATTERN = re.compile(r'^(.*?)\[(\d+):(\d+)[.:](\d+)\](.*)$', re.M)
     
     @staticmethod
     def parse_lrc_time(time_str: str) -> int:
@@ -44,67 +49,77 @@ class LRCParser:
         millis = milliseconds % 1000
         return f"[{minutes:02d}:{seconds:02d}.{millis:03d}]"
     
-    def parse_lrc_content(self, text: str) -> List[Dict]:
-        if not text or not text.strip():
+    def parse_lrc(self, text: str) -> List[Tuple[int, str]]:
+        """
+        解析歌词为按时间排序的 (毫秒, 内容) 列表，时间相同的行保持原顺序。
+        整段文本只做一次正则匹配；一行有多个时间标签时（如重复的副歌）再切分该行的剩余部分。
+        """
+        if not text:
             return []
-        
-        lines = text.strip().split('\n')
+        split = self.TIME_PATTERN.split
         lyrics = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
+        append = lyrics.append
+        for prefix, minutes, seconds, ms_part, rest in self.LINE_PATTERN.findall(text):
+            # 两位为百分秒（[00:22.25] -> 250ms），否则取前三位
+            millis = int(ms_part) * 10 if len(ms_part) == 2 else int(ms_part[:3])
+            time_ms = int(minutes) * 60000 + int(seconds) * 1000 + millis
+            if '[' not in rest:
+                # 即使只有时间标签没有内容，也记录（用于占位/空行）
+                append((time_ms, (prefix + rest).strip()))
                 continue
-                
-            # 重点修复：允许匹配 [00:00:00] 或 [00:00.00]
-            time_matches = self.TIME_PATTERN.findall(line)
-            if time_matches:
-                # 提取纯内容：移除所有形如 [xx:xx.xx] 或 [xx:xx:xx] 的标签
-                content = self.TIME_PATTERN.sub('', line).strip()
-                
-                for match in time_matches:
-                    # match 是一个元组 (分, 秒, 毫秒)
-                    time_str = f"{match[0]}:{match[1]}.{match[2]}"
-                    try:
-                        time_ms = self.parse_lrc_time(time_str)
-                        # 即使只有时间标签没有内容，也记录（用于占位/空行）
-                        lyrics.append({
-                            'time': time_ms,
-                            'content': content
-                        })
-                    except ValueError:
-                        continue
-        
-        lyrics.sort(key=lambda x: x['time'])
+            # split 的结果依次为 内容, 分, 秒, 毫秒, 内容, ...；提取纯内容时移除所有时间标签
+            parts = split(rest)
+            content = (prefix + ''.join(parts[::4])).strip()
+            append((time_ms, content))
+            for minutes, seconds, ms_part in zip(parts[1::4], parts[2::4], parts[3::4]):
+                millis = int(ms_part) * 10 if len(ms_part) == 2 else int(ms_part[:3])
+                append((int(minutes) * 60000 + int(seconds) * 1000 + millis, content))
+        # 歌词通常已按时间排列，此时排序只需一次线性扫描
+        lyrics.sort(key=_by_time)
         return lyrics
 
+    def parse_lrc_content(self, text: str) -> List[Dict]:
+        """解析歌词为 [{'time': 毫秒, 'content': 内容}]（兼容旧版本）"""
+        return [{'time': t, 'content': c} for t, c in self.parse_lrc(text)]
+
 # 歌词合并逻辑保持不变...
 class LyricsMerger:
     def __init__(self):
         self.parser = LRCParser()
     
+    @staticmethod
+    def _merge_sorted(original: List[Tuple[int, str]], translated: List[Tuple[int, str]]):
+        """
+        双指针合并两个按时间排序的歌词序列，逐个时间产出 (毫秒, 原文, 译文)。
+        同一序列中时间相同的多行只保留最后一行。
+        """
+        i = j = 0
+        n, m = len(original), len(translated)
+        while i < n or j < m:
+            t_orig = original[i][0] if i < n else None
+            t_trans = translated[j][0] if j < m else None
+            time_ms = t_orig if t_trans is None or (t_orig is not None and t_orig <= t_trans) else t_trans
+            original_content = translated_content = ''
+            while i < n and original[i][0] == time_ms:
+                original_content = original[i][1]
+                i += 1
+            while j < m and translated[j][0] == time_ms:
+                translated_content = translated[j][1]
+                j += 1
+            yield time_ms, original_content, translated_content
+
     def merge_lyrics(self, original_text: str, translated_text: str) -> List[str]:
-        original_lyrics = self.parser.parse_lrc_content(original_text)
-        translated_lyrics = self.parser.parse_lrc_content(translated_text)
-        
-        original_dict = {lyric['time']: lyric['content'] for lyric in original_lyrics}
-        translated_dict = {lyric['time']: lyric['content'] for lyric in translated_lyrics}
-        
-        all_times = sorted(set(original_dict.keys()) | set(translated_dict.keys()))
-        
+        original_lyrics = self.parser.parse_lrc(original_text)
+        translated_lyrics = self.parser.parse_lrc(translated_text)
         merged_lines = []
-        for time_ms in all_times:
-            original_content = original_dict.get(time_ms, '')
-            translated_content = translated_dict.get(time_ms, '')
-            
-            # 格式化输出
-            time_tag = self.parser.format_lrc_time(time_ms)
+        append = merged_lines.append
+        for time_ms, original_content, translated_content in self._merge_sorted(original_lyrics, translated_lyrics):
+            # 格式化输出（与 format_lrc_time 相同，内联以减少函数调用）
+            time_tag = f"[{time_ms // 60000:02d}:{time_ms % 60000 // 1000:02d}.{time_ms % 1000:03d}]"
             if original_content and translated_content:
-                merged_line = f"{time_tag}{original_content} / {translated_content}"
+                append(f"{time_tag}{original_content} / {translated_content}")
             else:
-                merged_line = f"{time_tag}{original_content or translated_content}"
-            merged_lines.append(merged_line)
-        
+                append(f"{time_tag}{original_content or translated_content}")
         return merged_lines
 
 # 创建全局实例用于向后兼容
@@ -124,6 +139,18 @@ def merge_lyrics(original_text: str, translated_text: str) -> List[str]:
     return _lyrics_merger.merge_lyrics(original_text, translated_text)
 
 
+def merge_lyrics_data(lyrics_data: dict, translated: bool = False, romanized: bool = False) -> List[str]:
+    """
+    按选项合并接口返回的歌词 {'lrc', 'tlyric', 'romalrc'}：
+    romanized 时在原文后附加罗马音，translated 时再附加译文，格式为 "原文 / 罗马音 / 译文"。
+    """
+    extras = [lyrics_data.get(key) or '' for key, enabled in (('romalrc', romanized), ('tlyric', translated)) if enabled]
+    lines = merge_lyrics(lyrics_data.get('lrc') or '', extras[0] if extras else '')
+    for extra in extras[1:]:
+        lines = merge_lyrics('\n'.join(lines), extra)
+    return lines
+
+
 def parse_lrc_time(time_str: str) -> int:
     """解析LRC时间（兼容旧版本）"""
     return LRCParser.parse_lrc_time(time_str)
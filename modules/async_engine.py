@@ -0,0 +1,362 @@
+# modules/async_engine.py
+import asyncio
+import functools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖，未安装时只能使用线程引擎
+    aiohttp = None
+
+from . import client, metrics, ratelimit
+from .downloader import (
+    PART_SUFFIX, PART_INFO_SUFFIX, PROVIDER_SPECS, EMPTY_LYRICS, provider_resolver,
+    _lyrics_url, _format_lyrics, _prepare_resume, _resume_mode,
+)
+
+# 同时处理的歌曲数；对每个主机实际在途的请求数仍由 ratelimit 自适应控制
+ASYNC_CONCURRENCY = 200
+# 单个请求的超时时间（秒）
+ASYNC_TIMEOUT = 30
+# 写入文件的块大小
+CHUNK_SIZE = 65536
+# 任务暂停时检查是否继续的间隔（秒）
+PAUSE_POLL_INTERVAL = 0.2
+# 等待全局传输额度的线程数（不少于额度总数即可，更多的等待者在线程池队列中排队）
+SLOT_WAIT_THREADS = 32
+# 执行封面/歌词缓存查询的线程数：未命中时请求交回事件循环，线程在等待期间阻塞
+BRIDGE_THREADS = 32
+# 本地阻塞操作（预检、文件读写、标签以外的收尾）的线程数
+IO_THREADS = 16
+
+# 结束标记：事件循环处理完全部歌曲后投递到结果队列
+_DONE = object()
+
+
+def is_available() -> bool:
+    return aiohttp is not None
+
+
+class _HostSlot:
+    """经过主机限速器发出请求的异步上下文：等待名额、记录耗时与结果，退出时释放名额"""
+    def __init__(self, url):
+        self.limiter = ratelimit.for_url(url)
+        self.start = None
+
+    async def __aenter__(self):
+        await self.limiter.acquire_async()
+        self.start = time.monotonic()
+        return self
+
+    def record(self, status):
+        self.limiter.record(not ratelimit.is_throttled(status), time.monotonic() - self.start)
+        self.start = None
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            # 未收到响应（连接失败、超时）也计为一次失败
+            self.limiter.record(False, time.monotonic() - self.start)
+        self.limiter.release()
+
+
+class AsyncEngine:
+    """
+    基于 asyncio + aiohttp 的下载引擎，可替代多线程流水线（StagedPipeline）。
+    所有网络请求（下载地址、音频、封面、歌词）在一个事件循环中并发进行，
+    本地检查、文件写入与标签嵌入等阻塞操作交给线程池执行。
+
+    阻塞操作按用途使用各自的线程池，默认线程池只留给 aiohttp 的 DNS 解析：
+    封面/歌词的缓存查询会在线程中等待事件循环上的请求完成，
+    若与 DNS 解析共用线程池，线程占满后请求无法完成，引擎会卡死。
+
+    与 StagedPipeline 相同，run() 按完成顺序产出 (item, ctx, error)，
+    ctx 的结构与 MusicDownloader 各阶段一致。
+    """
+    def __init__(self, downloader, api=None, dl_lyrics=True, dl_trans=False, prepare=None, on_stage=None,
+                 stop_event=None, resume_event=None, concurrency=ASYNC_CONCURRENCY, acquire_slot=None, release_slot=None):
+        if aiohttp is None:
+            raise RuntimeError("asyncio 引擎需要安装 aiohttp")
+        self.downloader = downloader
+        self.api = api or downloader.api_name
+        if self.api not in PROVIDER_SPECS:
+            self.api = 'bugpk'
+        self.dl_lyrics = dl_lyrics
+        self.dl_trans = dl_trans
+        # prepare(item) -> ctx：本地预检（或从任务日志恢复上下文），默认使用 downloader.precheck_song
+        self.prepare = prepare or (lambda t: downloader.precheck_song(str(t['id']), t if 'name' in t else None))
+        # on_stage(ctx, index)：前三个阶段（解析/传输/标签）完成后的回调，用于写任务日志
+        self.on_stage = on_stage
+        # acquire_slot() / release_slot()：音频传输前后占用/释放一个全局传输额度（与线程流水线共用）。
+        # acquire_slot 会阻塞，在专用线程中等待
+        self.acquire_slot = acquire_slot
+        self.release_slot = release_slot
+        self._slot_executor = None
+        self._bridge_executor = None
+        self._io_executor = None
+        self.stop_event = stop_event or threading.Event()
+        self.resume_event = resume_event
+        self.concurrency = max(1, int(concurrency))
+
+    def run(self, items):
+        """在后台线程中运行事件循环，并按完成顺序逐个产出 (item, ctx, error)"""
+        items = list(items)
+        results = queue.Queue()
+        threading.Thread(target=lambda: asyncio.run(self._main(items, results)), daemon=True).start()
+        while True:
+            try:
+                outcome = results.get(timeout=0.5)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return
+                continue
+            if outcome is _DONE:
+                return
+            yield outcome
+
+    async def _main(self, items, results):
+        pending = asyncio.Queue()
+        for item in items:
+            pending.put_nowait(item)
+        depth = metrics.QUEUE_DEPTH.track(pending.qsize, stage='async')
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=ASYNC_TIMEOUT, sock_read=ASYNC_TIMEOUT)
+        # 连接数不在这里限制，交给按主机的限速器
+        connector = aiohttp.TCPConnector(limit=0)
+        if self.acquire_slot:
+            self._slot_executor = ThreadPoolExecutor(max_workers=SLOT_WAIT_THREADS, thread_name_prefix='async-slot')
+        self._bridge_executor = ThreadPoolExecutor(max_workers=BRIDGE_THREADS, thread_name_prefix='async-bridge')
+        self._io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix='async-io')
+        try:
+            async with aiohttp.ClientSession(headers=client.DEFAULT_HEADERS, timeout=timeout, connector=connector) as session:
+                workers = [asyncio.create_task(self._worker(session, pending, results))
+                           for _ in range(min(self.concurrency, len(items)))]
+                await asyncio.gather(*workers)
+        finally:
+            metrics.QUEUE_DEPTH.untrack(depth)
+            for executor in (self._slot_executor, self._bridge_executor, self._io_executor):
+                if executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+            results.put(_DONE)
+
+    async def _worker(self, session, pending, results):
+        while not self.stop_event.is_set():
+            try:
+                item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                ctx = await self._process(session, item)
+            except Exception as e:
+                results.put((item, None, e))
+                continue
+            if ctx is not None:
+                results.put((item, ctx, None))
+
+    async def _gate(self):
+        """任务暂停时等待；任务已停止时返回 False"""
+        while self.resume_event is not None and not self.resume_event.is_set():
+            if self.stop_event.is_set():
+                return False
+            await asyncio.sleep(PAUSE_POLL_INTERVAL)
+        return not self.stop_event.is_set()
+
+    async def _acquire_slot(self):
+        """占用一个全局传输额度；等待期间任务停止时释放并返回 False"""
+        if not self.acquire_slot:
+            return True
+        await asyncio.get_running_loop().run_in_executor(self._slot_executor, self.acquire_slot)
+        if self.stop_event.is_set():
+            self._release_slot()
+            return False
+        return True
+
+    def _release_slot(self):
+        if self.release_slot:
+            self.release_slot()
+
+    async def _io(self, func, *args, **kwargs):
+        """在本地操作线程池中执行阻塞调用"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._io_executor, functools.partial(func, *args, **kwargs))
+
+    async def _bridged(self, func, *args):
+        """在专用线程池中执行会等待事件循环的阻塞调用（封面/歌词缓存查询）"""
+        return await asyncio.get_running_loop().run_in_executor(self._bridge_executor, func, *args)
+
+    async def _stage_done(self, ctx, index):
+        if self.on_stage and not ctx['result']:
+            await self._io(self.on_stage, ctx, index)
+
+    async def _process(self, session, item):
+        """依次执行 解析 -> 传输 -> 标签 -> 歌词，任务停止时返回 None"""
+        dl = self.downloader
+        if not await self._gate():
+            return None
+        ctx = await self._io(self.prepare, item)
+        if ctx['result']:
+            return ctx
+        done = ctx.get('resume_index', -1)
+
+        if done < 0:
+            with dl.metrics.time('resolve_url'):
+                song_url = await self._resolve_url(session, ctx['song_id'])
+            ctx = await self._io(dl.apply_song_url, ctx, song_url)
+            await self._stage_done(ctx, 0)
+            if ctx['result']:
+                return ctx
+
+        if done < 1:
+            if not await self._gate() or not await self._acquire_slot():
+                return None
+            try:
+                with dl.metrics.time('transfer'):
+                    ok = await self._download_file(session, ctx['url'], ctx['audio_path'])
+            finally:
+                self._release_slot()
+            if not ok:
+                return dl._finish(ctx, "failed")
+            await self._stage_done(ctx, 1)
+
+        if done < 2:
+            if not await self._gate():
+                return None
+            await self._tag(session, ctx)
+            await self._stage_done(ctx, 2)
+
+        if not await self._gate():
+            return None
+        lyrics_data = None
+        if self.dl_lyrics:
+            with dl.metrics.time('lyrics'):
+                lyrics_data = await self._lyrics(session, ctx['song_id'])
+        return await self._io(dl.finish_download, ctx, lyrics_data, self.dl_trans)
+
+    # --- 网络请求 ---
+
+    async def _get_json(self, session, url, **kwargs):
+        async with _HostSlot(url) as slot:
+            async with session.get(url, **kwargs) as r:
+                slot.record(r.status)
+                # 部分接口返回的 Content-Type 不是 application/json
+                return await r.json(content_type=None)
+
+    async def _resolve_url(self, session, song_id):
+        """按健康评分依次尝试各下载地址接口，统计结果计入共享的 provider_resolver"""
+        level = self.downloader.quality
+        order = provider_resolver.ranked(self.api) if self.downloader.failover else [self.api]
+        for name in order:
+            if self.downloader.failover and not provider_resolver.claim(name):
+                continue
+            build_url, format_data, label = PROVIDER_SPECS[name]
+            start = time.monotonic()
+            try:
+                result = format_data(await self._get_json(session, build_url(song_id, level)), level)
+            except Exception as e:
+                print(f"{label} API请求失败: {e}")
+                result = None
+            ok = bool(result and result.get('url'))
+            provider_resolver.record(name, ok, time.monotonic() - start)
+            if ok:
+                result['provider'] = name
+                return result
+        return None
+
+    async def _lyrics(self, session, song_id):
+        """获取歌词；先查下载器的歌词缓存，未命中时请求交回事件循环执行"""
+        if not self.downloader.lyrics_cache:
+            return await self._fetch_lyrics(session, song_id)
+        loop = asyncio.get_running_loop()
+
+        def fetch(sid):
+            return asyncio.run_coroutine_threadsafe(self._fetch_lyrics(session, sid), loop).result()
+
+        return await self._bridged(self.downloader.fetch_lyrics, song_id, fetch)
+
+    async def _fetch_lyrics(self, session, song_id):
+        try:
+            return _format_lyrics(await self._get_json(session, _lyrics_url(song_id)))
+        except Exception as e:
+            print(f"获取歌词失败: {e}")
+            return dict(EMPTY_LYRICS)
+
+    async def _fetch_bytes(self, session, url, max_retries=3):
+        """下载小文件（如封面）到内存，失败返回 None"""
+        if not url or not str(url).startswith('http'):
+            return None
+        for attempt in range(max_retries):
+            try:
+                async with _HostSlot(url) as slot:
+                    async with session.get(url, ssl=False) as r:
+                        slot.record(r.status)
+                        r.raise_for_status()
+                        return await r.read()
+            except Exception as e:
+                if attempt == max_retries - 1: return None
+                await asyncio.sleep(ratelimit.backoff(attempt, _retry_after(e)))
+        return None
+
+    async def _tag(self, session, ctx):
+        """下载封面并嵌入元数据；封面仍经由下载器的 cover_cache 去重，下载请求交回事件循环执行"""
+        loop = asyncio.get_running_loop()
+
+        def fetch(url):
+            return asyncio.run_coroutine_threadsafe(self._fetch_bytes(session, url), loop).result()
+
+        await self._bridged(self.downloader.tag_song, ctx, fetch)
+
+    async def _download_file(self, session, url, filepath, max_retries=3):
+        """单连接下载到 .part 临时文件，完整后原子替换；中断后通过 Range 请求续传"""
+        if not url or not str(url).startswith('http'):
+            return False
+        filepath = Path(filepath)
+        part_path = filepath.with_name(filepath.name + PART_SUFFIX)
+        info_path = filepath.with_name(filepath.name + PART_INFO_SUFFIX)
+        for attempt in range(max_retries):
+            try:
+                await self._fetch_to_part(session, url, part_path, info_path)
+                await self._io(os.replace, part_path, filepath)
+                await self._io(info_path.unlink, missing_ok=True)
+                return True
+            except Exception as e:
+                if attempt == max_retries - 1 or self.stop_event.is_set(): return False
+                await asyncio.sleep(ratelimit.backoff(attempt, _retry_after(e)))
+        return False
+
+    async def _fetch_to_part(self, session, url, part_path, info_path):
+        offset, headers, info = await self._io(_prepare_resume, part_path, info_path)
+
+        async with _HostSlot(url) as slot:
+            async with session.get(url, ssl=False, headers=headers) as r:
+                slot.record(r.status)
+                if r.status == 416:
+                    part_path.unlink(missing_ok=True)
+                    info_path.unlink(missing_ok=True)
+                    raise IOError("Range 请求无效，已重置临时文件")
+                r.raise_for_status()
+                mode, offset = await self._io(_resume_mode, r, r.status, offset, info, part_path, info_path)
+
+                expected = r.headers.get('Content-Length')
+                written = 0
+                f = await self._io(open, part_path, mode)
+                try:
+                    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                        if self.stop_event.is_set():
+                            raise IOError("任务已停止")
+                        await self._io(f.write, chunk)
+                        written += len(chunk)
+                finally:
+                    await self._io(f.close)
+                    self.downloader.metrics.add_bytes(written)
+
+        if expected is not None and written < int(expected):
+            raise IOError(f"下载不完整: {offset + written}/{offset + int(expected)} 字节")
+
+
+def _retry_after(exc):
+    """从 aiohttp 的 ClientResponseError 中取出 Retry-After"""
+    headers = getattr(exc, 'headers', None)
+    return headers.get('Retry-After') if headers else None
@@ -0,0 +1,252 @@
+# modules/cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import metrics
+
+# 内存缓存的默认容量 (64 MB)
+COVER_CACHE_BYTES = 64 * 1024 * 1024
+# 封面磁盘缓存目录名，存放在保存根目录下
+COVER_DIR_NAME = '.ncmtools-covers'
+# 歌词缓存数据库文件名，存放在保存根目录下
+LYRICS_DB_NAME = '.ncmtools-lyrics.db'
+# 歌词缓存的有效期（秒），过期后重新请求，请求失败时仍使用旧歌词
+LYRICS_TTL = 30 * 24 * 3600
+# 接口确认没有歌词（纯音乐、未收录）的缓存有效期，较短以便之后补上的歌词能被重新获取
+NO_LYRICS_TTL = 7 * 24 * 3600
+# 批量预取歌词的并发数（请求仍受 ratelimit 的按主机限速约束）
+LYRICS_PREFETCH_WORKERS = 8
+# 歌词的三个字段
+LYRICS_FIELDS = ('lrc', 'tlyric', 'romalrc')
+
+_LYRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lyrics (
+    song_id TEXT PRIMARY KEY,
+    lrc TEXT,
+    tlyric TEXT,
+    romalrc TEXT,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+class CoverCache:
+    """
+    按 picUrl 缓存封面图片字节的 LRU 缓存。
+    同一专辑/歌单的歌曲共用封面，只需下载一次；并发请求同一 URL 时只有一个线程实际下载。
+
+    disk_dir 不为空时额外启用磁盘缓存：图片按内容的 sha256 存放在 objects/ 下，
+    URL 到内容哈希的映射存放在 urls/ 下，不同 URL 指向同一张图片时只存一份。
+    """
+    def __init__(self, max_bytes=COVER_CACHE_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, url, fetch):
+        """返回 url 对应的图片字节，缓存未命中时调用 fetch(url) 获取；获取失败返回 None"""
+        data = self._get_memory(url)
+        if data is not None:
+            return data
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(url, threading.Lock())
+        with key_lock:
+            # 等锁期间可能已被其他线程下载完成
+            data = self._get_memory(url)
+            if data is None:
+                data = self._read_disk(url)
+                if data is None:
+                    data = fetch(url)
+                    if data:
+                        self._write_disk(url, data)
+                if data:
+                    self._put_memory(url, data)
+        with self._lock:
+            self._key_locks.pop(url, None)
+        return data or None
+
+    # --- 内存 LRU ---
+
+    def _get_memory(self, url):
+        with self._lock:
+            data = self._items.get(url)
+            if data is not None:
+                self._items.move_to_end(url)
+            return data
+
+    def _put_memory(self, url, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if url in self._items:
+                return
+            self._items[url] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    # --- 磁盘缓存 ---
+
+    def _url_path(self, url):
+        return self.disk_dir / 'urls' / hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _read_disk(self, url):
+        if not self.disk_dir:
+            return None
+        try:
+            digest = self._url_path(url).read_text(encoding='utf-8').strip()
+            return (self.disk_dir / 'objects' / digest).read_bytes()
+        except OSError:
+            return None
+
+    def _write_disk(self, url, data):
+        if not self.disk_dir:
+            return
+        try:
+            digest = hashlib.sha256(data).hexdigest()
+            obj_path = self.disk_dir / 'objects' / digest
+            url_path = self._url_path(url)
+            obj_path.parent.mkdir(parents=True, exist_ok=True)
+            url_path.parent.mkdir(parents=True, exist_ok=True)
+            if not obj_path.exists():
+                tmp = obj_path.with_name(f"{digest}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, obj_path)
+            url_path.write_text(digest, encoding='utf-8')
+        except OSError as e:
+            print(f"写入封面缓存失败: {e}")
+
+
+class LyricsCache:
+    """
+    按歌曲ID缓存接口返回的原始歌词（lrc / tlyric / romalrc），存放在 SQLite 中。
+    查询时先读本地，未命中或已过期才请求接口。接口确认没有歌词（各字段为空字符串）时
+    同样缓存，有效期为 no_lyrics_ttl；请求失败（各字段为 None）时不写入缓存，
+    已过期的旧歌词仍然返回。同一首歌并发请求时只有一个线程实际请求。
+    """
+    def __init__(self, db_path, ttl=LYRICS_TTL, no_lyrics_ttl=NO_LYRICS_TTL):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.no_lyrics_ttl = no_lyrics_ttl
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_LYRICS_SCHEMA)
+
+    def lookup(self, song_id):
+        """返回 (歌词字典, 是否未过期)，没有缓存时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT lrc, tlyric, romalrc, fetched_at FROM lyrics WHERE song_id = ?', (str(song_id),)).fetchone()
+        if row is None:
+            return None
+        data = dict(zip(LYRICS_FIELDS, row[:3]))
+        ttl = self.ttl if any(data.values()) else self.no_lyrics_ttl
+        return data, time.time() - row[3] < ttl
+
+    def put(self, song_id, lyrics_data) -> bool:
+        """保存接口返回的歌词（包括没有歌词的结果），三个字段都为 None（请求失败）时不保存"""
+        if not lyrics_data or all(lyrics_data.get(f) is None for f in LYRICS_FIELDS):
+            return False
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO lyrics (song_id, lrc, tlyric, romalrc, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                (str(song_id), *(lyrics_data.get(f) for f in LYRICS_FIELDS), time.time()),
+            )
+        return True
+
+    def get(self, song_id, fetch) -> dict:
+        """返回歌曲的歌词，缓存未命中或过期时调用 fetch(song_id) 获取"""
+        cached = self.lookup(song_id)
+        if cached and cached[1]:
+            metrics.LYRICS_CACHE.inc(result='hit')
+            return cached[0]
+
+        key = str(song_id)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # 等锁期间可能已被其他线程（如预取）写入
+            cached = self.lookup(song_id)
+            if cached and cached[1]:
+                metrics.LYRICS_CACHE.inc(result='hit')
+                data = cached[0]
+            else:
+                data = fetch(song_id)
+                if not self.put(song_id, data) and cached:
+                    metrics.LYRICS_CACHE.inc(result='stale')
+                    data = cached[0]
+                else:
+                    metrics.LYRICS_CACHE.inc(result='miss')
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return data
+
+    def missing(self, song_ids) -> list:
+        """没有缓存或缓存已过期的歌曲ID"""
+        ids = [str(i) for i in song_ids]
+        fresh = set()
+        now = time.time()
+        with self._lock:
+            # 分批查询，避免超出 SQLite 的参数数量限制
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT song_id FROM lyrics WHERE fetched_at > CASE "
+                    "WHEN COALESCE(lrc, '') = '' AND COALESCE(tlyric, '') = '' AND COALESCE(romalrc, '') = '' "
+                    f"THEN ? ELSE ? END AND song_id IN ({','.join('?' * len(batch))})",
+                    (now - self.no_lyrics_ttl, now - self.ttl, *batch),
+                ).fetchall()
+                fresh.update(r[0] for r in rows)
+        return [i for i in dict.fromkeys(ids) if i not in fresh]
+
+    def prefetch(self, song_ids, fetch, workers=LYRICS_PREFETCH_WORKERS, should_stop=None) -> int:
+        """并发获取一批歌曲中尚未缓存的歌词，should_stop() 为真时停止，返回获取成功的数量"""
+        def task(song_id):
+            if should_stop and should_stop():
+                return False
+            self.get(song_id, fetch)
+            cached = self.lookup(song_id)
+            return bool(cached and cached[1])
+
+        pending = self.missing(song_ids)
+        if not pending:
+            return 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lyrics-prefetch') as pool:
+            return sum(1 for fetched in pool.map(task, pending) if fetched)
+
+
+_cover_caches = {}
+_lyrics_caches = {}
+_caches_lock = threading.Lock()
+
+
+def open_cover_cache(root) -> CoverCache:
+    """获取保存根目录对应的封面缓存（内存 + 根目录下的磁盘缓存，同一根目录在进程内共用一个实例）"""
+    disk_dir = Path(root).resolve() / COVER_DIR_NAME
+    with _caches_lock:
+        if disk_dir not in _cover_caches:
+            _cover_caches[disk_dir] = CoverCache(disk_dir=disk_dir)
+        return _cover_caches[disk_dir]
+
+
+def open_lyrics_cache(root) -> LyricsCache:
+    """获取保存根目录对应的歌词缓存（同一根目录在进程内共用一个实例）"""
+    db_path = Path(root).resolve() / LYRICS_DB_NAME
+    with _caches_lock:
+        if db_path not in _lyrics_caches:
+            _lyrics_caches[db_path] = LyricsCache(db_path)
+        return _lyrics_caches[db_path]
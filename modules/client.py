@@ -0,0 +1,95 @@
+# modules/client.py
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import ratelimit
+
+# --- 连接池默认配置 ---
+# pool_connections: 缓存的主机连接池数量；pool_maxsize: 每个主机连接池保留的最大连接数
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 8
+DEFAULT_TIMEOUT = 30
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+_session = None
+_lock = threading.Lock()
+_pool_config = {'pool_connections': POOL_CONNECTIONS, 'pool_maxsize': POOL_MAXSIZE}
+
+
+def _build_session(pool_connections: int, pool_maxsize: int) -> requests.Session:
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    # pool_block=False: 连接池满时临时新建连接而不是阻塞等待
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def configure(pool_connections: int | None = None, pool_maxsize: int | None = None):
+    """
+    调整全局连接池大小。已有的会话会被关闭，下次请求时按新配置重建。
+    """
+    global _session
+    with _lock:
+        if pool_connections is not None:
+            _pool_config['pool_connections'] = max(1, int(pool_connections))
+        if pool_maxsize is not None:
+            _pool_config['pool_maxsize'] = max(1, int(pool_maxsize))
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session() -> requests.Session:
+    """获取进程内共享的会话（按主机复用 keep-alive 连接）"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session(**_pool_config)
+    return _session
+
+
+def _send(url, kwargs):
+    """经过所属主机的限速器发送请求，并把结果反馈给自适应并发控制"""
+    limiter = ratelimit.for_url(url)
+    limiter.acquire()
+    start = time.monotonic()
+    try:
+        response = get_session().get(url, **kwargs)
+    except Exception:
+        limiter.record(False, time.monotonic() - start)
+        limiter.release()
+        raise
+    limiter.record(not ratelimit.is_throttled(response.status_code), time.monotonic() - start)
+    return response, limiter
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """通过共享会话发送 GET 请求"""
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    response, limiter = _send(url, kwargs)
+    limiter.release()
+    return response
+
+
+@contextmanager
+def stream(url: str, **kwargs):
+    """
+    以流式方式发送 GET 请求，在读取响应体期间一直占用主机的并发名额。
+    用法: with client.stream(url) as r: ...
+    """
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    kwargs['stream'] = True
+    response, limiter = _send(url, kwargs)
+    try:
+        with response:
+            yield response
+    finally:
+        limiter.release()
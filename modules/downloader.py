@@ -1,29 +1,47 @@
 # modules/downloader.py
-import requests
+import os
+import json
 import time
+import threading
 from pathlib import Path
 from urllib.parse import urlparse
 from concurrent.futures import ThreadPoolExecutor
 import urllib3
 
-# 音频元数据处理
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC, Picture
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC
-
 # 本地模块
-from .utils import sanitize_filename, normalize_ncm_url, normalize_artists
-from .Lyrics import merge_lyrics
+from . import client, ratelimit
+from .resolver import ProviderResolver
+from .cache import CoverCache, LYRICS_FIELDS
+from .library import link_file
+from .tagger import embed_metadata
+from .metrics import JobMetrics
+from .utils import sanitize_filename, normalize_ncm_url
+from .Lyrics import merge_lyrics_data
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# song/detail 接口单次请求的最大ID数量
+SONG_DETAIL_BATCH_SIZE = 100
+# 未下载完成的临时文件后缀
+PART_SUFFIX = '.part'
+# 分段下载进度记录文件后缀（与 .part 文件成对出现）
+# （内容为 JSON，但不使用 .json 后缀，避免被当作歌单 JSON 文件读取）
+SEGMENT_STATE_SUFFIX = '.seg'
+# 单连接续传的校验信息文件后缀（文件总大小与 ETag/Last-Modified，与 .part 文件成对出现）
+PART_INFO_SUFFIX = '.partinfo'
+# 无损音质默认启用分段下载
+LOSSLESS_QUALITIES = ('lossless', 'hires', 'jymaster')
+SEGMENT_COUNT = 4
+# 小于该大小的文件不分段，单连接下载即可 (8 MB)
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+
 # ==================== API 定义区域 (保留原风格) ====================
 
 def api_xpercent_playlist(playlist_id: str):
     """获取歌单信息"""
     api_url = f"https://ncmapi.xpercent.dpdns.org/playlist?id={playlist_id}"
     try:
-        response = requests.get(api_url, timeout=30)
+        response = client.get(api_url)
         source_data = response.json()
         formatted_data = {
             'id': source_data.get('id'),
@@ -52,7 +70,7 @@ def api_xpercent_album(album_id: str):
     """获取专辑信息"""
     api_url = f"https://ncmapi.xpercent.dpdns.org/album?id={album_id}"
     try:
-        response = requests.get(api_url, timeout=30)
+        response = client.get(api_url)
         source_data = response.json()
         formatted_data = {
             'id': album_id,
@@ -76,101 +94,128 @@ def api_xpercent_album(album_id: str):
         print(f"获取专辑失败: {e}")
         return {}
 
+def _lyrics_url(song_num: str):
+    return f"https://music.163.com/api/song/lyric?os=pc&id={song_num}&rv=-1&lv=-1&tv=-1"
+
+def _format_lyrics(data: dict):
+    """整理歌词接口的返回；没有歌词（nolyric / uncollected 或缺少字段）时对应字段为空字符串"""
+    if not isinstance(data, dict) or data.get('code', 200) != 200:
+        raise ValueError(f"歌词接口返回异常: {data}")
+    return {field: (data.get(field) or {}).get('lyric') or '' for field in LYRICS_FIELDS}
+
+# 请求失败时的歌词（与接口确认没有歌词的空字符串区分，不写入歌词缓存）
+EMPTY_LYRICS = {"lrc": None, "tlyric": None, "romalrc": None}
+
 def api_lyrics(song_num: str):
-    api_url = f"https://music.163.com/api/song/lyric?os=pc&id={song_num}&rv=-1&lv=-1&tv=-1"
     try:
-        response = requests.get(api_url, timeout=30)
-        data = response.json()
-        return {
-            "lrc": data.get("lrc")['lyric'],
-            "tlyric": data.get("tlyric")['lyric'],
-            "romalrc": data.get("romalrc")['lyric']  
-        }
+        response = client.get(_lyrics_url(song_num))
+        return _format_lyrics(response.json())
     except Exception as e:
         print(f"获取歌词失败: {e}")
-        return {"lrc": None, "tlyric": None, "romalrc": None}
+        return dict(EMPTY_LYRICS)
 
-def api_song_detail(song_num: str):
-    api_url = f"https://music.163.com/api/song/detail?ids=[{song_num}]"
+def _format_song_detail(song_info: dict):
+    """将 song/detail 接口返回的单曲数据整理为歌单 tracks 的结构"""
+    album = song_info.get("album") or {}
+    return {
+        "id": str(song_info.get("id")),
+        "name": song_info.get("name"),
+        "ar" : "/".join([artist.get('name', '') for artist in song_info.get('artists', [])]),
+        "album": album.get("name"),
+        "picUrl": album.get("picUrl"),
+        "duration": song_info.get("duration")
+    }
+
+def api_song_details(song_nums: list):
+    """批量获取歌曲详情，返回 {歌曲ID: 详情}，获取失败的ID不会出现在结果中"""
+    ids = ",".join(str(n) for n in song_nums)
+    api_url = f"https://music.163.com/api/song/detail?ids=[{ids}]"
     try:
-        response = requests.get(api_url, timeout=30)
+        response = client.get(api_url)
         data = response.json()
-        if data.get("songs"):
-            song_info = data["songs"][0]
-            return {
-                "id": str(song_info.get("id")),
-                "name": song_info.get("name"),
-                "ar" : "/".join([artist.get('name', '') for artist in song_info['artists']]),
-                "album": song_info.get("album").get("name"),
-                "picUrl": song_info.get("album").get("picUrl") if song_info.get("album") else None,
-                "duration": song_info.get("duration")
-            }
-        return None
+        return {str(s.get("id")): _format_song_detail(s) for s in data.get("songs") or []}
     except Exception as e:
-        print(f"获取歌曲详情失败: {e}")
-        return None
+        print(f"批量获取歌曲详情失败: {e}")
+        return {}
 
-def api_vkeys_music(song_num: str, level: str = 'exhigh'):
+def api_song_detail(song_num: str):
+    return api_song_details([song_num]).get(str(song_num))
+
+# 下载地址接口：每个接口拆分为 "构造请求地址" 和 "整理返回数据" 两部分，
+# 线程引擎与 asyncio 引擎共用同一套解析逻辑
+
+def _vkeys_url(song_num: str, level: str):
     level_map = {"standard": 2, "exhigh": 4, "lossless": 5, "hires": 6, "jymaster": 9}
     quality = level_map.get(level, 4)
-    base_url = f"https://api.vkeys.cn/v2/music/netease?id={song_num}&quality={quality}"
+    return f"https://api.vkeys.cn/v2/music/netease?id={song_num}&quality={quality}"
+
+def _vkeys_format(data: dict, level: str):
+    data = data["data"]
+    return {
+        "level": data.get('quality'),
+        "size": str(data.get('size')) if data.get('size') else None,
+        "url": data.get('url')
+    }
+
+def _bugpk_url(song_num: str, level: str):
+    return f"https://api.bugpk.com/api/163_music/song?ids={song_num}&level={level}&type=json"
+
+def _bugpk_format(data: dict, level: str):
+    return {
+        "level": data.get("level"),
+        "size": str(data.get("size")) if data.get("size") else None,
+        "url": data.get("url")
+    }
+
+def _ss22y_url(song_num: str, level: str):
+    return f"https://music.meorion.moe/api/getSongUrl?id={song_num}&level={level}"
+
+def _ss22y_format(data: dict, level: str):
+    return {
+        "level": level,
+        "size": str(data.get('size')),
+        "url": data.get('url')
+    }
+
+def _iwenwiki_url(song_num: str, level: str):
+    return f"http://iwenwiki.com:3000/song/url/v1?id={song_num}&level={level}"
+
+def _iwenwiki_format(data: dict, level: str):
+    data = data["data"][0]
+    return {
+        "level": data.get("quality"),
+        "size": str(data.get("size")) if data.get("size") else None,
+        "url": data.get("url")
+    }
+
+# 接口名称 -> (构造地址, 整理数据, 日志名称)
+PROVIDER_SPECS = {
+    'vkeys': (_vkeys_url, _vkeys_format, 'Vkeys'),
+    'bugpk': (_bugpk_url, _bugpk_format, 'BugPK'),
+    'iwenwiki': (_iwenwiki_url, _iwenwiki_format, 'iwenwiki'),
+    'ss22y': (_ss22y_url, _ss22y_format, 'ss22y'),
+}
+
+def _call_provider(name: str, song_num: str, level: str):
+    build_url, format_data, label = PROVIDER_SPECS[name]
     try:
-        response = requests.get(base_url, timeout=30)
-        data = response.json()["data"]
-        formatted_data = {
-            "level": data.get('quality'),
-            "size": str(data.get('size')) if data.get('size') else None,
-            "url": data.get('url')
-        }
-        return formatted_data
+        response = client.get(build_url(song_num, level))
+        return format_data(response.json(), level)
     except Exception as e:
-        print(f"Vkeys API请求失败: {e}")
+        print(f"{label} API请求失败: {e}")
         return None
 
+def api_vkeys_music(song_num: str, level: str = 'exhigh'):
+    return _call_provider('vkeys', song_num, level)
+
 def api_bugpk_music(song_num: str, level: str = 'exhigh'):
-    api_url = f"https://api.bugpk.com/api/163_music/song?ids={song_num}&level={level}&type=json"
-    try:
-        response = requests.get(api_url, timeout=30)
-        data = response.json()
-        formatted_data = {
-            "level": data.get("level"),
-            "size": str(data.get("size")) if data.get("size") else None,
-            "url": data.get("url")
-        }
-        return formatted_data
-    except Exception as e:
-        print(f"BugPK API请求失败: {e}")
-        return None
+    return _call_provider('bugpk', song_num, level)
 
 def api_ss22y_music(song_num: str, level: str = 'exhigh'):
-    base_url = f"https://music.meorion.moe/api/getSongUrl?id={song_num}&level={level}"
-    try:
-        response = requests.get(base_url, timeout=30)
-        data = response.json()
-        formatted_data = {
-            "level": level,
-            "size": str(data.get('size')),
-            "url": data.get('url')
-        }
-        return formatted_data
-    except Exception as e:
-        print(f"ss22y API请求失败: {e}")
-        return None
+    return _call_provider('ss22y', song_num, level)
 
 def api_iwenwiki_music(song_num: str, level: str = 'exhigh'):
-    api_url = f"http://iwenwiki.com:3000/song/url/v1?id={song_num}&level={level}"
-    try:
-        response = requests.get(api_url, timeout=30)
-        data = response.json()["data"][0]
-        formatted_data = {
-            "level": data.get("quality"),
-            "size": str(data.get("size")) if data.get("size") else None,
-            "url": data.get("url")
-        }
-        return formatted_data
-    except Exception as e:
-        print(f"iwenwiki API请求失败: {e}")
-        return None
+    return _call_provider('iwenwiki', song_num, level)
 
 def parse_music_source(parse_type: str, source_url: str):
     """根据类型调用不同的解析函数"""
@@ -186,142 +231,469 @@ def parse_music_source(parse_type: str, source_url: str):
     else:
         raise ValueError(f"不支持的解析类型: {parse_type}")
 
+def _content_range_start(response):
+    """解析 206 响应 Content-Range 头中的起始字节，如 'bytes 100-199/200' -> 100"""
+    value = response.headers.get('Content-Range', '')
+    try:
+        return int(value.split(' ', 1)[1].split('-', 1)[0])
+    except (IndexError, ValueError):
+        return None
+
+def _total_size(response, status):
+    """响应对应的完整文件大小：206 取 Content-Range 的总长度，200 取 Content-Length；未知时返回 None"""
+    if status == 206:
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    else:
+        total = response.headers.get('Content-Length', '')
+    return int(total) if total.isdigit() else None
+
+def _validator(response):
+    """用于 If-Range 的强校验值：ETag（弱 ETag 不可用）或 Last-Modified"""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+def _prepare_resume(part_path, info_path):
+    """
+    单连接续传前的准备，返回 (已下载字节数, 请求头, 上次记录的校验信息)。
+    没有校验信息的 .part 无法确认与服务器上的文件相同，丢弃后从头下载。
+    """
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    info = None
+    if offset:
+        try:
+            info = json.loads(info_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            part_path.unlink(missing_ok=True)
+            offset = 0
+    headers = {}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        if info.get('validator'):
+            headers['If-Range'] = info['validator']
+    return offset, headers, info
+
+def _resume_mode(response, status, offset, info, part_path, info_path):
+    """
+    按响应决定续写（返回 ('ab', offset)）还是从头写入（返回 ('wb', 0)，同时记录新的校验信息）。
+    续传得到的文件大小或校验值与上次记录的不同（可能换了接口或音源）时，
+    丢弃临时文件并抛出异常，由调用方重试。
+    """
+    if offset and status == 206 and _content_range_start(response) == offset:
+        size, validator = _total_size(response, status), _validator(response)
+        if (info.get('size') and size != info['size']) or (info.get('validator') and validator
+                                                             and validator != info['validator']):
+            part_path.unlink(missing_ok=True)
+            info_path.unlink(missing_ok=True)
+            raise IOError("续传的文件与上次下载的不一致，已重置临时文件")
+        return 'ab', offset
+    info_path.write_text(json.dumps({'size': _total_size(response, status), 'validator': _validator(response)}),
+                         encoding='utf-8')
+    return 'wb', 0
+
+def _retry_after(exc):
+    """从 HTTPError 中取出服务器建议的重试等待时间 (Retry-After)"""
+    response = getattr(exc, 'response', None)
+    return response.headers.get('Retry-After') if response is not None else None
+
+# 下载地址接口
+API_FUNC_MAP = {
+    'vkeys': api_vkeys_music,
+    'bugpk': api_bugpk_music,
+    'iwenwiki': api_iwenwiki_music,
+    'ss22y': api_ss22y_music,
+}
+
+# 进程内共享的接口解析器，统计数据在所有下载任务之间累积
+provider_resolver = ProviderResolver(API_FUNC_MAP)
+
+# 进程内共享的封面缓存（只在内存中），下载任务使用保存根目录下带磁盘缓存的 cache.open_cover_cache
+shared_cover_cache = CoverCache()
+
+# ==================== 歌曲详情批量解析 ====================
+
+class SongDetailResolver:
+    """
+    按批次解析缺少元数据的歌曲ID，并缓存每个ID的解析结果。
+    song/detail 接口本身支持一次传入多个ID，这里按 batch_size 分块请求，
+    避免单曲/重试任务对每首歌单独请求一次详情。
+    """
+    def __init__(self, batch_size=SONG_DETAIL_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, song_ids):
+        """解析一组歌曲ID，返回 {歌曲ID: 详情}，已缓存的ID不会重复请求"""
+        ids = [str(i) for i in song_ids]
+        with self._lock:
+            pending = list(dict.fromkeys(i for i in ids if i not in self._results))
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            details = api_song_details(chunk)
+            with self._lock:
+                for sid in chunk:
+                    # 获取失败的ID记为 None，避免同一批次内反复请求
+                    self._results[sid] = details.get(sid)
+        with self._lock:
+            return {i: self._results.get(i) for i in ids}
+
+    def get(self, song_id):
+        """获取单个ID的详情，未缓存时单独解析"""
+        return self.resolve([song_id]).get(str(song_id))
+
 # ==================== 下载器类 ====================
 
 class MusicDownloader:
-    def __init__(self, save_dir, quality='standard', api_name='bugpk'):
+    def __init__(self, save_dir, quality='standard', api_name='bugpk', segments=None, segment_min_size=SEGMENT_MIN_SIZE, failover=True, library=None, tagger=None, metrics=None, lyrics_cache=None, cover_cache=None):
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(parents=True, exist_ok=True)
         self.quality = quality
         self.api_name = api_name
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        self.session.verify = False
+        # 分段数：未指定时仅无损音质启用分段下载，1 表示始终单连接
+        if segments is None:
+            segments = SEGMENT_COUNT if quality in LOSSLESS_QUALITIES else 1
+        self.segments = max(1, int(segments))
+        self.segment_min_size = segment_min_size
+        # 首选接口失败时是否自动切换到其他接口
+        self.failover = failover
+        # 曲库索引（LibraryIndex），为空时只按文件名检测是否已下载
+        self.library = library
+        # 标签写入执行器（tagger.Tagger），为空时在当前线程中写入
+        self.tagger = tagger
+        # 各阶段耗时与传输量统计（metrics.JobMetrics），同一任务的下载器共用
+        self.metrics = metrics or JobMetrics()
+        # 歌词缓存（cache.LyricsCache），为空时每次请求接口
+        self.lyrics_cache = lyrics_cache
+        # 封面缓存（cache.CoverCache），为空时使用进程内共享的内存缓存
+        self.cover_cache = cover_cache or shared_cover_cache
 
     def _download_file(self, url, filepath, max_retries=3):
+        """
+        下载文件到 filepath。数据先写入同目录下的 .part 临时文件，
+        完整下载后才原子替换为目标文件；中断后再次下载时通过 Range 请求续传。
+        """
         if not url or not str(url).startswith('http'):
             return False
-        
+
+        filepath = Path(filepath)
+        part_path = filepath.with_name(filepath.name + PART_SUFFIX)
+        state_path = filepath.with_name(filepath.name + SEGMENT_STATE_SUFFIX)
+        info_path = filepath.with_name(filepath.name + PART_INFO_SUFFIX)
+
         for attempt in range(max_retries):
             try:
-                with self.session.get(url, stream=True, timeout=30) as r:
-                    r.raise_for_status()
-                    with open(filepath, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
+                size = self._probe_range_size(url) if self.segments > 1 else None
+                if size and size >= self.segment_min_size:
+                    self._fetch_segmented(url, part_path, state_path, size)
+                else:
+                    if state_path.exists():
+                        # 上次是分段下载（文件已预分配），无法按文件大小续传
+                        part_path.unlink(missing_ok=True)
+                        state_path.unlink()
+                    self._fetch_to_part(url, part_path, info_path)
+                os.replace(part_path, filepath)
+                state_path.unlink(missing_ok=True)
+                info_path.unlink(missing_ok=True)
                 return True
-            except Exception:
+            except Exception as e:
                 if attempt == max_retries - 1: return False
-                time.sleep(1)
+                time.sleep(ratelimit.backoff(attempt, _retry_after(e)))
         return False
 
-    def _embed_metadata(self, audio_path, cover_data, title, artist, album):
+    def _fetch_to_part(self, url, part_path, info_path):
+        """
+        将 url 的内容写入（或续写）part_path，未完整下载时抛出异常，保留已下载部分。
+        info_path 记录文件总大小与校验值，续传时用于确认服务器上的文件没有变化。
+        """
+        offset, headers, info = _prepare_resume(part_path, info_path)
+
+        with client.stream(url, verify=False, headers=headers) as r:
+            if r.status_code == 416:
+                # 续传位置无效（文件已变化或临时文件异常），丢弃后重新下载
+                part_path.unlink(missing_ok=True)
+                info_path.unlink(missing_ok=True)
+                raise IOError("Range 请求无效，已重置临时文件")
+            r.raise_for_status()
+            # 服务器不支持续传或文件已变化（If-Range 不匹配）时返回完整文件，从头开始
+            mode, offset = _resume_mode(r, r.status_code, offset, info, part_path, info_path)
+
+            expected = r.headers.get('Content-Length')
+            written = 0
+            try:
+                with open(part_path, mode) as f:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        f.write(chunk)
+                        written += len(chunk)
+            finally:
+                self.metrics.add_bytes(written)
+
+        if expected is not None and written < int(expected):
+            raise IOError(f"下载不完整: {offset + written}/{offset + int(expected)} 字节")
+
+    def _fetch_bytes(self, url, max_retries=3):
+        """下载小文件（如封面）到内存，失败返回 None"""
+        if not url or not str(url).startswith('http'):
+            return None
+        for attempt in range(max_retries):
+            try:
+                r = client.get(url, verify=False)
+                r.raise_for_status()
+                return r.content
+            except Exception as e:
+                if attempt == max_retries - 1: return None
+                time.sleep(ratelimit.backoff(attempt, _retry_after(e)))
+        return None
+
+    def _probe_range_size(self, url):
+        """探测服务器是否支持 Range 请求，支持时返回文件总大小，否则返回 None"""
         try:
-            ext = audio_path.suffix.lower()
-            if ext == '.mp3':
-                audio = MP3(str(audio_path), ID3=ID3)
-                if audio.tags is None: audio.add_tags()
-                audio.tags.clear()
-                audio.tags.add(TIT2(encoding=3, text=title))
-                audio.tags.add(TPE1(encoding=3, text=normalize_artists(artist)))
-                audio.tags.add(TALB(encoding=3, text=album))
-                if cover_data:
-                    audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover_data))
-                audio.save(v2_version=3)
-            elif ext == '.flac':
-                audio = FLAC(str(audio_path))
-                audio.clear_pictures()
-                audio.delete()
-                audio['title'] = title
-                audio['artist'] = normalize_artists(artist)
-                audio['album'] = album
-                if cover_data:
-                    p = Picture()
-                    p.type = 3
-                    p.mime = 'image/jpeg'
-                    p.desc = 'Cover'
-                    p.data = cover_data
-                    audio.add_picture(p)
-                audio.save()
-            return True
-        except Exception as e:
-            print(f"元数据嵌入失败: {e}")
-            return False
+            with client.stream(url, verify=False, headers={'Range': 'bytes=0-0'}) as r:
+                if r.status_code != 206:
+                    return None
+                total = r.headers.get('Content-Range', '').rpartition('/')[2]
+                return int(total) if total.isdigit() else None
+        except Exception:
+            return None
+
+    def _fetch_segmented(self, url, part_path, state_path, size):
+        """
+        将文件按字节范围分成 self.segments 段并发下载到预分配的 part_path。
+        每段的已完成字节数记录在 state_path 中，失败后重试只补齐未完成的部分。
+        """
+        segments = None
+        if state_path.exists() and part_path.exists():
+            try:
+                state = json.loads(state_path.read_text(encoding='utf-8'))
+                if state.get('size') == size:
+                    segments = state['segments']
+            except (ValueError, KeyError):
+                segments = None
+
+        if segments is None:
+            step = -(-size // self.segments)
+            segments = [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+            # 先写进度文件再预分配，保证预分配的文件一定有对应的进度记录
+            state_path.write_text(json.dumps({'size': size, 'segments': segments}), encoding='utf-8')
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+
+        def fetch(seg):
+            start, end, done = seg
+            if start + done > end:
+                return
+            headers = {'Range': f'bytes={start + done}-{end}'}
+            with client.stream(url, verify=False, headers=headers) as r:
+                r.raise_for_status()
+                if r.status_code != 206 or _content_range_start(r) != start + done:
+                    raise IOError("服务器未按请求返回分段数据")
+                try:
+                    with open(part_path, 'r+b') as f:
+                        f.seek(start + done)
+                        for chunk in r.iter_content(chunk_size=65536):
+                            f.write(chunk)
+                            seg[2] += len(chunk)
+                finally:
+                    self.metrics.add_bytes(seg[2] - done)
+            if start + seg[2] <= end:
+                raise IOError(f"分段下载不完整: {start}-{end}")
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                errors = [f.exception() for f in [executor.submit(fetch, seg) for seg in segments]]
+        finally:
+            state_path.write_text(json.dumps({'size': size, 'segments': segments}), encoding='utf-8')
+
+        error = next((e for e in errors if e), None)
+        if error:
+            raise error
+
+    def _embed_metadata(self, audio_path, cover_data, title, artist, album):
+        """写入元数据；设置了 tagger 时交给其执行（可能在其他进程中）。成功返回 None，失败返回错误信息"""
+        with self.metrics.time('tag'):
+            if self.tagger:
+                error = self.tagger.embed(audio_path, cover_data, title, artist, album)
+            else:
+                error = embed_metadata(audio_path, cover_data, title, artist, album)
+        if error:
+            print(f"元数据嵌入失败: {error}")
+        return error
 
     def get_song_url(self, song_id, api_name=None):
         target_api = api_name or self.api_name
-        api_func_map = {
-            'vkeys': api_vkeys_music,
-            'bugpk': api_bugpk_music,
-            'iwenwiki': api_iwenwiki_music,
-            'ss22y': api_ss22y_music,
-        }
-        func = api_func_map.get(target_api, api_bugpk_music)
-        return func(song_id, self.quality)
+        if target_api not in API_FUNC_MAP:
+            target_api = 'bugpk'
+        with self.metrics.time('resolve_url'):
+            return provider_resolver.resolve(song_id, self.quality, preferred=target_api, failover=self.failover)
 
-    def download_song(self, song_url, download_lyrics=True, api_name=None, track_info=None, download_lyrics_translated=False):
+    # --- 下载流程的各个阶段 ---
+    # 每个阶段接收并返回同一个上下文字典 ctx；阶段内一旦得出最终结果，
+    # 会写入 ctx['result']，后续阶段不再执行。
+
+    def resolve_song(self, song_url, api_name=None, track_info=None):
+        """阶段1：获取歌曲详情、本地预检并解析下载地址"""
+        ctx = self.precheck_song(song_url, track_info)
+        if ctx['result']:
+            return ctx
+
+        # --- 2. 调用 API 获取详情 (URL, 歌词等) ---
+        song_url = self.get_song_url(ctx['song_id'], api_name)
+        print(f"调试信息 - 歌曲详情 - API{api_name} :-------------------------------")
+        print(ctx['songs'])
+        print(song_url)
+        return self.apply_song_url(ctx, song_url)
+
+    def precheck_song(self, song_url, track_info=None):
+        """本地预检：已下载则直接得出结果，不需要请求下载地址"""
         song_id = normalize_ncm_url(song_url, "id", "song")
+
+        # --- 0. 曲库索引预检：按歌曲ID查找，重命名/排序过的文件同样能识别 ---
+        if self.library:
+            entries = self.library.lookup(song_id, self.save_dir)
+            if entries:
+                ctx = {'song_id': song_id, 'songs': track_info, 'filename_base': Path(entries[0]['path']).stem, 'result': None}
+                return self._finish(ctx, "skipped")
+
         if track_info:
             songs = track_info  # 保持和歌单模式一致的结构
         else:
             songs = api_song_detail(song_id)
-                
+
         # --- 1. 本地文件预检 ---
         filename_base = sanitize_filename(f"{songs['name']} - {songs['ar']}")
-        for ext in ['.mp3', '.flac', '.wav', '.ogg']:
-            if (self.save_dir / f"{filename_base}{ext}").exists():
-                return "skipped", filename_base, song_id
+        ctx = {'song_id': song_id, 'songs': songs, 'filename_base': filename_base, 'result': None}
+        existing = self._existing_audio(filename_base)
+        if existing:
+            # 索引建立之前下载的文件，补录到索引中
+            if self.library:
+                self.library.record(song_id, existing)
+            return self._finish(ctx, "skipped")
 
-        # --- 2. 调用 API 获取详情 (URL, 歌词等) ---
-        song_url = self.get_song_url(song_id, api_name)
-        print(f"调试信息 - 歌曲详情 - API{api_name} :-------------------------------")
-        print(songs)
-        print(song_url)
+        # --- 1.5 其他歌单中已有同一首歌时，直接链接过来，不走网络 ---
+        if self.library and self._link_from_library(ctx):
+            return self._finish(ctx, "linked")
+        return ctx
+
+    def apply_song_url(self, ctx, song_url):
+        """根据接口返回的下载地址确定保存路径"""
         if not song_url or not song_url.get("url"):
-            return "failed", filename_base, song_id
-        
+            return self._finish(ctx, "failed")
+
         # --- 3. 确定文件扩展名 ---
         parsed = urlparse(song_url["url"])
         # 如果 URL 带有后缀则使用，否则根据音质猜测
-        ext = Path(parsed.path).suffix or (".flac" if self.quality in ['lossless', 'hires', 'jymaster'] else ".mp3")
-        audio_path = self.save_dir / f"{filename_base}{ext}"
+        ext = Path(parsed.path).suffix or (".flac" if self.quality in LOSSLESS_QUALITIES else ".mp3")
+        ctx['url'] = song_url["url"]
+        ctx['level'] = song_url.get("level")
+        ctx['audio_path'] = self.save_dir / f"{ctx['filename_base']}{ext}"
 
         # API 确认后的二次检查
-        if audio_path.exists():
-            return "skipped", filename_base, song_id
+        if ctx['audio_path'].exists():
+            return self._finish(ctx, "skipped")
+        return ctx
 
-        # --- 4. 下载音频 ---
-        if not self._download_file(song_url["url"], audio_path):
-            return "failed", filename_base, song_id
+    def needs_download(self, track) -> bool:
+        """
+        只查本地判断歌曲预检后是否仍需下载（曲库中没有、目录中也没有同名文件），
+        不请求接口、不修改曲库。缺少详情的歌曲按需要下载处理。
+        """
+        if self.library and self.library.lookup(str(track['id'])):
+            return False
+        if 'name' not in track:
+            return True
+        return self._existing_audio(sanitize_filename(f"{track['name']} - {track['ar']}")) is None
+
+    def _existing_audio(self, filename_base):
+        for ext in ['.mp3', '.flac', '.wav', '.ogg']:
+            path = self.save_dir / f"{filename_base}{ext}"
+            if path.exists():
+                return path
+        return None
+
+    def _link_from_library(self, ctx):
+        """在曲库其他目录中查找同一歌曲，找到时以硬链接（或 reflink/复制）放入当前目录"""
+        for entry in self.library.lookup(ctx['song_id']):
+            src = Path(entry['path'])
+            dst = self.save_dir / f"{ctx['filename_base']}{src.suffix}"
+            try:
+                method = link_file(src, dst)
+                src_lrc = src.with_suffix('.lrc')
+                if src_lrc.exists():
+                    link_file(src_lrc, dst.with_suffix('.lrc'))
+            except OSError as e:
+                print(f"链接已有文件失败: {src} -> {dst}, 原因: {e}")
+                continue
+            print(f"复用已下载文件 ({method}): {src} -> {dst}")
+            ctx['audio_path'] = dst
+            self.library.record(ctx['song_id'], dst, entry['quality'])
+            return True
+        return False
+
+    def transfer_song(self, ctx):
+        """阶段2：下载音频"""
+        with self.metrics.time('transfer'):
+            ok = self._download_file(ctx['url'], ctx['audio_path'])
+        if not ok:
+            return self._finish(ctx, "failed")
+        return ctx
 
-        # --- 5. 下载封面并嵌入元数据 ---
+    def tag_song(self, ctx, fetch=None):
+        """阶段3：下载封面并嵌入元数据，fetch(url) 为封面下载函数，默认 self._fetch_bytes"""
+        songs, filename_base = ctx['songs'], ctx['filename_base']
         # 优先使用 track_info 里的名字写入标签，防止 API 返回的名字与歌单不一致
         if songs.get("picUrl"):
-            cover_path = self.save_dir / f"{filename_base}_cv.tmp"
-            if self._download_file(songs["picUrl"], cover_path):
-                try:
-                    with open(cover_path, 'rb') as f:
-                        cover_bytes = f.read()
-                    self._embed_metadata(audio_path, cover_bytes, sanitize_filename(songs["name"]), sanitize_filename(songs["ar"]), songs["album"])
-                finally:
-                    if cover_path.exists(): cover_path.unlink()
+            # 同一专辑的封面只下载一次，字节直接从缓存写入音频标签
+            with self.metrics.time('cover'):
+                cover_bytes = self.cover_cache.get(songs["picUrl"], fetch or self._fetch_bytes)
+            if cover_bytes:
+                # 标签写入失败不影响下载结果，错误信息随 ctx 返回给任务
+                ctx['tag_error'] = self._embed_metadata(ctx['audio_path'], cover_bytes, sanitize_filename(songs["name"]), sanitize_filename(songs["ar"]), songs["album"])
+        return ctx
 
-        # --- 6. 处理歌词 ---
+    def lyrics_song(self, ctx, download_lyrics=True, download_lyrics_translated=False):
+        """阶段4：处理歌词，完成后标记为已下载"""
+        lyrics_data = None
         if download_lyrics:
-            lyrics_data = api_lyrics(song_id)
+            with self.metrics.time('lyrics'):
+                lyrics_data = self.fetch_lyrics(ctx['song_id'])
+        return self.finish_download(ctx, lyrics_data, download_lyrics_translated)
+
+    def fetch_lyrics(self, song_id, fetch=None):
+        """获取原始歌词，有歌词缓存时先查缓存；fetch 为实际请求接口的函数（默认 api_lyrics）"""
+        fetch = fetch or api_lyrics
+        if self.lyrics_cache:
+            return self.lyrics_cache.get(song_id, fetch)
+        return fetch(song_id)
+
+    def finish_download(self, ctx, lyrics_data=None, download_lyrics_translated=False):
+        """写入歌词文件（lyrics_data 为空时跳过）、登记曲库索引并标记为已下载"""
+        if lyrics_data:
             try:
-                lrc_content = merge_lyrics(
-                    lyrics_data.get("lrc", ""), 
-                    lyrics_data.get("tlyric", "") if download_lyrics_translated else ""
-                )
+                lrc_content = merge_lyrics_data(lyrics_data, translated=download_lyrics_translated)
                 if lrc_content:
-                    (self.save_dir / f"{filename_base}.lrc").write_text("\n".join(lrc_content), encoding="utf-8")
+                    (self.save_dir / f"{ctx['filename_base']}.lrc").write_text("\n".join(lrc_content), encoding="utf-8")
             except Exception:
                 pass
+        if self.library:
+            self.library.record(ctx['song_id'], ctx['audio_path'], ctx.get('level') or self.quality)
+        return self._finish(ctx, "downloaded")
 
-        return "downloaded", filename_base, song_id
+    @staticmethod
+    def _finish(ctx, status):
+        ctx['result'] = (status, ctx['filename_base'], ctx['song_id'])
+        return ctx
+
+    def download_song(self, song_url, download_lyrics=True, api_name=None, track_info=None, download_lyrics_translated=False):
+        """在当前线程中依次执行全部阶段，返回 (状态, 文件名, 歌曲ID)"""
+        ctx = self.resolve_song(song_url, api_name, track_info)
+        for stage in (self.transfer_song, self.tag_song):
+            if ctx['result']:
+                return ctx['result']
+            ctx = stage(ctx)
+        if ctx['result']:
+            return ctx['result']
+        return self.lyrics_song(ctx, download_lyrics, download_lyrics_translated)['result']
     
 if __name__ == "__main__":
     # 简单测试下载器
@@ -0,0 +1,113 @@
+# modules/events.py
+import collections
+import itertools
+import queue
+import threading
+import time
+
+# 保留最近的事件数，断线重连的客户端可以从 Last-Event-ID 之后补发
+EVENT_BUFFER_SIZE = 1000
+# 同一任务的进度事件在该时间窗口（秒）内只发送最新的一条
+PROGRESS_COALESCE_SECONDS = 0.5
+# 单个订阅者未读取的事件上限，超出时断开该订阅者，由客户端重连后补发
+SUBSCRIBER_QUEUE_SIZE = EVENT_BUFFER_SIZE
+
+
+class Subscription:
+    """一个事件订阅者（通常对应一个浏览器的 SSE 连接）"""
+    def __init__(self, hub):
+        self._hub = hub
+        self._queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # 读取太慢，断开后由客户端带上 Last-Event-ID 重连补发
+            self.closed = True
+
+    def get(self, timeout=None):
+        """取下一个事件，超时返回 None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+        self._hub.unsubscribe(self)
+
+
+class EventHub:
+    """
+    事件广播：每个事件带递增 ID，发送给所有订阅者，并保留在环形缓冲区中供重连补发。
+    进度事件按任务合并，时间窗口内只发送最新的一条；同一任务的其他事件发送前
+    会先发出尚未发送的进度，保证顺序不变。
+    """
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE, coalesce_window=PROGRESS_COALESCE_SECONDS):
+        self.coalesce_window = coalesce_window
+        self._buffer = collections.deque(maxlen=buffer_size)
+        # 以启动时刻（毫秒）为起点，服务重启后的事件 ID 仍大于客户端记录的旧 ID
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        # 进度合并：{任务ID: 上次发送时间} 与 {任务ID: 等待发送的最新进度}
+        self._last_progress = {}
+        self._pending_progress = {}
+
+    def publish(self, event: dict):
+        key = event.get('job_id')
+        with self._lock:
+            if event.get('type') == 'progress' and self.coalesce_window:
+                now = time.monotonic()
+                last = self._last_progress.get(key)
+                if last is not None and now - last < self.coalesce_window:
+                    if key not in self._pending_progress:
+                        timer = threading.Timer(last + self.coalesce_window - now, self._flush_progress, args=(key,))
+                        timer.daemon = True
+                        timer.start()
+                    self._pending_progress[key] = event
+                    return
+                self._last_progress[key] = now
+            else:
+                pending = self._pending_progress.pop(key, None)
+                if pending is not None:
+                    self._send(pending)
+                if event.get('type') in ('done', 'stopped', 'error'):
+                    self._last_progress.pop(key, None)
+            self._send(event)
+
+    def _flush_progress(self, key):
+        with self._lock:
+            pending = self._pending_progress.pop(key, None)
+            if pending is not None:
+                self._last_progress[key] = time.monotonic()
+                self._send(pending)
+
+    def _send(self, event):
+        """分配 ID、写入缓冲区并投递给订阅者，调用方需持有锁"""
+        event_id = next(self._ids)
+        self._buffer.append((event_id, event))
+        for sub in list(self._subscribers):
+            sub._put((event_id, event))
+            if sub.closed:
+                self._subscribers.discard(sub)
+
+    def subscribe(self, last_event_id=None) -> Subscription:
+        """
+        新增订阅者。last_event_id 不为空时先补发缓冲区中其后的事件；
+        为空时只接收之后发生的事件。
+        """
+        sub = Subscription(self)
+        with self._lock:
+            if last_event_id is not None:
+                for event_id, event in self._buffer:
+                    if event_id > last_event_id:
+                        sub._put((event_id, event))
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
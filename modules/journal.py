@@ -0,0 +1,126 @@
+# modules/journal.py
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# 歌曲在一个任务中的状态流转：pending -> resolved -> transferred -> tagged -> 最终状态
+PENDING, RESOLVED, TRANSFERRED, TAGGED = 'pending', 'resolved', 'transferred', 'tagged'
+FINAL_STATES = ('downloaded', 'skipped', 'linked', 'failed')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    source TEXT,
+    planned_at REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    job_id TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    state TEXT NOT NULL,
+    detail TEXT,
+    updated_at REAL,
+    PRIMARY KEY (job_id, track_id)
+);
+"""
+
+
+class JobJournal:
+    """
+    任务日志（SQLite）：持久化任务队列以及每首歌在任务中的状态变化。
+    每次状态变化立即提交，进程重启后可以从最后提交的状态继续，已完成的歌曲不再处理。
+    """
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # WAL 模式下 NORMAL 即可保证进程崩溃时已提交的数据不丢失
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        # 旧版本创建的数据库没有 planned_at 列
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        if 'planned_at' not in columns:
+            with self._conn:
+                self._conn.execute('ALTER TABLE jobs ADD COLUMN planned_at REAL')
+
+    # --- 任务 ---
+
+    def save_job(self, job_data: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO jobs (id, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at',
+                (job_data['id'], json.dumps(job_data, ensure_ascii=False), time.time()),
+            )
+
+    def load_jobs(self) -> list:
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM jobs ORDER BY rowid').fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def delete_job(self, job_id):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            self._conn.execute('DELETE FROM tracks WHERE job_id = ?', (job_id,))
+
+    def set_source(self, job_id, source: dict):
+        """保存任务解析得到的歌单数据，恢复时无需重新请求"""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE jobs SET source = ? WHERE id = ?',
+                               (json.dumps(source, ensure_ascii=False), job_id))
+
+    def get_source(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT source FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    # --- 歌曲状态 ---
+
+    def plan(self, job_id, tracks: list):
+        """登记任务要处理的歌曲（可以为空）；已登记的歌曲保留原有状态"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO tracks (job_id, track_id, seq, track, state, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(job_id, str(t['id']), i, json.dumps(t, ensure_ascii=False), PENDING, now) for i, t in enumerate(tracks)],
+            )
+            self._conn.execute('UPDATE jobs SET planned_at = COALESCE(planned_at, ?) WHERE id = ?', (now, job_id))
+
+    def planned_tracks(self, job_id):
+        """已登记的歌曲列表；任务还没有登记过（plan 未执行）时返回 None，登记了空列表时返回 []"""
+        with self._lock:
+            job = self._conn.execute('SELECT planned_at FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            rows = self._conn.execute('SELECT track FROM tracks WHERE job_id = ? ORDER BY seq', (job_id,)).fetchall()
+        # 旧版本的日志没有 planned_at，有登记的歌曲即视为已登记
+        if not rows and (not job or job[0] is None):
+            return None
+        return [json.loads(track) for (track,) in rows]
+
+    def mark(self, job_id, track_id, state, detail=None):
+        """记录一次状态变化，detail 为恢复时需要的附加信息（如文件路径）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE tracks SET state = ?, detail = COALESCE(?, detail), updated_at = ? WHERE job_id = ? AND track_id = ?',
+                (state, json.dumps(detail, ensure_ascii=False) if detail is not None else None,
+                 time.time(), job_id, str(track_id)),
+            )
+
+    def track_states(self, job_id) -> dict:
+        """{歌曲ID: (状态, 附加信息)}"""
+        with self._lock:
+            rows = self._conn.execute('SELECT track_id, state, detail FROM tracks WHERE job_id = ?', (job_id,)).fetchall()
+        return {tid: (state, json.loads(detail) if detail else None) for tid, state, detail in rows}
+
+    def failed_tracks(self, job_id) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT track FROM tracks WHERE job_id = ? AND state = ? ORDER BY seq', (job_id, 'failed')
+            ).fetchall()
+        return [json.loads(track) for (track,) in rows]
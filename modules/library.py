@@ -0,0 +1,185 @@
+# modules/library.py
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 索引数据库文件名，存放在保存根目录下
+LIBRARY_DB_NAME = '.ncmtools.db'
+# 快速哈希读取的头尾字节数
+QUICK_HASH_BYTES = 64 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    path TEXT PRIMARY KEY,
+    song_id TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    quality TEXT,
+    size INTEGER,
+    hash TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_songs_song_id ON songs (song_id, dir);
+CREATE TABLE IF NOT EXISTS applied_renames (
+    token TEXT PRIMARY KEY,
+    applied_at REAL
+);
+"""
+
+
+def quick_hash(path) -> str:
+    """按 文件大小 + 头尾各 64KB 计算的快速哈希，用于识别同一文件，不读取整个文件"""
+    path = Path(path)
+    size = path.stat().st_size
+    h = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        h.update(f.read(QUICK_HASH_BYTES))
+        if size > QUICK_HASH_BYTES * 2:
+            f.seek(-QUICK_HASH_BYTES, 2)
+            h.update(f.read(QUICK_HASH_BYTES))
+    return h.hexdigest()
+
+
+def _reflink(src, dst):
+    """写时复制克隆（Linux FICLONE，需 btrfs/xfs 等文件系统支持）"""
+    if not sys.platform.startswith('linux'):
+        raise OSError("当前平台不支持 reflink")
+    import fcntl
+    FICLONE = 0x40049409
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+
+
+def link_file(src, dst) -> str:
+    """
+    将已存在的文件 src 放到 dst，不重新下载。
+    依次尝试硬链接、reflink、普通复制，返回实际使用的方式。
+    """
+    src, dst = Path(src), Path(dst)
+    tmp = dst.with_name(dst.name + '.part')
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+        method = 'hardlink'
+    except OSError:
+        try:
+            _reflink(src, tmp)
+            method = 'reflink'
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            shutil.copy2(src, tmp)
+            method = 'copy'
+    os.replace(tmp, dst)
+    return method
+
+
+class LibraryIndex:
+    """
+    本地曲库索引：记录 网易云歌曲ID -> 文件路径、音质、大小、哈希。
+    下载完成、排序重命名时更新，跳过检测只需一次按 ID 的索引查询，
+    文件被重命名（如排序加编号）后仍能识别为已下载。
+    """
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _key(path) -> str:
+        return str(Path(path).resolve())
+
+    def record(self, song_id, path, quality=None):
+        """记录（或更新）一个已下载的文件"""
+        path = Path(path)
+        try:
+            size, digest = path.stat().st_size, quick_hash(path)
+        except OSError:
+            return
+        key = self._key(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO songs (path, song_id, dir, quality, size, hash, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, str(song_id), str(Path(key).parent), quality, size, digest, time.time()),
+            )
+
+    def lookup(self, song_id, directory=None) -> list:
+        """
+        查询歌曲ID对应的文件，directory 不为空时只查该目录。
+        返回仍然存在的文件记录列表 [{'path', 'quality', 'size', 'hash'}]，已不存在的记录会被清理。
+        """
+        sql = 'SELECT path, quality, size, hash FROM songs WHERE song_id = ?'
+        args = [str(song_id)]
+        if directory is not None:
+            sql += ' AND dir = ?'
+            args.append(self._key(directory))
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+
+        found, missing = [], []
+        for path, quality, size, digest in rows:
+            if Path(path).is_file():
+                found.append({'path': path, 'quality': quality, 'size': size, 'hash': digest})
+            else:
+                missing.append(path)
+        if missing:
+            self.remove(*missing)
+        return found
+
+    def rename(self, old_path, new_path):
+        """文件重命名后同步更新索引"""
+        old_key, new_key = self._key(old_path), self._key(new_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE OR REPLACE songs SET path = ?, dir = ?, updated_at = ? WHERE path = ?',
+                (new_key, str(Path(new_key).parent), time.time(), old_key),
+            )
+
+    def rename_batch(self, pairs, token) -> bool:
+        """
+        一次事务内更新一批重命名（可以包含文件名互换）。
+        token 标识这批重命名，已经应用过的同一批不会重复应用，返回是否实际更新。
+        """
+        keys = [(self._key(old), self._key(new)) for old, new in pairs]
+        with self._lock, self._conn:
+            if self._conn.execute('SELECT 1 FROM applied_renames WHERE token = ?', (token,)).fetchone():
+                return False
+            rows = {}
+            for old_key, _ in keys:
+                row = self._conn.execute(
+                    'SELECT song_id, quality, size, hash FROM songs WHERE path = ?', (old_key,)).fetchone()
+                if row:
+                    rows[old_key] = row
+            self._conn.executemany('DELETE FROM songs WHERE path = ?', [(k,) for k in rows])
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO songs (path, song_id, dir, quality, size, hash, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(new_key, *rows[old_key][:1], str(Path(new_key).parent), *rows[old_key][1:], time.time())
+                 for old_key, new_key in keys if old_key in rows],
+            )
+            self._conn.execute('INSERT INTO applied_renames (token, applied_at) VALUES (?, ?)', (token, time.time()))
+        return True
+
+    def remove(self, *paths):
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM songs WHERE path = ?', [(self._key(p),) for p in paths])
+
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def open_library(root) -> LibraryIndex:
+    """获取保存根目录对应的曲库索引（同一根目录在进程内共用一个实例）"""
+    db_path = Path(root).resolve() / LIBRARY_DB_NAME
+    with _libraries_lock:
+        if db_path not in _libraries:
+            _libraries[db_path] = LibraryIndex(db_path)
+        return _libraries[db_path]
@@ -0,0 +1,75 @@
+# modules/lyrics_rebuild.py
+import os
+from pathlib import Path
+
+from .Lyrics import merge_lyrics_data
+from .renamer import load_sort_map
+from .sync import load_playlist_json, find_local_file
+
+# 歌单目录所在的子目录（<保存根目录>/<类型>/<歌单名>）
+PLAYLIST_TYPES = ('playlist', 'album')
+# 同时处理的歌曲数（歌词请求仍受 ratelimit 的按主机限速约束）
+REBUILD_WORKERS = 8
+
+
+def _playlist_tracks(playlist_dir: Path) -> list:
+    """歌单目录中保存的歌单 JSON 的 tracks（排序等产生的隐藏文件不算）"""
+    for json_path in sorted(playlist_dir.glob('*.json')):
+        if json_path.name.startswith('.'):
+            continue
+        tracks = load_playlist_json(json_path).get('tracks')
+        if tracks:
+            return tracks
+    return []
+
+
+def collect_targets(save_root, playlists=None, library=None) -> tuple:
+    """
+    遍历保存根目录下的歌单目录，找出每首歌的音频文件。
+    playlists 不为空时只处理这些歌单名。
+    返回 (待处理歌曲 [{'song_id', 'audio_path', 'lrc_path'}], 找不到音频文件的歌曲数)。
+    """
+    save_root = Path(save_root)
+    wanted = set(playlists) if playlists else None
+    targets, missing = [], 0
+    for type_name in PLAYLIST_TYPES:
+        type_dir = save_root / type_name
+        if not type_dir.is_dir():
+            continue
+        for playlist_dir in sorted(p for p in type_dir.iterdir() if p.is_dir()):
+            if wanted is not None and playlist_dir.name not in wanted:
+                continue
+            sort_map = load_sort_map(playlist_dir)
+            for track in _playlist_tracks(playlist_dir):
+                audio_path = find_local_file(playlist_dir, track, library, sort_map)
+                if audio_path is None:
+                    missing += 1
+                    continue
+                targets.append({
+                    'song_id': str(track['id']),
+                    'audio_path': audio_path,
+                    'lrc_path': audio_path.with_suffix('.lrc'),
+                })
+    return targets, missing
+
+
+def rebuild_track(target: dict, fetch_lyrics, translated=False, romanized=False) -> str:
+    """
+    重新生成一首歌的 .lrc（不读写音频文件），fetch_lyrics(歌曲ID) 返回接口的原始歌词。
+    返回 'written'、'unchanged'（内容相同，未写入）或 'no_lyrics'（没有可用的歌词）。
+    """
+    lyrics_data = fetch_lyrics(target['song_id'])
+    lines = merge_lyrics_data(lyrics_data, translated, romanized) if lyrics_data else []
+    if not lines:
+        return 'no_lyrics'
+    content = '\n'.join(lines)
+    lrc_path = target['lrc_path']
+    try:
+        if lrc_path.read_text(encoding='utf-8') == content:
+            return 'unchanged'
+    except (OSError, ValueError):
+        pass
+    tmp = lrc_path.with_name(lrc_path.name + '.tmp')
+    tmp.write_text(content, encoding='utf-8')
+    os.replace(tmp, lrc_path)
+    return 'written'
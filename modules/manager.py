@@ -0,0 +1,649 @@
+# modules/manager.py
+import itertools
+import json
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from . import metrics, ratelimit
+from .utils import sanitize_filename
+from .downloader import MusicDownloader, SongDetailResolver, parse_music_source, api_lyrics
+from .pipeline import Stage, StagedPipeline
+from . import async_engine
+from .library import open_library
+from .cache import open_cover_cache, open_lyrics_cache
+from .events import EventHub
+from .tagger import Tagger
+from .sync import load_playlist_json, diff_playlist, archive_tracks
+from .lyrics_rebuild import REBUILD_WORKERS, collect_targets, rebuild_track
+from .journal import RESOLVED, TRANSFERRED, TAGGED, FINAL_STATES
+
+# --- 配置 ---
+# 传输线程数上限；对每个主机实际同时进行的请求数由 ratelimit 按响应情况自适应调整
+MAX_WORKERS = ratelimit.MAX_CONCURRENCY
+# 各阶段并发数：元数据请求轻量，不应被大文件传输占满；
+# 标签写入阶段的线程数与标签执行器（Tagger）的进程数一致，由其限制 CPU 密集的写入
+STAGE_WORKERS = {'resolve': 8, 'transfer': MAX_WORKERS, 'lyrics': 4}
+# 相邻阶段之间的队列长度上限
+STAGE_QUEUE_SIZE = 32
+# 下载引擎：thread 为多线程流水线，async 为 asyncio 引擎（需要安装 aiohttp）
+ENGINES = ('thread', 'async')
+DEFAULT_ENGINE = 'thread'
+# 同时运行的任务数上限
+MAX_CONCURRENT_JOBS = 2
+# 任务列表中保留的已结束任务数量
+FINISHED_JOBS_KEPT = 50
+# 任务开始时在后台为需要下载的歌曲预取歌词（写入歌词缓存），与音频传输同时进行
+PREFETCH_LYRICS = True
+# 重建曲库歌词的任务类型（不下载音频，只重新生成 .lrc）
+LYRICS_JOB = 'lyrics'
+
+# 前三个流水线阶段完成后在日志中记录的歌曲状态
+STAGE_STATES = (RESOLVED, TRANSFERRED, TAGGED)
+
+# 任务状态
+QUEUED, RUNNING, PAUSED, DONE, STOPPED, ERROR = 'queued', 'running', 'paused', 'done', 'stopped', 'error'
+FINISHED_STATES = (DONE, STOPPED, ERROR)
+
+
+def _journal_detail(ctx):
+    """恢复歌曲处理所需的上下文信息"""
+    return {
+        'songs': ctx.get('songs'), 'filename_base': ctx.get('filename_base'),
+        'audio_path': str(ctx['audio_path']) if ctx.get('audio_path') else None, 'level': ctx.get('level'),
+    }
+
+
+class FairBudget:
+    """
+    所有任务共享的全局并发额度（音频传输槽位）。
+    多个任务同时运行时按任务数平均分配；其他任务没有在等待时，
+    单个任务可以占用超出平均份额的空闲槽位。
+    """
+    def __init__(self, total):
+        self.total = total
+        self._used = {}
+        self._waiting = {}
+        self._cond = threading.Condition()
+
+    def register(self, job_id):
+        with self._cond:
+            self._used.setdefault(job_id, 0)
+            self._waiting.setdefault(job_id, 0)
+            self._cond.notify_all()
+
+    def unregister(self, job_id):
+        with self._cond:
+            self._used.pop(job_id, None)
+            self._waiting.pop(job_id, None)
+            self._cond.notify_all()
+
+    def _can_acquire(self, job_id):
+        if sum(self._used.values()) >= self.total:
+            return False
+        share = math.ceil(self.total / max(1, len(self._used)))
+        others_waiting = any(n for jid, n in self._waiting.items() if jid != job_id)
+        return self._used[job_id] < share or not others_waiting
+
+    def acquire(self, job_id):
+        """等待并占用一个额度；任务已注销（结束）时不再等待，直接返回"""
+        with self._cond:
+            if job_id not in self._used:
+                return
+            self._waiting[job_id] += 1
+            self._cond.wait_for(lambda: job_id not in self._used or self._can_acquire(job_id))
+            if job_id not in self._used:
+                return
+            self._waiting[job_id] -= 1
+            self._used[job_id] += 1
+
+    def release(self, job_id):
+        with self._cond:
+            if self._used.get(job_id):
+                self._used[job_id] -= 1
+            self._cond.notify_all()
+
+
+class DownloadJob:
+    """一个下载任务（歌单/专辑/单曲/重试）的参数与运行状态"""
+    _seq = itertools.count()
+
+    def __init__(self, kind, params, priority=0, job_id=None, state=QUEUED, created_at=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.state = state
+        self.created_at = created_at or time.time()
+        self.order = next(self._seq)
+        self.message = ''
+        self.progress = 0.0
+        self.failed_songs = []
+        self.playlist_dir = params.get('playlist_dir')
+        self.save_dir = params.get('save_dir')
+        self.stop_event = threading.Event()
+        # 未暂停时保持 set；暂停时 clear，各阶段在处理下一首歌前等待
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+
+    def to_dict(self, with_params=False):
+        data = {
+            'id': self.id, 'kind': self.kind, 'priority': self.priority, 'state': self.state,
+            'created_at': self.created_at, 'progress': round(self.progress, 1), 'message': self.message,
+            'failed_count': len(self.failed_songs), 'playlist_dir': self.playlist_dir,
+            'paused': not self.resume_event.is_set(),
+        }
+        if with_params:
+            data['params'] = self.params
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['kind'], data['params'], data.get('priority', 0), data['id'], data['state'], data.get('created_at'))
+        job.message = data.get('message', '')
+        job.progress = data.get('progress', 0.0)
+        job.playlist_dir = data.get('playlist_dir') or job.playlist_dir
+        return job
+
+
+class DownloadManager:
+    """管理下载任务队列：按优先级调度，多个任务并发运行并共享全局并发额度"""
+    def __init__(self, journal=None, max_concurrent_jobs=MAX_CONCURRENT_JOBS, tagger=None, prefetch_lyrics=PREFETCH_LYRICS):
+        # 事件广播：所有 SSE 连接都能收到全部事件，断线重连时可补发
+        self.events = EventHub()
+        self.jobs = {}
+        # 任务日志（JobJournal），为空时任务状态只保存在内存中
+        self.journal = journal
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.budget = FairBudget(STAGE_WORKERS['transfer'])
+        # 所有任务共用的标签写入执行器（默认进程池）
+        self.tagger = tagger or Tagger()
+        self.prefetch_lyrics = prefetch_lyrics
+        metrics.JOBS_RUNNING.track(lambda: sum(1 for j in list(self.jobs.values()) if j.state == RUNNING))
+        self.last_job = None
+        self._lock = threading.RLock()
+        self._load_jobs()
+
+    @property
+    def is_downloading(self):
+        return any(j.state == RUNNING for j in self.jobs.values())
+
+    @property
+    def failed_songs(self):
+        """最近一个结束的任务中下载失败的歌曲"""
+        return self.last_job.failed_songs if self.last_job else []
+
+    def _emit(self, msg_type, job=None, **kwargs):
+        kwargs['type'] = msg_type
+        if job is not None:
+            kwargs['job_id'] = job.id
+        self.events.publish(kwargs)
+
+    # --- 任务队列操作 ---
+
+    def enqueue(self, kind, priority=0, **params):
+        job = DownloadJob(kind, params, priority)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._save_jobs()
+        self._emit('job', job=job, state=job.state, message=f"任务已加入队列: {job.id}")
+        self._schedule()
+        return job
+
+    def list_jobs(self):
+        with self._lock:
+            jobs = sorted(self.jobs.values(), key=self._queue_key)
+            return [j.to_dict() for j in jobs]
+
+    def pause(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job.state not in (QUEUED, RUNNING):
+                return False, "任务不存在或无法暂停"
+            job.resume_event.clear()
+            # 运行中的任务保持占用运行槽位，只是不再处理新的歌曲
+            if job.state == QUEUED:
+                job.state = PAUSED
+            job.message = "已暂停"
+            self._save_jobs()
+        self._emit('job', job=job, state=job.state, message=f"任务已暂停: {job_id}")
+        return True, "任务已暂停"
+
+    def resume(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job.state in FINISHED_STATES or job.resume_event.is_set():
+                return False, "任务不存在或未暂停"
+            job.resume_event.set()
+            if job.state == PAUSED:
+                job.state = QUEUED
+            job.message = ''
+            self._save_jobs()
+        self._emit('job', job=job, state=job.state, message=f"任务已继续: {job_id}")
+        self._schedule()
+        return True, "任务已继续"
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job.state in FINISHED_STATES:
+                return False, "任务不存在或已结束"
+            job.stop_event.set()
+            # 唤醒暂停中的工作线程，使其尽快退出
+            job.resume_event.set()
+            if job.state != RUNNING:
+                job.state = STOPPED
+                job.message = "已取消"
+                self._save_jobs()
+        self._emit('job', job=job, state=job.state, message=f"正在取消任务: {job_id}")
+        return True, "取消信号已发送"
+
+    def set_priority(self, job_id, priority):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job.state in FINISHED_STATES:
+                return False, "任务不存在或已结束"
+            job.priority = int(priority)
+            self._save_jobs()
+        self._schedule()
+        return True, "优先级已更新"
+
+    # --- 兼容原有单任务接口 ---
+
+    def start_task(self, priority=0, **kwargs):
+        job = self.enqueue(kwargs.get('parse_type', 'playlist'), priority, **kwargs)
+        return True, f"下载任务已加入队列 (ID: {job.id})"
+
+    def retry_task(self, priority=0, **kwargs):
+        last = self.last_job
+        if not last or not last.playlist_dir:
+            return False, "无法找到上次下载目录"
+        kwargs['playlist_dir'] = last.playlist_dir
+        kwargs['save_dir'] = last.save_dir
+        job = self.enqueue('retry', priority, **kwargs)
+        return True, f"重试任务已加入队列 (ID: {job.id})"
+
+    def stop(self):
+        running = [j.id for j in self.jobs.values() if j.state == RUNNING]
+        if not running:
+            return False, "当前无任务运行"
+        for job_id in running:
+            self.cancel(job_id)
+        self._emit('log', message="正在请求停止下载...")
+        return True, "停止信号已发送"
+
+    # --- 调度 ---
+
+    def start(self):
+        """开始调度，恢复上次退出时未完成的任务"""
+        self._schedule()
+
+    @staticmethod
+    def _queue_key(job):
+        return (-job.priority, job.order)
+
+    def _schedule(self):
+        with self._lock:
+            running = sum(1 for j in self.jobs.values() if j.state == RUNNING)
+            queued = sorted((j for j in self.jobs.values() if j.state == QUEUED), key=self._queue_key)
+            for job in queued[:max(0, self.max_concurrent_jobs - running)]:
+                job.state = RUNNING
+                threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+            self._save_jobs()
+
+    def _run_job(self, job):
+        self.budget.register(job.id)
+        self._emit('job', job=job, state=RUNNING, message=f"任务开始运行: {job.id}")
+        try:
+            params = dict(job.params)
+            if job.kind == 'retry':
+                self._run_retry_download(job, **params)
+            elif job.kind == LYRICS_JOB:
+                self._run_lyrics_rebuild(job, **params)
+            else:
+                self._run_new_download(job, **params)
+            if job.state == RUNNING:
+                job.state = STOPPED if job.stop_event.is_set() else DONE
+        except Exception as e:
+            job.state = ERROR
+            job.message = str(e)
+        finally:
+            self.budget.unregister(job.id)
+            with self._lock:
+                # 重试只针对下载任务，歌词重建不覆盖上次的下载任务
+                if job.kind != LYRICS_JOB:
+                    self.last_job = job
+                self._prune_jobs()
+                self._save_jobs()
+            self._schedule()
+
+    # --- 持久化 ---
+
+    def _save_jobs(self):
+        if not self.journal:
+            return
+        with self._lock:
+            for job in self.jobs.values():
+                self.journal.save_job(job.to_dict(with_params=True))
+
+    def _load_jobs(self):
+        if not self.journal:
+            return
+        for item in self.journal.load_jobs():
+            job = DownloadJob.from_dict(item)
+            # 上次退出时仍在运行的任务重新排队，运行时从日志中的状态继续
+            if job.state == RUNNING:
+                job.state = QUEUED
+            if job.state == PAUSED:
+                job.resume_event.clear()
+            if job.state in FINISHED_STATES:
+                job.failed_songs = self.journal.failed_tracks(job.id)
+                if job.kind != LYRICS_JOB:
+                    self.last_job = job
+            self.jobs[job.id] = job
+
+    def _prune_jobs(self):
+        finished = sorted((j for j in self.jobs.values() if j.state in FINISHED_STATES), key=lambda j: j.order)
+        for job in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self.jobs[job.id]
+            if self.journal:
+                self.journal.delete_job(job.id)
+
+    # --- 内部逻辑 ---
+
+    def _run_new_download(self, job, save_dir, playlist_url, parse_type, quality, dl_lyrics, dl_trans, api, sync=False, archive_removed=False, engine=DEFAULT_ENGINE):
+        try:
+            # 中断后恢复的任务直接使用日志中保存的解析结果
+            data = self.journal.get_source(job.id) if self.journal else None
+            resumed = data is not None
+            if resumed:
+                self._emit('log', job=job, message="从任务日志恢复，继续上次未完成的下载...")
+            else:
+                self._emit('log', job=job, message="正在解析链接信息...")
+                data = parse_music_source(parse_type, playlist_url)
+                if self.journal:
+                    self.journal.set_source(job.id, data)
+
+            # --- 关键重构点：识别数据结构 ---
+            base = Path(save_dir)
+            if 'tracks' in data:
+                # 歌单/专辑模式
+                tracks = data['tracks']
+                pl_name = sanitize_filename(data.get('name') or f"PL_{int(time.time())}")
+                sub = 'album' if parse_type == 'album' else 'playlist'
+                dest_dir = base / sub / pl_name
+            else:
+                # 单曲模式：data 只有 {'id': 'xxx'}
+                tracks = [data] # 包装成列表方便循环，但字典里没 name
+                dest_dir = base / 'songs'
+
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            job.playlist_dir = str(dest_dir)
+            job.save_dir = str(base)
+
+            self._emit('log', job=job, message=f"保存目录: {dest_dir.name}")
+            self._emit('log', job=job, message=f"解析成功: 共 {len(tracks)} 首歌曲")
+
+            # 增量同步的差异已在首次运行时计算并登记到日志（可能为空）；登记之前中断的重新计算
+            planned = self.journal.planned_tracks(job.id) if resumed else None
+            if planned is not None:
+                tracks = planned
+            elif sync and 'tracks' in data:
+                tracks = self._sync_tracks(job, base, dest_dir, pl_name, tracks, archive_removed)
+
+            self._process_common_download(job, base, dest_dir, tracks, quality, dl_lyrics, dl_trans, api, engine)
+
+            # 如果是歌单，保存一下 JSON 供后续排序使用
+            if 'tracks' in data and not job.stop_event.is_set():
+                (dest_dir / f"{pl_name}.json").write_text(
+                    json.dumps(data, ensure_ascii=False, indent=4), encoding='utf-8'
+                )
+
+        except Exception as e:
+            job.state = ERROR
+            job.message = str(e)
+            self._emit('error', job=job, message=f"下载任务出错: {e}")
+
+    def _sync_tracks(self, job, save_root, dest_dir, pl_name, tracks, archive_removed):
+        """增量同步：与上次保存的歌单对比，只返回需要下载的歌曲，可选归档已移除的歌曲"""
+        library = open_library(save_root)
+        previous = load_playlist_json(dest_dir / f"{pl_name}.json").get('tracks', [])
+        delta = diff_playlist(dest_dir, tracks, previous, library)
+        archived = archive_tracks(dest_dir, delta['removed'], library) if archive_removed else 0
+
+        self._emit('sync', job=job, added=len(delta['added']), removed=len(delta['removed']),
+                   unchanged=delta['unchanged'], archived=archived)
+        self._emit('log', job=job, message=(f"增量同步: 新增 {len(delta['added'])} 首, 移除 {len(delta['removed'])} 首"
+                                            f"{f' (已归档 {archived} 首)' if archive_removed else ''}, 无变化 {delta['unchanged']} 首"))
+        return delta['added']
+
+    def _run_retry_download(self, job, save_dir, playlist_dir, songs_to_retry, quality, dl_lyrics, dl_trans, api, engine=DEFAULT_ENGINE):
+        try:
+            self._emit('log', job=job, message=f"开始重试下载 {len(songs_to_retry)} 首歌曲...")
+            self._process_common_download(job, Path(save_dir), Path(playlist_dir), songs_to_retry, quality, dl_lyrics, dl_trans, api, engine)
+        except Exception as e:
+            job.state = ERROR
+            job.message = str(e)
+            self._emit('error', job=job, message=f"重试任务出错: {e}")
+
+    def _run_lyrics_rebuild(self, job, save_dir, translated=False, romanized=False, playlists=None):
+        """遍历保存根目录下的歌单，按新的选项重新生成所有歌曲的 .lrc，歌词优先从歌词缓存读取"""
+        try:
+            save_root = Path(save_dir)
+            targets, missing = collect_targets(save_root, playlists, open_library(save_root))
+            total = len(targets)
+            self._emit('log', job=job, message=(f"开始重建歌词，共 {total} 首歌曲"
+                                                f"{f'，{missing} 首找不到音频文件' if missing else ''}"))
+            lyrics_cache = open_lyrics_cache(save_root)
+            fetch = lambda song_id: lyrics_cache.get(song_id, api_lyrics)
+
+            def run(target):
+                job.resume_event.wait()
+                if job.stop_event.is_set():
+                    return None
+                return rebuild_track(target, fetch, translated, romanized)
+
+            counts = Counter()
+            with ThreadPoolExecutor(max_workers=REBUILD_WORKERS, thread_name_prefix='lyrics-rebuild') as pool:
+                futures = {pool.submit(run, t): t for t in targets}
+                for i, future in enumerate(as_completed(futures), 1):
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        status = 'failed'
+                        self._emit('log', job=job, message=f"✗ 写入歌词失败: {futures[future]['lrc_path'].name} ({e})")
+                    if status:
+                        counts[status] += 1
+                    job.progress = (i / total) * 100
+                    self._emit('progress', job=job, progress=job.progress, status_text=f"重建歌词: {i}/{total}")
+
+            evt = 'stopped' if job.stop_event.is_set() else 'done'
+            msg = (f"歌词重建{'停止' if evt == 'stopped' else '完成'}。写入: {counts['written']}, "
+                   f"未变化: {counts['unchanged']}, 无歌词: {counts['no_lyrics']}, 失败: {counts['failed']}")
+            job.message = msg
+            self._emit(evt, job=job, message=msg, failed_count=counts['failed'],
+                       success_count=counts['written'] + counts['unchanged'], written=counts['written'],
+                       unchanged=counts['unchanged'], no_lyrics=counts['no_lyrics'], missing_audio=missing)
+        except Exception as e:
+            job.state = ERROR
+            job.message = str(e)
+            self._emit('error', job=job, message=f"重建歌词出错: {e}")
+
+    def _gated(self, job, func, budgeted=False, stage_index=None):
+        """
+        包装阶段函数：任务暂停时等待；budgeted 为 True 时占用一个全局并发额度。
+        stage_index 不为空时，跳过从日志恢复时已完成的阶段，并在阶段完成后记录到日志。
+        """
+        def run(ctx):
+            job.resume_event.wait()
+            if stage_index is not None and ctx.get('resume_index', -1) >= stage_index:
+                return ctx
+            if budgeted:
+                self.budget.acquire(job.id)
+            try:
+                ctx = func(ctx)
+            finally:
+                if budgeted:
+                    self.budget.release(job.id)
+            # 第一个阶段从日志恢复的歌曲已处于更后面的状态，不能再记回该阶段
+            if (stage_index is not None and self.journal and not ctx.get('result')
+                    and ctx.get('resume_index', -1) < stage_index):
+                self.journal.mark(job.id, ctx['song_id'], STAGE_STATES[stage_index], _journal_detail(ctx))
+            return ctx
+        return run
+
+    def _resolve_or_resume(self, job, downloader, api, states, resolve=True):
+        """
+        第一个阶段：日志中已完成传输的歌曲直接恢复上下文，其余正常解析。
+        resolve 为 False 时只做本地预检，下载地址由调用方（asyncio 引擎）解析。
+        """
+        def run(t):
+            state, detail = states.get(str(t['id']), (None, None))
+            if state in (TRANSFERRED, TAGGED) and detail and Path(detail['audio_path']).exists():
+                return {
+                    'song_id': str(t['id']), 'songs': detail['songs'], 'filename_base': detail['filename_base'],
+                    'audio_path': Path(detail['audio_path']), 'level': detail.get('level'), 'result': None,
+                    'resume_index': STAGE_STATES.index(state),
+                }
+            # 批量获取详情失败（仍没有 'name'）时传 None，由 downloader 再单独尝试获取
+            track_info = t if 'name' in t else None
+            if not resolve:
+                return downloader.precheck_song(str(t['id']), track_info)
+            return downloader.resolve_song(str(t['id']), api, track_info)
+        return run
+
+    def _mark_stage(self, job):
+        """asyncio 引擎的阶段完成回调：与线程流水线一样记录到任务日志"""
+        def mark(ctx, stage_index):
+            if self.journal:
+                self.journal.mark(job.id, ctx['song_id'], STAGE_STATES[stage_index], _journal_detail(ctx))
+        return mark
+
+    def _build_engine(self, job, engine, downloader, states, dl_lyrics, dl_trans, api):
+        """按任务选择的引擎构建执行器，两者的 run(items) 产出相同的 (item, ctx, error)"""
+        if engine == 'async':
+            if async_engine.is_available():
+                return async_engine.AsyncEngine(
+                    downloader, api, dl_lyrics, dl_trans,
+                    prepare=self._resolve_or_resume(job, downloader, api, states, resolve=False),
+                    on_stage=self._mark_stage(job), stop_event=job.stop_event, resume_event=job.resume_event,
+                    acquire_slot=lambda: self.budget.acquire(job.id), release_slot=lambda: self.budget.release(job.id),
+                )
+            self._emit('log', job=job, message="未安装 aiohttp，改用多线程引擎")
+        return StagedPipeline([
+            Stage('resolve', self._gated(job, self._resolve_or_resume(job, downloader, api, states), stage_index=0),
+                  STAGE_WORKERS['resolve']),
+            Stage('transfer', self._gated(job, downloader.transfer_song, budgeted=True, stage_index=1), STAGE_WORKERS['transfer']),
+            Stage('tag', self._gated(job, downloader.tag_song, stage_index=2), self.tagger.workers),
+            Stage('lyrics', self._gated(job, lambda ctx: downloader.lyrics_song(ctx, dl_lyrics, dl_trans)), STAGE_WORKERS['lyrics']),
+        ], queue_size=STAGE_QUEUE_SIZE, stop_event=job.stop_event)
+
+    def _prefetch_lyrics(self, job, downloader, tracks, finished):
+        """
+        在后台线程中预取歌词，任务结束或停止后不再发起新的请求。
+        预检会跳过或从曲库链接的歌曲不会获取歌词，不预取。
+        """
+        def run():
+            song_ids = [t['id'] for t in tracks if downloader.needs_download(t)]
+            count = downloader.lyrics_cache.prefetch(song_ids, api_lyrics,
+                                                     should_stop=lambda: finished.is_set() or job.stop_event.is_set())
+            if count and not finished.is_set():
+                self._emit('log', job=job, message=f"已预取 {count} 首歌曲的歌词")
+
+        threading.Thread(target=run, name=f"lyrics-prefetch-{job.id}", daemon=True).start()
+
+    def _process_common_download(self, job, save_root, dest_dir, tracks, quality, dl_lyrics, dl_trans, api, engine=DEFAULT_ENGINE):
+        job_metrics = metrics.JobMetrics()
+        lyrics_cache = open_lyrics_cache(save_root) if dl_lyrics else None
+        downloader = MusicDownloader(dest_dir, quality, api, library=open_library(save_root), tagger=self.tagger,
+                                     metrics=job_metrics, lyrics_cache=lyrics_cache, cover_cache=open_cover_cache(save_root))
+        total = len(tracks)
+        results = []
+        done_cnt = 0
+
+        # 从日志恢复：已有最终结果的歌曲不再处理
+        states = {}
+        if self.journal:
+            self.journal.plan(job.id, tracks)
+            states = self.journal.track_states(job.id)
+            finished = {tid for tid, (state, _) in states.items() if state in FINAL_STATES}
+            if finished:
+                for t in tracks:
+                    if str(t['id']) in finished:
+                        state = states[str(t['id'])][0]
+                        results.append(state)
+                        if state == 'failed':
+                            job.failed_songs.append(t)
+                done_cnt = len(results)
+                tracks = [t for t in tracks if str(t['id']) not in finished]
+                self._emit('log', job=job, message=f"已跳过上次完成的 {done_cnt} 首歌曲")
+
+        # 只有当字典里有 'name' 时，才认为元数据完整
+        # 缺少 'name' 的歌曲（如单曲模式、精简的重试数据）统一批量获取详情
+        pending_ids = [str(t['id']) for t in tracks if 'name' not in t]
+        if pending_ids:
+            self._emit('log', job=job, message=f"正在批量获取 {len(pending_ids)} 首歌曲的详情...")
+            details = SongDetailResolver().resolve(pending_ids)
+            tracks = [{**t, **details[str(t['id'])]} if details.get(str(t['id'])) else t for t in tracks]
+
+        pipeline = self._build_engine(job, engine, downloader, states, dl_lyrics, dl_trans, api)
+        processed = 0
+        pipeline_done = threading.Event()
+        if lyrics_cache and self.prefetch_lyrics and tracks:
+            self._prefetch_lyrics(job, downloader, tracks, pipeline_done)
+
+        for i, (original_track, ctx, error) in enumerate(pipeline.run(tracks), done_cnt + 1):
+            if error is not None:
+                job.failed_songs.append(original_track)
+                metrics.SONGS.inc(status='failed')
+                self._emit('log', job=job, message=f"✗ 线程异常: {error}")
+                if self.journal:
+                    self.journal.mark(job.id, original_track['id'], 'failed')
+            else:
+                status, fname, sid = ctx['result']
+                metrics.SONGS.inc(status=status)
+                if self.journal:
+                    self.journal.mark(job.id, original_track['id'], status)
+
+                # 确定显示用的名称
+                if fname:
+                    log_name = fname
+                elif 'name' in original_track:
+                    log_name = f"{original_track['name']} - {original_track.get('ar', 'Unknown')}"
+                else:
+                    log_name = f"ID: {sid}"
+
+                if ctx.get('tag_error'):
+                    self._emit('log', job=job, message=f"⚠ 元数据写入失败: {log_name} ({ctx['tag_error']})")
+
+                if status == 'failed':
+                    # 记录失败时，如果原数据不全，尝试更新（便于前端显示）
+                    job.failed_songs.append(original_track)
+                    self._emit('log', job=job, message=f"✗ 下载失败: {log_name}")
+                else:
+                    icon = "✓" if status == 'downloaded' else "→"
+                    self._emit('log', job=job, message=f"{icon} {status}: {log_name}")
+
+                results.append(status)
+
+            processed += 1
+            job.progress = (i / total) * 100
+            self._emit('progress', job=job, progress=job.progress, status_text=f"进度: {i}/{total}")
+
+        pipeline_done.set()
+        success_cnt = len(results) - results.count('failed')
+        fail_cnt = len(job.failed_songs)
+        evt = 'stopped' if job.stop_event.is_set() else 'done'
+        msg = f"任务{'停止' if evt=='stopped' else '完成'}。成功: {success_cnt}, 失败: {fail_cnt}"
+        job.message = msg
+
+        # 本次运行的阶段耗时汇总（不含从日志恢复时跳过的歌曲）
+        summary = job_metrics.summary(processed)
+        self._emit('log', job=job, message=(f"耗时 {summary['elapsed']:.1f} 秒, {summary['songs_per_sec']:.2f} 首/秒, "
+                                            f"{summary['mb_per_sec']:.2f} MB/秒"))
+        self._emit(evt, job=job, message=msg, has_failed=(fail_cnt > 0),
+                   failed_count=fail_cnt, success_count=success_cnt, metrics=summary)
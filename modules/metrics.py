@@ -0,0 +1,193 @@
+# modules/metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 指标名前缀
+PREFIX = 'ncmtools'
+# 耗时直方图的分桶上限（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help_text
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器，按标签分别计数"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [f"{self.name}{_format_labels(k)} {v}" for k, v in values.items()]
+
+
+class Gauge(_Metric):
+    """当前值。除直接设置外，可以登记取值函数（如队列长度），导出时才计算，同一标签的多个函数求和"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self._values = {}
+        self._sources = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def track(self, func, **labels):
+        """登记取值函数，返回用于 untrack 的标识"""
+        token = object()
+        with self._lock:
+            self._sources[token] = (tuple(sorted(labels.items())), func)
+        return token
+
+    def untrack(self, token):
+        with self._lock:
+            self._sources.pop(token, None)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+            sources = list(self._sources.values())
+        for key, func in sources:
+            try:
+                values[key] = values.get(key, 0) + func()
+            except Exception:
+                continue
+        return self._header() + [f"{self.name}{_format_labels(k)} {v}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    """分桶直方图，记录耗时分布以及总和、次数"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [各桶计数（最后一个为 +Inf）, 总和, 次数]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = {k: ([*v[0]], v[1], v[2]) for k, v in self._values.items()}
+        lines = self._header()
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+_registry = []
+
+
+def render() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- 进程内的指标 ---
+STAGE_SECONDS = Histogram('stage_seconds', '各下载阶段的耗时（秒）')
+BYTES_TRANSFERRED = Counter('bytes_transferred_total', '下载的音频字节数')
+SONGS = Counter('songs_total', '处理完成的歌曲数（按结果）')
+PROVIDER_REQUESTS = Counter('provider_requests_total', '下载地址接口的请求次数（按接口与结果）')
+PROVIDER_SECONDS = Histogram('provider_seconds', '下载地址接口的响应耗时（秒）')
+QUEUE_DEPTH = Gauge('pipeline_queue_depth', '流水线各阶段等待处理的歌曲数')
+JOBS_RUNNING = Gauge('jobs_running', '正在运行的下载任务数')
+LYRICS_CACHE = Counter('lyrics_cache_total', '歌词缓存查询次数（hit 命中, miss 未命中, stale 刷新失败时使用过期歌词）')
+
+
+class JobMetrics:
+    """
+    单个下载任务的阶段耗时与传输量统计。记录的同时计入进程级指标，
+    任务结束时用 summary() 汇总到 done 事件中。
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes = 0
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+    def observe(self, stage, seconds):
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def add_bytes(self, n):
+        if n:
+            BYTES_TRANSFERRED.inc(n)
+            with self._lock:
+                self.bytes += n
+
+    def summary(self, songs=0) -> dict:
+        """{'elapsed', 'songs_per_sec', 'mb_per_sec', 'bytes', 'stages': {阶段: {count, total, avg, max}}}"""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        with self._lock:
+            stages = {
+                name: {'count': n, 'total': round(total, 3), 'avg': round(total / n, 3) if n else 0, 'max': round(peak, 3)}
+                for name, (n, total, peak) in self._stages.items()
+            }
+            transferred = self.bytes
+        return {
+            'elapsed': round(elapsed, 3),
+            'songs_per_sec': round(songs / elapsed, 3),
+            'mb_per_sec': round(transferred / elapsed / 1024 / 1024, 3),
+            'bytes': transferred,
+            'stages': stages,
+        }
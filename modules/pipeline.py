@@ -0,0 +1,102 @@
+# modules/pipeline.py
+import queue
+import threading
+
+from . import metrics
+
+# 结束标记：上游阶段全部完成后，向下游每个工作线程各投递一个
+_DONE = object()
+
+
+class Stage:
+    """流水线中的一个阶段：func(ctx) -> ctx，workers 为该阶段的并发数"""
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+
+
+class StagedPipeline:
+    """
+    分阶段的多线程流水线。
+    每个阶段有独立的工作线程数，阶段之间使用有界队列连接，
+    下游处理不过来时上游会被阻塞（背压），避免积压过多中间结果。
+
+    第一个阶段接收提交的原始 item，返回上下文字典 ctx；之后的阶段接收并返回 ctx。
+    如果 ctx['result'] 已被设置，说明该任务已得出最终结果，会跳过剩余阶段直接输出。
+    """
+    def __init__(self, stages, queue_size=32, stop_event=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stop_event = stop_event or threading.Event()
+
+    def run(self, items):
+        """
+        提交 items 并按完成顺序逐个产出 (item, ctx, error)，阶段抛出的异常通过 error 返回。
+        """
+        items = list(items)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = queue.Queue()
+
+        feeder = threading.Thread(target=self._feed, args=(items, queues[0], self.stages[0].workers), daemon=True)
+        feeder.start()
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threading.Thread(
+                    target=self._work, args=(index, queues, results, remaining, lock), daemon=True
+                ).start()
+
+        # 各阶段队列中等待的歌曲数，导出指标时读取
+        depths = [metrics.QUEUE_DEPTH.track(q.qsize, stage=stage.name) for q, stage in zip(queues, self.stages)]
+        try:
+            received = 0
+            while received < len(items) and not self.stop_event.is_set():
+                try:
+                    outcome = results.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                received += 1
+                yield outcome
+        finally:
+            for token in depths:
+                metrics.QUEUE_DEPTH.untrack(token)
+
+    def _feed(self, items, first_queue, workers):
+        for item in items:
+            if self.stop_event.is_set():
+                break
+            first_queue.put((item, item))
+        for _ in range(workers):
+            first_queue.put(_DONE)
+
+    def _work(self, index, queues, results, remaining, lock):
+        stage = self.stages[index]
+        in_queue = queues[index]
+        is_last = index == len(self.stages) - 1
+        while True:
+            task = in_queue.get()
+            if task is _DONE:
+                break
+            item, payload = task
+            if self.stop_event.is_set():
+                # 停止后只消费不处理，让上游尽快退出
+                continue
+            try:
+                ctx = stage.func(payload)
+            except Exception as e:
+                results.put((item, None, e))
+                continue
+            if ctx.get('result') or is_last:
+                results.put((item, ctx, None))
+            else:
+                queues[index + 1].put((item, ctx))
+
+        # 本阶段所有线程结束后，通知下游阶段结束
+        with lock:
+            remaining[0] -= 1
+            last_worker = remaining[0] == 0
+        if last_worker and not is_last:
+            for _ in range(self.stages[index + 1].workers):
+                queues[index + 1].put(_DONE)
@@ -0,0 +1,179 @@
+# modules/ratelimit.py
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# --- 按主机的限速配置 ---
+# 每秒请求数与突发上限；未单独配置的主机（如音频 CDN）使用默认值，None 表示不限速，只做自适应并发控制
+DEFAULT_RATE = None
+DEFAULT_BURST = None
+HOST_RATES = {
+    # 落月API 对请求频率较敏感，远早于 CDN 开始返回错误
+    'api.vkeys.cn': (3.0, 5),
+    'api.bugpk.com': (5.0, 10),
+    'music.meorion.moe': (5.0, 10),
+    'iwenwiki.com': (5.0, 10),
+    'music.163.com': (20.0, 40),
+}
+
+# --- 自适应并发 (AIMD) 配置 ---
+INITIAL_CONCURRENCY = 8
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+# 响应耗时（秒，到收到响应头为止）低于该值时视为健康，逐步提高并发
+LATENCY_TARGET = 5.0
+# 两次降低并发之间的最小间隔（秒），避免同一批并发失败把并发连续减半多次
+DECREASE_INTERVAL = 2.0
+
+# 协程等待并发名额时的轮询间隔（秒）
+ASYNC_POLL_INTERVAL = 0.05
+
+# --- 重试退避 ---
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+def backoff(attempt: int, retry_after=None) -> float:
+    """第 attempt 次重试前的等待秒数：优先使用服务器的 Retry-After，否则指数退避加随机抖动"""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except (TypeError, ValueError):
+            pass
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+def is_throttled(status_code) -> bool:
+    """429 和 5xx 视为服务器过载"""
+    return status_code == 429 or status_code >= 500
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒 的速度补充令牌，最多积累 burst 个"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 先预占令牌（可以为负），再在锁外等待，保证等待的线程按顺序获得令牌
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AIMDController:
+    """加性增、乘性减的并发控制：健康时每轮约 +1，出现 429/5xx/超时时减半"""
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self._limit = float(initial)
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            if ok and latency <= LATENCY_TARGET:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            elif not ok:
+                now = time.monotonic()
+                if now - self._last_decrease >= DECREASE_INTERVAL:
+                    self._limit = max(self.minimum, self._limit / 2)
+                    self._last_decrease = now
+
+
+class HostLimiter:
+    """单个主机的限速器：令牌桶控制请求速率，AIMD 控制同时在途的请求数"""
+    def __init__(self, host, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.controller = AIMDController()
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        if self.bucket:
+            self.bucket.acquire()
+        with self._cond:
+            self._cond.wait_for(lambda: self.in_flight < self.controller.limit)
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """acquire 的协程版本，等待期间不阻塞事件循环"""
+        if self.bucket:
+            await self.bucket.acquire_async()
+        while True:
+            with self._cond:
+                if self.in_flight < self.controller.limit:
+                    self.in_flight += 1
+                    return
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, ok: bool, latency: float):
+        self.requests += 1
+        if not ok:
+            self.throttled += 1
+        self.controller.record(ok, latency)
+        # 并发上限可能已提高，唤醒等待的线程
+        with self._cond:
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        return {
+            'concurrency': self.controller.limit,
+            'in_flight': self.in_flight,
+            'rate': self.bucket.rate if self.bucket else None,
+            'burst': self.bucket.burst if self.bucket else None,
+            'requests': self.requests,
+            'throttled': self.throttled,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def for_url(url: str) -> HostLimiter:
+    """获取 URL 所属主机的限速器"""
+    host = urlparse(url).hostname or ''
+    with _limiters_lock:
+        if host not in _limiters:
+            rate, burst = HOST_RATES.get(host, (DEFAULT_RATE, DEFAULT_BURST))
+            _limiters[host] = HostLimiter(host, rate, burst)
+        return _limiters[host]
+
+
+def snapshot() -> dict:
+    """所有主机当前的限速与并发状态"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {lim.host: lim.snapshot() for lim in limiters}
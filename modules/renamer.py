@@ -0,0 +1,218 @@
+# modules/renamer.py
+import json
+import os
+import uuid
+from pathlib import Path
+
+# 重命名日志文件名，存放在歌单目录下，操作完成后删除
+# （内容为 JSON，但不使用 .json 后缀，避免被当作歌单 JSON 文件读取）
+JOURNAL_NAME = '.rename-journal'
+# 已排序文件记录
+SORTED_NAME = '.sorted'
+# 上次排序的 歌曲ID -> 音频文件名，与 .sorted 一起写入和删除
+SORT_MAP_NAME = '.sort-map'
+# 暂存阶段使用的临时文件名后缀（不是音频扩展名，扫描目录时会被忽略）
+TEMP_SUFFIX = '.renaming'
+
+# 日志状态：暂存中 -> 提交中 -> 完成（删除日志）；出错时 回滚中 -> 恢复原名中
+STAGING, COMMITTING, ROLLING_BACK, RESTORING = 'staging', 'committing', 'rolling_back', 'restoring'
+
+
+def load_sort_map(directory) -> dict:
+    """读取上次排序记录的 {歌曲ID: 音频文件名}，没有记录时返回空字典"""
+    try:
+        data = json.loads((Path(directory) / SORT_MAP_NAME).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class RenameJournal:
+    """
+    目录内的批量重命名，分两阶段执行并记录在日志文件中：
+    先把所有源文件改为临时名（暂存），全部成功后再改为目标名（提交），
+    最后更新曲库索引和 .sorted 记录。暂存阶段出错或中断时全部恢复原名；
+    进入提交阶段后中断，下次 recover() 继续完成提交。每一步都可以重复执行，
+    文件名互换、只改大小写以及中途失败都不会留下改了一半的目录。
+    """
+    def __init__(self, directory, library=None):
+        self.directory = Path(directory)
+        self.library = library
+        self.path = self.directory / JOURNAL_NAME
+
+    # --- 计划 ---
+
+    def plan(self, operations) -> tuple:
+        """
+        检查重命名操作 [(类型, 原路径, 新路径)]，类型为 'audio' 或 'lrc'。
+        返回 (可执行的操作列表, 跳过的操作 [(类型, 原路径, 新路径, 原因)])。
+        目标已被其他文件占用、目标重名或源文件不存在的操作被跳过，
+        音频被跳过时同名的歌词也一并跳过。
+        """
+        ops, skipped, targets = [], [], set()
+        for kind, old_path, new_path in operations:
+            old_path, new_path = Path(old_path), Path(new_path)
+            if old_path.name == new_path.name:
+                continue
+            if not old_path.exists():
+                skipped.append((kind, old_path, new_path, "源文件不存在"))
+            elif new_path.name in targets:
+                skipped.append((kind, old_path, new_path, "目标文件名重复"))
+            else:
+                targets.add(new_path.name)
+                ops.append({'kind': kind, 'old': old_path.name, 'new': new_path.name})
+
+        # 目标文件存在且不会被移走时无法重命名；跳过后其原文件留在原处，可能又占用别的目标，重复检查
+        while True:
+            moving = {op['old'] for op in ops}
+            blocked = [op for op in ops if op['new'] not in moving and self._occupied(op)]
+            blocked_stems = {Path(op['old']).stem for op in blocked if op['kind'] == 'audio'}
+            blocked_stems |= {old_path.stem for kind, old_path, _, _ in skipped if kind == 'audio'}
+            blocked += [op for op in ops if op['kind'] == 'lrc' and op not in blocked
+                        and Path(op['old']).stem in blocked_stems]
+            if not blocked:
+                break
+            for op in blocked:
+                reason = "目标文件已存在" if self._occupied(op) else "对应的音频文件被跳过"
+                skipped.append((op['kind'], self.directory / op['old'], self.directory / op['new'], reason))
+            ops = [op for op in ops if op not in blocked]
+        return ops, skipped
+
+    def _occupied(self, op) -> bool:
+        new_path = self.directory / op['new']
+        if not new_path.exists():
+            return False
+        # 大小写不敏感的文件系统上只改大小写时，目标就是源文件本身
+        try:
+            return not os.path.samefile(self.directory / op['old'], new_path)
+        except OSError:
+            return True
+
+    # --- 执行 ---
+
+    def execute(self, ops, sorted_names=None, sort_map=None) -> bool:
+        """
+        执行 plan() 返回的操作。sorted_names 不为 None 时在完成后写入 .sorted（空列表表示删除，
+        同时删除排序映射），sort_map 不为 None 时写入排序映射 {歌曲ID: 音频文件名}。
+        返回是否成功；失败时已全部恢复原名。
+        """
+        if not ops:
+            self._write_sorted(sorted_names, sort_map)
+            return True
+        token = uuid.uuid4().hex
+        for i, op in enumerate(ops):
+            op['tmp'] = f".{token[:8]}-{i}{TEMP_SUFFIX}"
+        entry = {'token': token, 'state': STAGING, 'ops': ops, 'sorted': sorted_names, 'sort_map': sort_map}
+        self._save(entry)
+        try:
+            for op in ops:
+                self._move(op['old'], op['tmp'])
+            entry['state'] = COMMITTING
+            self._save(entry)
+            for op in ops:
+                self._move(op['tmp'], op['new'])
+        except OSError as e:
+            print(f"重命名失败，恢复原文件名: {e}")
+            self._rollback(entry)
+            return False
+        self._finish(entry)
+        return True
+
+    def recover(self) -> str | None:
+        """
+        处理上次中断的重命名：暂存阶段中断的恢复原名，提交阶段中断的继续完成。
+        返回 'committed'、'rolled_back'、'failed'，没有未完成的日志时返回 None。
+        """
+        entry = self._load()
+        if entry is None:
+            return None
+        if entry['state'] == COMMITTING:
+            try:
+                for op in entry['ops']:
+                    if (self.directory / op['tmp']).exists():
+                        self._move(op['tmp'], op['new'])
+            except OSError as e:
+                print(f"继续完成上次的重命名失败，恢复原文件名: {e}")
+                return 'rolled_back' if self._rollback(entry) else 'failed'
+            self._finish(entry)
+            return 'committed'
+        return 'rolled_back' if self._rollback(entry) else 'failed'
+
+    def _rollback(self, entry) -> bool:
+        """恢复原名。失败时保留日志，下次 recover() 重试"""
+        ops = entry['ops']
+        if entry['state'] in (COMMITTING, ROLLING_BACK):
+            # 已提交的先移回临时名，全部移回后再恢复原名，避免互换文件名时相互覆盖
+            entry['state'] = ROLLING_BACK
+            self._save(entry)
+            for op in reversed(ops):
+                if not (self.directory / op['tmp']).exists() and (self.directory / op['new']).exists():
+                    try:
+                        self._move(op['new'], op['tmp'])
+                    except OSError as e:
+                        print(f"回滚失败: {op['new']}, 原因: {e}")
+                        return False
+        entry['state'] = RESTORING
+        self._save(entry)
+        ok = True
+        for op in reversed(ops):
+            if (self.directory / op['tmp']).exists():
+                try:
+                    self._move(op['tmp'], op['old'])
+                except OSError as e:
+                    print(f"恢复原文件名失败: {op['old']}, 原因: {e}")
+                    ok = False
+        if ok:
+            self.path.unlink(missing_ok=True)
+        return ok
+
+    def _finish(self, entry):
+        """文件已全部改名：更新曲库索引与 .sorted，删除日志"""
+        if self.library:
+            pairs = [(self.directory / op['old'], self.directory / op['new'])
+                     for op in entry['ops'] if op['kind'] == 'audio']
+            self.library.rename_batch(pairs, entry['token'])
+        self._write_sorted(entry.get('sorted'), entry.get('sort_map'))
+        self.path.unlink(missing_ok=True)
+
+    # --- 文件操作 ---
+
+    def _move(self, src_name, dst_name):
+        src, dst = self.directory / src_name, self.directory / dst_name
+        # os.rename 在 POSIX 上会直接覆盖已存在的目标
+        if dst.exists() and not os.path.samefile(src, dst):
+            raise FileExistsError(f"目标文件已存在: {dst_name}")
+        os.rename(src, dst)
+
+    def _write_sorted(self, names, sort_map=None):
+        if sort_map is not None:
+            self._write_atomic(self.directory / SORT_MAP_NAME, json.dumps(sort_map, ensure_ascii=False))
+        if names is None:
+            return
+        sorted_file = self.directory / SORTED_NAME
+        if not names:
+            sorted_file.unlink(missing_ok=True)
+            (self.directory / SORT_MAP_NAME).unlink(missing_ok=True)
+            return
+        self._write_atomic(sorted_file, ''.join(name + '\n' for name in names))
+
+    def _save(self, entry):
+        self._write_atomic(self.path, json.dumps(entry, ensure_ascii=False))
+
+    def _load(self):
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"读取重命名日志时出错: {e}")
+            return None
+
+    @staticmethod
+    def _write_atomic(path, text):
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
@@ -0,0 +1,154 @@
+# modules/resolver.py
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import metrics
+
+# --- 健康评分与熔断配置 ---
+# 指数滑动平均的权重，越大越看重最近的请求
+EWMA_ALPHA = 0.2
+# 连续失败次数达到阈值后熔断该接口
+FAILURE_THRESHOLD = 3
+# 熔断冷却时间（秒），到期后只允许一个试探请求，成功则恢复，失败则重新熔断
+COOLDOWN_SECONDS = 60
+# 首选接口超过该耗时（秒）仍未返回时，向次优接口发出对冲请求；None 表示不对冲
+HEDGE_AFTER = 3.0
+
+
+class ProviderStats:
+    """单个下载接口的滚动统计"""
+    def __init__(self):
+        self.latency = 1.0       # 平均耗时（秒）
+        self.success_rate = 1.0  # 平均成功率
+        self.failures = 0        # 连续失败次数
+        self.open_until = 0.0    # 熔断截止时间
+        self.probing = False     # 冷却结束后的试探请求是否在途
+        self.calls = 0
+
+    def record(self, ok: bool, elapsed: float):
+        self.calls += 1
+        self.probing = False
+        self.latency += EWMA_ALPHA * (elapsed - self.latency)
+        self.success_rate += EWMA_ALPHA * ((1.0 if ok else 0.0) - self.success_rate)
+        if ok:
+            self.failures = 0
+            self.open_until = 0.0
+        else:
+            self.failures += 1
+            if self.failures >= FAILURE_THRESHOLD:
+                self.open_until = time.monotonic() + COOLDOWN_SECONDS
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    @property
+    def half_open(self) -> bool:
+        """冷却已结束但尚未恢复：只允许一个试探请求"""
+        return self.failures >= FAILURE_THRESHOLD and not self.is_open
+
+    @property
+    def score(self) -> float:
+        return self.success_rate / max(self.latency, 0.05)
+
+
+class ProviderResolver:
+    """
+    在多个下载接口之间解析歌曲下载地址。
+    按健康评分依次尝试各接口（失败自动切换下一个），熔断中的接口不参与，
+    冷却结束后只放行一个试探请求；
+    可选地在首选接口响应过慢时并发请求次优接口，取先返回的有效结果。
+    """
+    def __init__(self, providers: dict, hedge_after=HEDGE_AFTER, max_workers=16):
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self.stats = {name: ProviderStats() for name in providers}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='resolver')
+
+    def ranked(self, preferred=None) -> list:
+        """
+        按健康程度排序的可用接口列表（不含熔断中的接口，待试探的接口排在最后）；
+        评分相同时用户选择的接口优先。
+        """
+        with self._lock:
+            available = [name for name in self.providers if not self.stats[name].is_open]
+            return sorted(
+                available,
+                key=lambda name: (self.stats[name].half_open, -self.stats[name].score, name != preferred),
+            )
+
+    def claim(self, name) -> bool:
+        """
+        发出请求前调用：熔断中或试探请求已在途时返回 False，调用方应跳过该接口；
+        冷却结束后第一个调用方获得试探资格，结果由 record() 记录。
+        """
+        with self._lock:
+            st = self.stats[name]
+            if st.is_open or (st.half_open and st.probing):
+                return False
+            if st.half_open:
+                st.probing = True
+            return True
+
+    def snapshot(self) -> dict:
+        """各接口当前统计信息"""
+        with self._lock:
+            return {
+                name: {
+                    'latency': round(st.latency, 3),
+                    'success_rate': round(st.success_rate, 3),
+                    'failures': st.failures,
+                    'open': st.is_open,
+                    'half_open': st.half_open,
+                    'calls': st.calls,
+                }
+                for name, st in self.stats.items()
+            }
+
+    def record(self, name, ok: bool, elapsed: float):
+        """记录一次接口调用结果（供不经过 resolve 的调用方，如异步下载引擎使用）"""
+        with self._lock:
+            self.stats[name].record(ok, elapsed)
+        metrics.PROVIDER_REQUESTS.inc(provider=name, result='ok' if ok else 'failed')
+        metrics.PROVIDER_SECONDS.observe(elapsed, provider=name)
+
+    def _call(self, name, song_id, level):
+        start = time.monotonic()
+        try:
+            result = self.providers[name](song_id, level)
+        except Exception:
+            result = None
+        ok = bool(result and result.get('url'))
+        self.record(name, ok, time.monotonic() - start)
+        if ok:
+            result['provider'] = name
+            return result
+        return None
+
+    def resolve(self, song_id, level, preferred=None, failover=True):
+        """
+        解析下载地址，返回接口结果字典（附带 'provider' 字段），全部失败时返回 None。
+        failover=False 时只尝试 preferred 指定的接口。
+        """
+        if not failover:
+            return self._call(preferred, song_id, level) if preferred in self.providers else None
+
+        order = self.ranked(preferred)
+        pending = set()
+        while order or pending:
+            # 同时最多两个请求在途：当前接口 + 一个对冲请求
+            if order and len(pending) < 2:
+                name = order.pop(0)
+                if not self.claim(name):
+                    continue
+                pending.add(self._executor.submit(self._call, name, song_id, level))
+            # 还能发出对冲请求时只等待 hedge_after 秒，超时后下一轮向次优接口发出请求
+            hedge = order and len(pending) < 2 and self.hedge_after is not None
+            done, pending = wait(pending, timeout=self.hedge_after if hedge else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result:
+                    return result
+        return None
@@ -2,13 +2,120 @@ import os
 import json
 import re
 import difflib
+from collections import Counter, defaultdict
 from pathlib import Path
+from .renamer import RenameJournal, load_sort_map
 from .utils import sanitize_filename
+
+# 模糊匹配的相似度阈值（difflib ratio）
+MATCH_CUTOFF = 0.6
+# 通过三元组倒排索引预先比较的候选文件数，用于尽早得到较高的分数来排除其余文件
+MATCH_CANDIDATES = 64
+# 出现在超过该比例文件中的三元组区分度太低（如 " - "），不用于筛选候选
+COMMON_GRAM_RATIO = 0.5
+
+
+def _trigrams(text: str) -> set:
+    text = f" {text.lower()} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _common_chars(char_counts: tuple, counts: dict) -> int:
+    """两个字符串共有的字符数（按多重集合计），与 SequenceMatcher.quick_ratio 的计算相同"""
+    get = counts.get
+    return sum([n if n < get(ch, 0) else get(ch, 0) for ch, n in char_counts])
+
+
+class FilenameMatcher:
+    """
+    歌曲标题 -> 本地文件名 的匹配索引，结果与 difflib.get_close_matches(n=1) 逐个比较全部文件相同
+    （分数最高者，同分时取文件名较大者）。
+    先比较三元组倒排索引选出的候选及去掉编号前缀后同名的文件，得到当前最高分；
+    其余文件按长度分组，只有 difflib 的分数上界（与 real_quick_ratio / quick_ratio 相同）
+    能超过当前最高分时才计算 ratio，避免每首歌都与目录中的全部文件完整比较。
+    """
+    def __init__(self, audio_files: dict, number_pattern):
+        # 与调用方共用的 {文件名无扩展名: 扩展名}，匹配成功后由 remove() 删除
+        self.audio_files = audio_files
+        self._stripped = defaultdict(list)
+        self._postings = defaultdict(set)
+        self._by_length = defaultdict(set)
+        self._char_counts = {}
+        for name in audio_files:
+            self._stripped[number_pattern.sub('', name)].append(name)
+            self._by_length[len(name)].add(name)
+            self._char_counts[name] = tuple(Counter(name).items())
+            for gram in _trigrams(name):
+                self._postings[gram].add(name)
+
+    def _candidates(self, title: str) -> list:
+        grams = [g for g in _trigrams(title) if g in self._postings]
+        if not grams:
+            return []
+        limit = len(self.audio_files) * COMMON_GRAM_RATIO
+        selective = [g for g in grams if len(self._postings[g]) <= limit] or grams
+        counts = Counter()
+        for gram in selective:
+            counts.update(self._postings[gram])
+        return [name for name, _ in counts.most_common() if name in self.audio_files][:MATCH_CANDIDATES]
+
+    def match(self, title: str) -> tuple | None:
+        """返回 (文件名无扩展名, 扩展名)，找不到时返回 None"""
+        if title in self.audio_files:
+            return title, self.audio_files[title]
+
+        s = difflib.SequenceMatcher()
+        s.set_seq2(title)
+        size, title_counts = len(title), Counter(title)
+        # 当前最佳 (分数, 文件名)；分数不低于阈值才会被采用
+        best = None
+
+        def consider(name, bound):
+            # bound 为分数上界，按 (分数, 文件名) 比较仍不能胜过当前最佳时跳过
+            nonlocal best
+            if bound < MATCH_CUTOFF or (best is not None and (bound, name) <= best):
+                return
+            bound = 2.0 * _common_chars(self._char_counts[name], title_counts) / (len(name) + size)
+            if bound < MATCH_CUTOFF or (best is not None and (bound, name) <= best):
+                return
+            s.set_seq1(name)
+            score = s.ratio()
+            if score >= MATCH_CUTOFF and (best is None or (score, name) > best):
+                best = (score, name)
+
+        seeds = [name for name in self._stripped.get(title, ()) if name in self.audio_files]
+        seeds += self._candidates(title)
+        for name in seeds:
+            consider(name, 1.0)
+
+        # 长度决定的上界与 real_quick_ratio 相同，从上界最高的长度开始比较
+        bounds = sorted(((2.0 * min(length, size) / (length + size), length) for length in self._by_length),
+                        reverse=True)
+        seen = set(seeds)
+        for bound, length in bounds:
+            if bound < MATCH_CUTOFF or (best is not None and bound < best[0]):
+                break
+            for name in self._by_length[length]:
+                if name not in seen:
+                    consider(name, bound)
+
+        if best is None:
+            return None
+        return best[1], self.audio_files[best[1]]
+
+    def remove(self, name: str):
+        # 倒排索引中的条目在筛选时按 audio_files 过滤，不需要逐个删除
+        self.audio_files.pop(name, None)
+        self._by_length[len(name)].discard(name)
+
+
 class MusicSorter:
     """
     一个用于根据.json歌单文件对音乐文件进行排序和重命名的类。
     """
-    def __init__(self):
+    def __init__(self, library=None):
+        # 曲库索引（LibraryIndex），重命名音频文件时同步更新
+        self.library = library
         # 使用集合以提高成员检查速度
         self.audio_extensions = {'.mp3', '.flac', '.wav', '.ogg'}
         # 预编译正则表达式以提高性能
@@ -46,7 +153,7 @@ class MusicSorter:
             return None
         
         # 使用 difflib 找到最佳匹配，cutoff=0.6 是一个合理的阈值
-        matches = difflib.get_close_matches(title, audio_files.keys(), n=1, cutoff=0.6)
+        matches = difflib.get_close_matches(title, audio_files.keys(), n=1, cutoff=MATCH_CUTOFF)
         if matches:
             best_match = matches[0]
             # 返回匹配的文件名(无扩展名)和扩展名
@@ -61,19 +168,59 @@ class MusicSorter:
         """移除文件名中的编号前缀"""
         return self.number_pattern.sub('', filename)
     
+    def _recover(self, playlist_dir: Path) -> RenameJournal:
+        """处理该目录上次中断的重命名，返回用于本次重命名的日志"""
+        journal = RenameJournal(playlist_dir, self.library)
+        recovered = journal.recover()
+        if recovered == 'committed':
+            print("已完成上次中断的重命名")
+        elif recovered == 'rolled_back':
+            print("上次的重命名未完成，已恢复原文件名")
+        elif recovered == 'failed':
+            raise RuntimeError("上次中断的重命名无法恢复，请检查目录中的 .renaming 临时文件")
+        return journal
+
+    def _report_skipped(self, skipped) -> int:
+        for file_type, old_path, new_path, reason in skipped:
+            print(f"警告: {reason}，跳过 ({file_type}): {old_path.name} -> {new_path.name}")
+        return len(skipped)
+
+    def _execute(self, journal: RenameJournal, ops: list, sorted_names, message: str, sort_map=None) -> int | None:
+        """执行重命名，返回重命名的音频文件数，失败（已恢复原名）时返回 None"""
+        if not journal.execute(ops, sorted_names, sort_map):
+            return None
+        for op in ops:
+            print(f"{message} ({op['kind']}): {op['old']} -> {op['new']}")
+        return sum(1 for op in ops if op['kind'] == 'audio')
+
     def sort_playlist(self, playlist_dir_str: str, tracks: list, start_number: int) -> dict:
         """
         根据歌单信息对目录中的歌曲文件进行排序和重命名。
         """
         playlist_dir = Path(playlist_dir_str)
+        journal = self._recover(playlist_dir)
         # 获取目录下所有音频文件 {文件名: 后缀}
         audio_files = self.get_audio_files(playlist_dir)
-        sorted_file = playlist_dir / ".sorted"
-        
+        existing = set(os.listdir(playlist_dir))
+
+        # 上次排序记录的 歌曲ID -> 文件名：文件仍在时直接使用，不参与模糊匹配，也不会被其他歌曲匹配走
+        claimed = {}
+        previous_map = load_sort_map(playlist_dir)
+        for track in tracks:
+            track_id = str(track.get('id', ''))
+            filename = previous_map.get(track_id)
+            stem, ext = os.path.splitext(filename or '')
+            if filename in existing and audio_files.get(stem) == ext:
+                claimed[track_id] = (stem, audio_files.pop(stem))
+        # 只有存在未记录的歌曲时才建立匹配索引
+        matcher = None
+
         current_number = start_number
         rename_operations = []
         renamed_files_log = []
         not_found_tracks = []
+        sort_map = {}
+        unchanged_count = 0
 
         print(f"\n开始排序歌单，共 {len(tracks)} 首歌曲...")
 
@@ -95,17 +242,21 @@ class MusicSorter:
                 continue
             
             # 4. 尝试寻找最佳匹配文件
-            # 在 audio_files 字典中查找最接近 search_title 的文件名
-            matched_result = self.find_best_match(search_title, audio_files)
+            # 先用上次排序的记录，否则在 audio_files 字典中查找最接近 search_title 的文件名
+            track_id = str(track.get('id', ''))
+            matched_result = claimed.pop(track_id, None)
+            if matched_result is None and audio_files:
+                if matcher is None:
+                    matcher = FilenameMatcher(audio_files, self.number_pattern)
+                matched_result = matcher.match(search_title)
+                if matched_result:
+                    # 匹配成功后，从 audio_files 中移除该文件，防止后续歌曲重复匹配到同一个文件
+                    matcher.remove(matched_result[0])
             
             if matched_result:
                 matched_name, matched_ext = matched_result
                 
-                # 匹配成功后，从 audio_files 中移除该文件，防止后续歌曲重复匹配到同一个文件
-                if matched_name in audio_files:
-                    del audio_files[matched_name]
-                
-                # 5. 准备重命名操作
+                # 5. 准备重命名操作，文件名不变的歌曲及其歌词不做任何操作
                 # 这里的 current_file_path 是找到的本地现有文件
                 current_file_path = playlist_dir / f"{matched_name}{matched_ext}"
                 new_name = f"{current_number}. {search_title}{matched_ext}"
@@ -113,16 +264,19 @@ class MusicSorter:
                 
                 if current_file_path != new_path:
                     rename_operations.append(('audio', current_file_path, new_path))
+                else:
+                    unchanged_count += 1
                 
                 # 记录到日志列表，用于写入 .sorted 文件
                 renamed_files_log.append(new_name)
+                if track_id:
+                    sort_map[track_id] = new_name
                 
                 # 6. 检查并处理对应的 .lrc 歌词文件
-                lrc_file = current_file_path.with_suffix('.lrc')
-                if lrc_file.exists():
-                    new_lrc_name = f"{current_number}. {search_title}.lrc"
-                    new_lrc_path = playlist_dir / new_lrc_name
-                    rename_operations.append(('lrc', lrc_file, new_lrc_path))
+                lrc_name = f"{matched_name}.lrc"
+                new_lrc_name = f"{current_number}. {search_title}.lrc"
+                if lrc_name in existing and lrc_name != new_lrc_name:
+                    rename_operations.append(('lrc', playlist_dir / lrc_name, playlist_dir / new_lrc_name))
             else:
                 # 记录未找到的歌曲 (使用原始标题以便阅读)
                 not_found_tracks.append(raw_title)
@@ -130,34 +284,16 @@ class MusicSorter:
             # 序号递减
             current_number -= 1
         
-        # 7. 批量执行重命名操作
-        processed_count = 0
-        error_count = 0
-        for file_type, old_path, new_path in rename_operations:
-            try:
-                # 简单的防覆盖检查
-                if new_path.exists() and new_path != old_path:
-                     print(f"警告: 目标文件已存在，跳过覆盖: {new_path.name}")
-                     error_count += 1
-                     continue
-
-                old_path.rename(new_path)
-                print(f"成功重命名 ({file_type}): {old_path.name} -> {new_path.name}")
-                if file_type == 'audio':
-                    processed_count += 1
-            except Exception as e:
-                print(f"重命名文件失败: {old_path.name} -> {new_path.name}, 原因: {e}")
-                error_count += 1
-        
-        # 8. 更新 .sorted 记录文件
-        # 仅在有成功重命名的文件时才写入
-        if renamed_files_log:
-            try:
-                with open(sorted_file, 'w', encoding='utf-8') as f:
-                    for name in sorted(renamed_files_log):  # 排序写入，便于人工查看
-                        f.write(name + '\n')
-            except Exception as e:
-                print(f"更新 .sorted 文件时出错: {e}")
+        # 7. 批量执行重命名操作（先全部改为临时名再改为目标名，失败时全部恢复原名）
+        ops, skipped = journal.plan(rename_operations)
+        error_count = self._report_skipped(skipped)
+        skipped_names = {new_path.name: old_path.name for file_type, old_path, new_path, _ in skipped if file_type == 'audio'}
+        # 8. .sorted 记录文件与排序映射随重命名一起提交，只记录实际带编号的文件，被跳过的歌曲映射到原文件名
+        sorted_names = sorted(n for n in renamed_files_log if n not in skipped_names) or None
+        sort_map = {track_id: skipped_names.get(name, name) for track_id, name in sort_map.items()}
+        processed_count = self._execute(journal, ops, sorted_names, "成功重命名", sort_map if sorted_names else None)
+        if processed_count is None:
+            processed_count, error_count = 0, error_count + sum(1 for op in ops if op['kind'] == 'audio')
         
         # 9. 输出结果摘要
         print("\n排序完成！")
@@ -168,6 +304,7 @@ class MusicSorter:
 
         return {
             "processed": processed_count,
+            "unchanged": unchanged_count,
             "not_found": len(not_found_tracks),
             "errors": error_count
         }
@@ -180,6 +317,7 @@ class MusicSorter:
         :return: 一个包含处理结果的字典。
         """
         playlist_dir = Path(playlist_dir_str)
+        journal = self._recover(playlist_dir)
         sorted_file = playlist_dir / ".sorted"
         
         if not sorted_file.exists():
@@ -222,26 +360,15 @@ class MusicSorter:
                 new_lrc_path = playlist_dir / new_lrc_name
                 rename_operations.append(('lrc', lrc_file, new_lrc_path))
 
-        # 批量执行重命名操作
-        processed_count = 0
-        error_count = 0
-        for file_type, old_path, new_path in rename_operations:
-            try:
-                old_path.rename(new_path)
-                print(f"成功移除编号 ({file_type}): {old_path.name} -> {new_path.name}")
-                if file_type == 'audio':
-                    processed_count += 1
-            except Exception as e:
-                print(f"移除编号失败: {old_path.name} -> {new_path.name}, 原因: {e}")
-                error_count += 1
-        
-        # 只有在有成功处理的文件时才删除.sorted文件
-        if processed_count > 0:
-            try:
-                sorted_file.unlink()
-                print("已成功删除.sorted文件")
-            except Exception as e:
-                print(f"删除.sorted文件时出错: {e}")
+        # 批量执行重命名操作；未能移除编号的文件保留在 .sorted 中，全部移除时删除 .sorted
+        ops, skipped = journal.plan(rename_operations)
+        error_count = self._report_skipped(skipped)
+        renamed = {op['old'] for op in ops}
+        remaining = [name for name in sorted_files
+                     if name not in renamed and self.is_already_sorted(name) and (playlist_dir / name).exists()]
+        processed_count = self._execute(journal, ops, remaining if ops else None, "成功移除编号")
+        if processed_count is None:
+            processed_count, error_count = 0, error_count + sum(1 for op in ops if op['kind'] == 'audio')
 
         print("\n移除编号完成！")
         return {
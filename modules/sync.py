@@ -0,0 +1,82 @@
+# modules/sync.py
+import json
+from pathlib import Path
+from .utils import sanitize_filename
+
+# 从歌单中移除的歌曲归档到该子目录
+ARCHIVE_DIR_NAME = '_archive'
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.wav', '.ogg')
+
+
+def load_playlist_json(json_path) -> dict:
+    """读取上次保存的歌单 JSON，不存在或损坏时返回空字典"""
+    try:
+        return json.loads(Path(json_path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def find_local_file(playlist_dir: Path, track: dict, library=None, sort_map=None):
+    """
+    查找歌曲在歌单目录中的音频文件：优先查曲库索引，其次查排序记录的 {歌曲ID: 文件名}，
+    最后按 "歌名 - 歌手" 文件名查找
+    """
+    if library:
+        entries = library.lookup(track['id'], playlist_dir)
+        if entries:
+            return Path(entries[0]['path'])
+    if sort_map and sort_map.get(str(track['id'])):
+        path = playlist_dir / sort_map[str(track['id'])]
+        if path.exists():
+            return path
+    if 'name' not in track:
+        return None
+    filename_base = sanitize_filename(f"{track['name']} - {track.get('ar', '')}")
+    for ext in AUDIO_EXTENSIONS:
+        path = playlist_dir / f"{filename_base}{ext}"
+        if path.exists():
+            return path
+    return None
+
+
+def diff_playlist(playlist_dir, tracks: list, previous_tracks: list, library=None) -> dict:
+    """
+    对比最新歌单与上次保存的歌单及本地文件。
+    返回 {'added': 需要下载的歌曲, 'removed': 已从歌单移除的歌曲, 'unchanged': 无需处理的歌曲数}。
+    上次已存在但本地文件缺失的歌曲也算作需要下载。
+    """
+    playlist_dir = Path(playlist_dir)
+    current_ids = {str(t['id']) for t in tracks}
+    previous_ids = {str(t['id']) for t in previous_tracks}
+
+    added, unchanged = [], 0
+    for t in tracks:
+        if str(t['id']) in previous_ids and find_local_file(playlist_dir, t, library):
+            unchanged += 1
+        else:
+            added.append(t)
+    removed = [t for t in previous_tracks if str(t['id']) not in current_ids]
+    return {'added': added, 'removed': removed, 'unchanged': unchanged}
+
+
+def archive_tracks(playlist_dir, tracks: list, library=None) -> int:
+    """将歌曲文件（及同名 .lrc）移动到歌单目录下的归档目录，返回移动的歌曲数"""
+    playlist_dir = Path(playlist_dir)
+    archive_dir = playlist_dir / ARCHIVE_DIR_NAME
+    moved = 0
+    for t in tracks:
+        audio = find_local_file(playlist_dir, t, library)
+        if not audio:
+            continue
+        archive_dir.mkdir(exist_ok=True)
+        try:
+            for path in (audio, audio.with_suffix('.lrc')):
+                if path.exists():
+                    target = archive_dir / path.name
+                    path.replace(target)
+                    if library and path == audio:
+                        library.rename(path, target)
+            moved += 1
+        except OSError as e:
+            print(f"归档文件失败: {audio.name}, 原因: {e}")
+    return moved
@@ -0,0 +1,105 @@
+# modules/tagger.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 音频元数据处理
+from mutagen.mp3 import MP3
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC
+
+from .utils import normalize_artists
+
+# --- 标签写入配置 ---
+# process: 在独立进程中写入标签，不占用下载线程的 GIL；thread: 在调用线程中写入
+TAG_MODE = 'process'
+# 同时写入标签的数量上限（进程数或线程数），None 表示按 CPU 核数
+TAG_WORKERS = None
+# 未指定时的上限，避免在核数很多的机器上启动过多进程
+MAX_TAG_WORKERS = 8
+
+
+def embed_metadata(audio_path, cover_data, title, artist, album):
+    """
+    写入标题、歌手、专辑和封面。在进程池中执行时只依赖参数本身，
+    成功返回 None，失败返回错误信息。
+    """
+    try:
+        ext = audio_path.suffix.lower()
+        if ext == '.mp3':
+            audio = MP3(str(audio_path), ID3=ID3)
+            if audio.tags is None: audio.add_tags()
+            audio.tags.clear()
+            audio.tags.add(TIT2(encoding=3, text=title))
+            audio.tags.add(TPE1(encoding=3, text=normalize_artists(artist)))
+            audio.tags.add(TALB(encoding=3, text=album))
+            if cover_data:
+                audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover_data))
+            audio.save(v2_version=3)
+        elif ext == '.flac':
+            audio = FLAC(str(audio_path))
+            audio.clear_pictures()
+            audio.delete()
+            audio['title'] = title
+            audio['artist'] = normalize_artists(artist)
+            audio['album'] = album
+            if cover_data:
+                p = Picture()
+                p.type = 3
+                p.mime = 'image/jpeg'
+                p.desc = 'Cover'
+                p.data = cover_data
+                audio.add_picture(p)
+            audio.save()
+        return None
+    except Exception as e:
+        return str(e)
+
+
+class Tagger:
+    """
+    标签写入执行器。mutagen 解析和重写整个文件时长时间持有 GIL，
+    process 模式下交给进程池执行，下载线程只等待结果；
+    进程池不可用（平台不支持或工作进程崩溃）时自动退回 thread 模式。
+    两种模式下同时写入的数量都不超过 workers。
+    """
+    def __init__(self, mode=TAG_MODE, workers=TAG_WORKERS):
+        self.mode = mode
+        self.workers = max(1, int(workers or min(os.cpu_count() or 1, MAX_TAG_WORKERS)))
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self.mode == 'process' and self._executor is None:
+                try:
+                    # 进程池在下载线程中按需创建，此时进程内已有很多线程，fork 可能死锁；
+                    # spawn 启动的工作进程不继承线程与锁，但会重新导入主模块（见 app.get_manager）
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                except (OSError, NotImplementedError, ImportError) as e:
+                    print(f"无法创建标签写入进程池，改为线程内写入: {e}")
+                    self.mode = 'thread'
+            return self._executor if self.mode == 'process' else None
+
+    def embed(self, audio_path, cover_data, title, artist, album):
+        """写入标签并等待完成，成功返回 None，失败返回错误信息"""
+        with self._slots:
+            executor = self._get_executor()
+            if executor is not None:
+                try:
+                    return executor.submit(embed_metadata, audio_path, cover_data, title, artist, album).result()
+                except BrokenProcessPool as e:
+                    print(f"标签写入进程异常退出，改为线程内写入: {e}")
+                    with self._lock:
+                        self.mode = 'thread'
+            return embed_metadata(audio_path, cover_data, title, artist, album)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -13,6 +13,7 @@ document.addEventListener('DOMContentLoaded', () => {
         state: {
             isDownloading: false,
             eventSource: null,
+            lastEventId: null,
             currentSaveDir: '',
             currentPlaylistDir: '',
         },
@@ -26,6 +27,7 @@ document.addEventListener('DOMContentLoaded', () => {
             this.bindEvents();
             this.syncDirectories();
             this.setupInitialUI();
+            this.connectToStream();
             console.log("App initialized.");
         },
 
@@ -50,6 +52,9 @@ document.addEventListener('DOMContentLoaded', () => {
             this.ui.playlistListbox = document.getElementById('playlist-listbox');
             this.ui.sortPlaylistBtn = document.getElementById('sort-playlist-btn');
             this.ui.removeNumberingBtn = document.getElementById('remove-numbering-btn');
+            this.ui.rebuildLyricsBtn = document.getElementById('rebuild-lyrics-btn');
+            this.ui.rebuildLyricsTranslated = document.getElementById('rebuild-lyrics-translated');
+            this.ui.rebuildLyricsRomanized = document.getElementById('rebuild-lyrics-romanized');
             this.ui.downloadPlaylistBtn = document.getElementById('download-playlist-btn');
             // [修复] 缓存正确的编号输入框
             this.ui.sortNumber = document.getElementById('sort-number');
@@ -80,6 +85,7 @@ document.addEventListener('DOMContentLoaded', () => {
             // [修复] 确保点击事件可以正常触发 handleSortAction
             this.ui.sortPlaylistBtn.addEventListener('click', () => this.handleSortAction('sort-playlist'));
             this.ui.removeNumberingBtn.addEventListener('click', () => this.handleSortAction('remove-numbering'));
+            this.ui.rebuildLyricsBtn.addEventListener('click', () => this.handleSortAction('rebuild-lyrics'));
             this.ui.downloadPlaylistBtn.addEventListener('click', this.handleDownloadSelectedPlaylist.bind(this));
 
             this.ui.retryDownloadBtn.addEventListener('click', this.handleRetryDownload.bind(this));
@@ -214,7 +220,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     quality: formData.get('quality'),
                     download_lyrics: this.ui.lyricsOriginal.checked,
                     download_lyrics_translated: this.ui.lyricsTranslated.checked,
-                    download_api: formData.get('download_api')
+                    download_api: formData.get('download_api'),
+                    engine: formData.get('engine')
                 })
             })
             .then(res => res.json())
@@ -231,11 +238,15 @@ document.addEventListener('DOMContentLoaded', () => {
         },
 
         // SSE 事件流
+        // 页面打开期间保持一个连接；重新连接时带上最后收到的事件 ID，由服务器补发断线期间的事件
         connectToStream() {
-            if (this.state.eventSource) this.state.eventSource.close();
-            this.state.eventSource = new EventSource('/stream');
+            const source = this.state.eventSource;
+            if (source && source.readyState !== EventSource.CLOSED) return;
+            const query = this.state.lastEventId ? `?last_event_id=${encodeURIComponent(this.state.lastEventId)}` : '';
+            this.state.eventSource = new EventSource('/stream' + query);
 
             this.state.eventSource.onmessage = event => {
+                if (event.lastEventId) this.state.lastEventId = event.lastEventId;
                 const data = JSON.parse(event.data);
                 switch (data.type) {
                     case 'log':
@@ -263,9 +274,10 @@ document.addEventListener('DOMContentLoaded', () => {
             };
 
             this.state.eventSource.onerror = () => {
+                // 连接中断时浏览器会自动重连（带 Last-Event-ID），只有彻底关闭时才提示
+                if (this.state.eventSource.readyState !== EventSource.CLOSED) return;
                 this.logMessage('与服务器的连接断开，请检查后端服务。', 'error');
                 if(this.state.isDownloading) this.updateUI(false);
-                this.state.eventSource.close();
             };
         },
 
@@ -273,7 +285,6 @@ document.addEventListener('DOMContentLoaded', () => {
             this.logMessage(data.message, data.type === 'stopped' ? 'info' : 'success');
             this.ui.statusLabel.textContent = data.type === 'done' ? "任务完成!" : "任务已停止";
             this.updateUI(false);
-            if (this.state.eventSource) this.state.eventSource.close();
 
             const title = `任务${data.type === 'done' ? '完成' : '停止'}`;
             const type = data.has_failed ? 'warning' : 'success';
@@ -388,6 +399,10 @@ document.addEventListener('DOMContentLoaded', () => {
             if (action === 'sort-playlist') {
                 // [修复] 从正确的输入框获取值，并发送给后端
                 payload.start_number = parseInt(this.ui.sortNumber.value, 10);
+            } else if (action === 'rebuild-lyrics') {
+                // 歌词重建作为任务排队执行，进度通过事件流显示
+                payload.translated = this.ui.rebuildLyricsTranslated.checked;
+                payload.romanized = this.ui.rebuildLyricsRomanized.checked;
             }
 
             try {
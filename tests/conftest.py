@@ -0,0 +1,25 @@
+# tests/conftest.py
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+# 在项目根目录之外运行 pytest 时也能导入 modules / benchmarks
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stub_server import StubUpstream, install  # noqa: E402
+from modules import client  # noqa: E402
+
+AUDIO_SIZE = 300 * 1024
+
+
+@pytest.fixture
+def stub():
+    """本地模拟上游，音频内容为随机字节，便于逐字节比较"""
+    server = StubUpstream().start()
+    server.audio = random.Random(0).randbytes(AUDIO_SIZE)
+    install(server)
+    yield server
+    server.stop()
+    client.get_session().close()
@@ -0,0 +1,27 @@
+# tests/test_app.py
+"""Web 接口的参数检查（无效参数在创建下载管理器之前就返回）"""
+import pytest
+
+import app as web
+
+
+@pytest.fixture
+def http():
+    web.app.config['TESTING'] = True
+    return web.app.test_client()
+
+
+@pytest.mark.parametrize('path, payload', [
+    ('/jobs', {'parse_method': 'playlist', 'priority': 'x'}),
+    ('/rebuild-lyrics', {'base_dir': '.', 'priority': 'x'}),
+])
+def test_invalid_priority_is_rejected(http, path, payload):
+    r = http.post(path, json=payload)
+    assert r.status_code == 400
+    assert r.get_json()['message'] == "优先级必须是整数"
+    assert web._manager is None
+
+
+def test_invalid_priority_change_is_rejected(http):
+    r = http.post('/jobs/abc/priority', json={'priority': 'x'})
+    assert r.get_json() == {'status': 'error', 'message': "优先级必须是整数"}
@@ -0,0 +1,62 @@
+# tests/test_async_engine.py
+"""asyncio 引擎：歌曲数远多于线程池大小时全部完成，封面/歌词的缓存查询不会占满 DNS 解析所需的线程"""
+import contextlib
+import functools
+import io
+import threading
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from benchmarks.stub_server import make_mp3, redirect_url  # noqa: E402
+from modules import async_engine, ratelimit  # noqa: E402
+from modules.cache import CoverCache, LyricsCache  # noqa: E402
+from modules.downloader import MusicDownloader, PROVIDER_SPECS, _lyrics_url, parse_music_source  # noqa: E402
+
+TRACKS = 120
+TIMEOUT = 60
+
+
+@pytest.fixture
+def async_stub(stub, monkeypatch):
+    """
+    让 aiohttp 的请求也发往本地模拟服务器。
+    地址使用主机名 localhost 并关闭 DNS 缓存，每个请求都要在默认线程池中解析一次。
+    """
+    monkeypatch.setattr(ratelimit, 'HOST_RATES', {})
+    local = stub.base_url.replace('127.0.0.1', 'localhost')
+    build_url, format_data, label = PROVIDER_SPECS['vkeys']
+    monkeypatch.setitem(PROVIDER_SPECS, 'vkeys',
+                        (lambda sid, level: redirect_url(local, build_url(sid, level)), format_data, label))
+    monkeypatch.setattr(async_engine, '_lyrics_url', lambda sid: redirect_url(local, _lyrics_url(sid)))
+    monkeypatch.setattr(async_engine.aiohttp, 'TCPConnector',
+                        functools.partial(async_engine.aiohttp.TCPConnector, use_dns_cache=False))
+    stub.latency = 0.01
+    # 可以解析的 MP3，标签阶段实际写入封面
+    stub.audio = make_mp3(64 * 1024)
+    # 解析结果中的音频与封面地址同样使用 localhost
+    stub.base_url = local
+    return stub
+
+
+def test_more_tracks_than_executor_threads(tmp_path, async_stub, monkeypatch):
+    monkeypatch.setattr(async_engine, 'BRIDGE_THREADS', 2)
+    monkeypatch.setattr(async_engine, 'IO_THREADS', 2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracks = parse_music_source('playlist', f"https://music.163.com/playlist?id={TRACKS}")['tracks']
+    dl = MusicDownloader(tmp_path, api_name='vkeys', failover=False,
+                         lyrics_cache=LyricsCache(tmp_path / 'lyrics.db'), cover_cache=CoverCache())
+    engine = async_engine.AsyncEngine(dl, dl_lyrics=True)
+
+    outcomes = []
+    runner = threading.Thread(target=lambda: outcomes.extend(engine.run(tracks)), daemon=True)
+    runner.start()
+    runner.join(TIMEOUT)
+    engine.stop_event.set()
+    assert not runner.is_alive(), f"引擎卡住：{len(outcomes)}/{TRACKS} 首完成"
+
+    assert len(outcomes) == TRACKS
+    assert all(error is None and ctx['result'][0] == 'downloaded' for _, ctx, error in outcomes)
+    assert not any(ctx.get('tag_error') for _, ctx, _ in outcomes)
+    assert len(list(tmp_path.glob('*.lrc'))) == TRACKS
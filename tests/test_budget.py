@@ -0,0 +1,84 @@
+# tests/test_budget.py
+"""FairBudget：多个任务平分传输额度，没有其他任务等待时可以占用空闲额度"""
+import threading
+import time
+
+from modules.manager import FairBudget
+
+TIMEOUT = 5
+
+
+def acquire_in_thread(budget, job_id):
+    done = threading.Event()
+
+    def run():
+        budget.acquire(job_id)
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done
+
+
+def wait_until(predicate):
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def waiting(budget, job_id):
+    with budget._cond:
+        return budget._waiting.get(job_id, 0)
+
+
+def test_single_job_uses_all_slots():
+    budget = FairBudget(4)
+    budget.register('a')
+    for _ in range(4):
+        budget.acquire('a')
+    assert budget._used == {'a': 4}
+
+    blocked = acquire_in_thread(budget, 'a')
+    assert not blocked.wait(0.1)
+    budget.release('a')
+    assert blocked.wait(TIMEOUT)
+
+
+def test_freed_slot_goes_to_the_job_below_its_share():
+    budget = FairBudget(4)
+    budget.register('a')
+    for _ in range(4):
+        budget.acquire('a')
+    budget.register('b')
+    b_done = acquire_in_thread(budget, 'b')
+    wait_until(lambda: waiting(budget, 'b'))
+    a_done = acquire_in_thread(budget, 'a')
+    wait_until(lambda: waiting(budget, 'a'))
+
+    # a 已超过平均份额（2）且 b 在等待，释放的额度分给 b
+    budget.release('a')
+    assert b_done.wait(TIMEOUT)
+    assert not a_done.wait(0.1)
+    assert budget._used == {'a': 3, 'b': 1}
+
+    # b 不再等待时，a 可以再次占用超出份额的空闲额度
+    budget.release('a')
+    assert a_done.wait(TIMEOUT)
+    assert budget._used == {'a': 3, 'b': 1}
+
+
+def test_unregister_wakes_waiters():
+    budget = FairBudget(1)
+    budget.register('a')
+    budget.register('b')
+    budget.acquire('a')
+    b_done = acquire_in_thread(budget, 'b')
+    wait_until(lambda: waiting(budget, 'b'))
+
+    budget.unregister('b')
+    assert b_done.wait(TIMEOUT)
+    assert budget._used == {'a': 1}
+    # 已注销的任务不再等待额度，释放也不影响其他任务
+    budget.acquire('b')
+    budget.release('b')
+    assert budget._used == {'a': 1}
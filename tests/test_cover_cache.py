@@ -0,0 +1,27 @@
+# tests/test_cover_cache.py
+"""封面缓存的磁盘层：保存根目录下持久化，重启（新实例）后不再下载"""
+from modules.cache import CoverCache, COVER_DIR_NAME, open_cover_cache
+
+
+def test_open_cover_cache_uses_save_root(tmp_path):
+    cache = open_cover_cache(tmp_path)
+    assert cache is open_cover_cache(tmp_path)
+    assert cache.disk_dir == tmp_path.resolve() / COVER_DIR_NAME
+
+
+def test_disk_tier_survives_new_instance_and_dedups(tmp_path):
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        return b'cover-bytes'
+
+    first = CoverCache(disk_dir=tmp_path)
+    assert first.get('http://a/1.jpg', fetch) == b'cover-bytes'
+    assert first.get('http://a/2.jpg', fetch) == b'cover-bytes'
+    # 内容相同的两张封面只存一份
+    assert len(list((tmp_path / 'objects').iterdir())) == 1
+
+    second = CoverCache(disk_dir=tmp_path)
+    assert second.get('http://a/1.jpg', fetch) == b'cover-bytes'
+    assert calls == ['http://a/1.jpg', 'http://a/2.jpg']
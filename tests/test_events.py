@@ -0,0 +1,64 @@
+# tests/test_events.py
+"""EventHub：断线重连时按 Last-Event-ID 补发，进度事件按任务合并"""
+from modules import events
+from modules.events import EventHub
+
+TIMEOUT = 5
+
+
+def drain(sub):
+    received = []
+    while (item := sub.get(timeout=0)) is not None:
+        received.append(item)
+    return received
+
+
+def test_replay_after_last_event_id():
+    hub = EventHub(buffer_size=3, coalesce_window=0)
+    live = hub.subscribe()
+    for n in range(4):
+        hub.publish({'type': 'log', 'n': n})
+    ids = [event_id for event_id, _ in drain(live)]
+    assert ids == sorted(ids) and len(ids) == 4
+
+    # 只补发 Last-Event-ID 之后的事件，缓冲区外的旧事件已丢弃
+    assert [event['n'] for _, event in drain(hub.subscribe(last_event_id=ids[1]))] == [2, 3]
+    assert [event['n'] for _, event in drain(hub.subscribe(last_event_id=0))] == [1, 2, 3]
+    assert drain(hub.subscribe()) == []
+
+
+def test_progress_is_coalesced_per_job():
+    hub = EventHub(coalesce_window=60)
+    sub = hub.subscribe()
+    for n in range(5):
+        hub.publish({'type': 'progress', 'job_id': 'a', 'n': n})
+        hub.publish({'type': 'progress', 'job_id': 'b', 'n': n})
+    # 其他类型的事件先发出该任务尚未发送的最新进度
+    hub.publish({'type': 'done', 'job_id': 'a'})
+
+    received = [(event['type'], event['job_id'], event.get('n')) for _, event in drain(sub)]
+    assert received == [('progress', 'a', 0), ('progress', 'b', 0), ('progress', 'a', 4), ('done', 'a', None)]
+
+
+def test_pending_progress_is_flushed_after_the_window():
+    hub = EventHub(coalesce_window=0.05)
+    sub = hub.subscribe()
+    for n in range(3):
+        hub.publish({'type': 'progress', 'job_id': 'a', 'n': n})
+
+    assert sub.get(timeout=TIMEOUT)[1]['n'] == 0
+    assert sub.get(timeout=TIMEOUT)[1]['n'] == 2
+    assert sub.get(timeout=0.2) is None
+
+
+def test_slow_subscriber_is_dropped(monkeypatch):
+    monkeypatch.setattr(events, 'SUBSCRIBER_QUEUE_SIZE', 2)
+    hub = EventHub(coalesce_window=0)
+    slow = hub.subscribe()
+    for n in range(3):
+        hub.publish({'type': 'log', 'n': n})
+    assert slow.closed
+    assert slow not in hub._subscribers
+    # 重连后从读到的最后一条之后补发
+    last_id = drain(slow)[-1][0]
+    assert [event['n'] for _, event in drain(hub.subscribe(last_event_id=last_id))] == [2]
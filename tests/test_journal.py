@@ -0,0 +1,139 @@
+# tests/test_journal.py
+"""JobJournal 的登记与恢复，以及中断后恢复的增量同步任务"""
+import contextlib
+import io
+import json
+import sqlite3
+
+import pytest
+
+from modules import ratelimit
+from modules.downloader import MusicDownloader, parse_music_source
+from modules.journal import JobJournal, PENDING, TRANSFERRED
+from modules.manager import DownloadManager, DownloadJob
+from modules.utils import sanitize_filename
+
+TRACKS = [{'id': i, 'name': f"Song {i}"} for i in range(1, 4)]
+
+
+def make_job(journal, kind='playlist', **params):
+    job = DownloadJob(kind, params)
+    journal.save_job(job.to_dict(with_params=True))
+    return job
+
+
+def test_planned_tracks_distinguishes_empty_plan_from_no_plan(tmp_path):
+    journal = JobJournal(tmp_path / 'jobs.db')
+    job = make_job(journal)
+    assert journal.planned_tracks(job.id) is None
+    journal.plan(job.id, [])
+    assert journal.planned_tracks(job.id) == []
+
+
+def test_replanning_keeps_recorded_states(tmp_path):
+    journal = JobJournal(tmp_path / 'jobs.db')
+    job = make_job(journal)
+    journal.plan(job.id, TRACKS)
+    journal.mark(job.id, 1, TRANSFERRED, {'audio_path': 'a.mp3'})
+    journal.mark(job.id, 2, 'failed')
+
+    # 重启后重新打开日志并再次登记
+    journal = JobJournal(tmp_path / 'jobs.db')
+    journal.plan(job.id, TRACKS)
+    states = journal.track_states(job.id)
+    assert states['1'] == (TRANSFERRED, {'audio_path': 'a.mp3'})
+    assert states['2'][0] == 'failed'
+    assert states['3'] == (PENDING, None)
+    assert journal.failed_tracks(job.id) == [TRACKS[1]]
+    assert [t['id'] for t in journal.planned_tracks(job.id)] == [1, 2, 3]
+
+
+def test_old_database_is_migrated(tmp_path):
+    db = tmp_path / 'jobs.db'
+    with sqlite3.connect(db) as conn:
+        conn.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, source TEXT, updated_at REAL)')
+        conn.execute('INSERT INTO jobs (id, data) VALUES (?, ?)', ('old', json.dumps({'id': 'old'})))
+    journal = JobJournal(db)
+    assert journal.planned_tracks('old') is None
+    journal.plan('old', [])
+    assert journal.planned_tracks('old') == []
+
+
+@pytest.fixture
+def source(stub, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'HOST_RATES', {})
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parse_music_source('playlist', "https://music.163.com/playlist?id=3")
+
+
+def _resume(journal, job):
+    manager = DownloadManager(journal=journal)
+    manager.jobs[job.id] = job
+    manager.budget.register(job.id)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager._run_new_download(job, **job.params)
+    finally:
+        manager.tagger.shutdown()
+
+
+def _sync_job(tmp_path, journal):
+    return make_job(journal, save_dir=str(tmp_path), playlist_url='3', parse_type='playlist', quality='exhigh',
+                    dl_lyrics=False, dl_trans=False, api='vkeys', sync=True)
+
+
+def test_resumed_sync_with_empty_plan_downloads_nothing(tmp_path, stub, source):
+    journal = JobJournal(tmp_path / 'jobs.db')
+    job = _sync_job(tmp_path, journal)
+    journal.set_source(job.id, source)
+    journal.plan(job.id, [])
+    requests = stub.requests
+
+    _resume(journal, job)
+    assert stub.requests == requests
+    assert not list((tmp_path / 'playlist').glob('*/*.mp3'))
+
+
+def test_resumed_sync_without_plan_recomputes_the_diff(tmp_path, stub, source):
+    journal = JobJournal(tmp_path / 'jobs.db')
+    job = _sync_job(tmp_path, journal)
+    journal.set_source(job.id, source)
+    # 上次保存的歌单只有前两首，且文件都在
+    dest = tmp_path / 'playlist' / sanitize_filename(source['name'])
+    dest.mkdir(parents=True)
+    previous = source['tracks'][:2]
+    (dest / f"{sanitize_filename(source['name'])}.json").write_text(json.dumps({'tracks': previous}), encoding='utf-8')
+    for t in previous:
+        (dest / f"{sanitize_filename(t['name'] + ' - ' + t['ar'])}.mp3").write_bytes(b'x')
+
+    _resume(journal, job)
+    assert [t['id'] for t in journal.planned_tracks(job.id)] == [source['tracks'][2]['id']]
+    assert journal.track_states(job.id)[str(source['tracks'][2]['id'])][0] == 'downloaded'
+    assert len(list(dest.glob('*.mp3'))) == 3
+
+
+def test_resumed_job_skips_finished_stages(tmp_path, stub, source, monkeypatch):
+    journal = JobJournal(tmp_path / 'jobs.db')
+    job = make_job(journal, save_dir=str(tmp_path), playlist_url='3', parse_type='playlist', quality='exhigh',
+                   dl_lyrics=False, dl_trans=False, api='vkeys')
+    journal.set_source(job.id, source)
+    journal.plan(job.id, source['tracks'])
+    # 第一首上次已传输完成：音频文件在，日志中记录了恢复所需的上下文
+    first = source['tracks'][0]
+    dest = tmp_path / 'playlist' / sanitize_filename(source['name'])
+    dest.mkdir(parents=True)
+    filename_base = sanitize_filename(f"{first['name']} - {first['ar']}")
+    audio_path = dest / f"{filename_base}.mp3"
+    audio_path.write_bytes(stub.audio)
+    journal.mark(job.id, first['id'], TRANSFERRED, {'songs': first, 'filename_base': filename_base,
+                                                    'audio_path': str(audio_path), 'level': 'exhigh'})
+
+    transferred = []
+    transfer = MusicDownloader.transfer_song
+    monkeypatch.setattr(MusicDownloader, 'transfer_song',
+                        lambda self, ctx: transferred.append(ctx['song_id']) or transfer(self, ctx))
+
+    _resume(journal, job)
+    assert sorted(transferred) == sorted(str(t['id']) for t in source['tracks'][1:])
+    states = journal.track_states(job.id)
+    assert all(states[str(t['id'])][0] == 'downloaded' for t in source['tracks'])
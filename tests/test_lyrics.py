@@ -0,0 +1,55 @@
+# tests/test_lyrics.py
+"""歌词解析与合并的输出与改写前的实现（benchmarks/bench_lyrics.py 中的 legacy_*）相同"""
+import random
+
+import pytest
+
+from benchmarks.bench_lyrics import legacy_parse, legacy_merge, make_lyrics
+from modules.Lyrics import LRCParser, merge_lyrics, merge_lyrics_data
+
+EDGE_CASES = [
+    '',
+    '   \n',
+    '[00:01.00]a\r\n[00:02.50]b\r\n',
+    'x[00:01.00]a[00:03.00]b',
+    '[00:01.00] a [00:02.00] b',
+    '[00:01.5]one\n[00:01.500]dup\n[00:01.50]dup2',
+    '[ti:x]\n[00:00.00]\n[01:02:03]c',
+    '[00:05.00]late\n[00:01.00]early',
+    'no tags\n[00:01.00][00:02.00][00:03.00]triple',
+    '[00:01.1234]long ms',
+    '  [00:01.00]  padded  ',
+]
+
+
+def legacy_pairs(text):
+    return [(x['time'], x['content']) for x in legacy_parse(text)]
+
+
+@pytest.mark.parametrize('text', EDGE_CASES)
+def test_parse_matches_legacy(text):
+    assert LRCParser().parse_lrc(text) == legacy_pairs(text)
+    assert LRCParser().parse_lrc_content(text) == legacy_parse(text)
+
+
+@pytest.mark.parametrize('original', EDGE_CASES)
+def test_merge_matches_legacy(original):
+    for translated in EDGE_CASES:
+        assert merge_lyrics(original, translated) == legacy_merge(original, translated)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_generated_lyrics_match_legacy(seed):
+    rnd = random.Random(seed)
+    parser = LRCParser()
+    for _ in range(50):
+        original, translated = make_lyrics(rnd, 60)
+        assert parser.parse_lrc(original) == legacy_pairs(original)
+        assert merge_lyrics(original, translated) == legacy_merge(original, translated)
+
+
+def test_merge_lyrics_data_options():
+    data = {'lrc': '[00:01.00]原文', 'tlyric': '[00:01.00]译文', 'romalrc': '[00:01.00]roma'}
+    assert merge_lyrics_data(data) == ['[00:01.000]原文']
+    assert merge_lyrics_data(data, translated=True) == ['[00:01.000]原文 / 译文']
+    assert merge_lyrics_data(data, translated=True, romanized=True) == ['[00:01.000]原文 / roma / 译文']
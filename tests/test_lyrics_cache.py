@@ -0,0 +1,80 @@
+# tests/test_lyrics_cache.py
+"""歌词缓存：没有歌词的结果同样缓存，预取只针对需要下载的歌曲"""
+import contextlib
+import io
+import threading
+
+import pytest
+
+from modules import ratelimit
+from modules.cache import LyricsCache
+from modules.downloader import EMPTY_LYRICS, parse_music_source
+from modules.manager import DownloadManager, DownloadJob
+
+TRACKS = 50
+
+
+def test_no_lyrics_result_is_cached_with_its_own_ttl(tmp_path):
+    cache = LyricsCache(tmp_path / 'lyrics.db')
+    calls = []
+
+    def fetch(song_id):
+        calls.append(song_id)
+        return {'lrc': '', 'tlyric': '', 'romalrc': ''}
+
+    assert cache.get(1, fetch) == {'lrc': '', 'tlyric': '', 'romalrc': ''}
+    cache.get(1, fetch)
+    assert calls == [1]
+    assert cache.missing([1]) == []
+
+    cache.no_lyrics_ttl = 0
+    assert cache.lookup(1)[1] is False
+    assert cache.missing([1]) == ['1']
+
+
+def test_failed_request_is_not_cached(tmp_path):
+    cache = LyricsCache(tmp_path / 'lyrics.db')
+    cache.get(1, lambda song_id: dict(EMPTY_LYRICS))
+    assert cache.lookup(1) is None
+
+
+@pytest.fixture
+def no_lyrics_stub(stub, monkeypatch):
+    """歌词接口对所有歌曲返回 nolyric，并统计歌词请求次数"""
+    monkeypatch.setattr(ratelimit, 'HOST_RATES', {})
+    stub.lyric_requests = 0
+    lock = threading.Lock()
+
+    def lyric(i):
+        with lock:
+            stub.lyric_requests += 1
+        return {'nolyric': True, 'code': 200}
+
+    stub._lyric = lyric
+    return stub
+
+
+def _download(root, tracks):
+    manager = DownloadManager(prefetch_lyrics=True)
+    job = DownloadJob('retry', {})
+    manager.jobs[job.id] = job
+    manager.budget.register(job.id)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager._process_common_download(job, root, root / 'playlist' / 'Bench', tracks,
+                                             'exhigh', True, False, 'vkeys')
+    finally:
+        manager.tagger.shutdown()
+
+
+def test_songs_without_lyrics_are_requested_once(tmp_path, no_lyrics_stub):
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracks = parse_music_source('playlist', f"https://music.163.com/playlist?id={TRACKS}")['tracks']
+
+    _download(tmp_path, tracks)
+    # 预取与歌词阶段共用缓存，每首歌只请求一次
+    assert no_lyrics_stub.lyric_requests == TRACKS
+
+    # 再次运行时全部歌曲被跳过，不再请求歌词
+    _download(tmp_path, tracks)
+    assert no_lyrics_stub.lyric_requests == TRACKS
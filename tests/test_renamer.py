@@ -0,0 +1,161 @@
+# tests/test_renamer.py
+"""两阶段重命名：中途失败或中断后恢复原名或继续完成，以及按 .sort-map 的增量排序"""
+import json
+
+import pytest
+
+from modules import sorter as sorter_module
+from modules.library import LibraryIndex
+from modules.renamer import (
+    RenameJournal, JOURNAL_NAME, SORTED_NAME, SORT_MAP_NAME, TEMP_SUFFIX, STAGING, COMMITTING, load_sort_map,
+)
+from modules.sorter import MusicSorter
+
+
+class Interrupted(Exception):
+    """模拟进程在重命名途中退出（不是 OSError，execute() 不会捕获并回滚）"""
+
+
+def make_files(directory, names):
+    for name in names:
+        (directory / name).write_text(name, encoding='utf-8')
+
+
+def contents(directory):
+    """{文件名: 内容}，不含日志与临时文件"""
+    return {p.name: p.read_text(encoding='utf-8') for p in directory.iterdir()
+            if not p.name.startswith('.')}
+
+
+def plan(journal, directory, pairs):
+    ops, skipped = journal.plan([('audio', directory / old, directory / new) for old, new in pairs])
+    assert not skipped
+    return ops
+
+
+def fail_on_move(monkeypatch, journal, call, exc):
+    """第 call 次（从 1 开始）_move 调用时抛出 exc"""
+    move = journal._move
+    calls = []
+
+    def flaky(src, dst):
+        calls.append((src, dst))
+        if len(calls) == call:
+            raise exc
+        move(src, dst)
+
+    monkeypatch.setattr(journal, '_move', flaky)
+
+
+def test_swap_names(tmp_path):
+    make_files(tmp_path, ['a.mp3', 'b.mp3'])
+    journal = RenameJournal(tmp_path)
+    ops = plan(journal, tmp_path, [('a.mp3', 'b.mp3'), ('b.mp3', 'a.mp3')])
+
+    assert journal.execute(ops, ['a.mp3', 'b.mp3'])
+    assert contents(tmp_path) == {'a.mp3': 'b.mp3', 'b.mp3': 'a.mp3'}
+    assert (tmp_path / SORTED_NAME).read_text(encoding='utf-8') == 'a.mp3\nb.mp3\n'
+    assert not (tmp_path / JOURNAL_NAME).exists()
+
+
+def test_error_during_commit_rolls_back(tmp_path, monkeypatch):
+    make_files(tmp_path, ['a.mp3', 'b.mp3', 'c.mp3'])
+    journal = RenameJournal(tmp_path)
+    ops = plan(journal, tmp_path, [('a.mp3', '1. a.mp3'), ('b.mp3', '2. b.mp3'), ('c.mp3', '3. c.mp3')])
+    # 三次暂存之后，第二次提交失败
+    fail_on_move(monkeypatch, journal, 5, PermissionError('denied'))
+
+    assert not journal.execute(ops, ['1. a.mp3'])
+    assert contents(tmp_path) == {'a.mp3': 'a.mp3', 'b.mp3': 'b.mp3', 'c.mp3': 'c.mp3'}
+    assert not (tmp_path / JOURNAL_NAME).exists()
+    assert not (tmp_path / SORTED_NAME).exists()
+
+
+@pytest.mark.parametrize('call, state, outcome, expected', [
+    # 暂存到一半中断：恢复原名
+    (2, STAGING, 'rolled_back', {'a.mp3': 'a.mp3', 'b.mp3': 'b.mp3'}),
+    # 提交到一半中断：继续完成
+    (4, COMMITTING, 'committed', {'b.mp3': 'a.mp3', 'a.mp3': 'b.mp3'}),
+])
+def test_recover_after_interruption(tmp_path, monkeypatch, call, state, outcome, expected):
+    make_files(tmp_path, ['a.mp3', 'b.mp3'])
+    journal = RenameJournal(tmp_path)
+    ops = plan(journal, tmp_path, [('a.mp3', 'b.mp3'), ('b.mp3', 'a.mp3')])
+    fail_on_move(monkeypatch, journal, call, Interrupted())
+
+    with pytest.raises(Interrupted):
+        journal.execute(ops, ['a.mp3', 'b.mp3'], {'1': 'b.mp3'})
+    assert json.loads((tmp_path / JOURNAL_NAME).read_text(encoding='utf-8'))['state'] == state
+    assert any(p.name.endswith(TEMP_SUFFIX) for p in tmp_path.iterdir())
+
+    # 下次运行时用新的日志对象恢复
+    assert RenameJournal(tmp_path).recover() == outcome
+    assert contents(tmp_path) == expected
+    assert not (tmp_path / JOURNAL_NAME).exists()
+    assert not any(p.name.endswith(TEMP_SUFFIX) for p in tmp_path.iterdir())
+    # .sorted 与排序映射只在提交完成后写入
+    assert (tmp_path / SORTED_NAME).exists() == (outcome == 'committed')
+    assert load_sort_map(tmp_path) == ({'1': 'b.mp3'} if outcome == 'committed' else {})
+
+
+def test_library_follows_committed_renames(tmp_path):
+    make_files(tmp_path, ['a.mp3'])
+    library = LibraryIndex(tmp_path / 'library.db')
+    library.record('1', tmp_path / 'a.mp3')
+    journal = RenameJournal(tmp_path, library)
+
+    assert journal.execute(plan(journal, tmp_path, [('a.mp3', '1. a.mp3')]))
+    assert [entry['path'] for entry in library.lookup('1')] == [str(tmp_path / '1. a.mp3')]
+
+
+# --- 增量排序 ---
+
+def track(i, name=None):
+    return {'id': i, 'name': name or f"Song {i}", 'ar': f"Artist {i}"}
+
+
+def test_resort_uses_the_sort_map(tmp_path, monkeypatch):
+    tracks = [track(1), track(2), track(3)]
+    make_files(tmp_path, [f"Song {i} - Artist {i}.mp3" for i in (1, 2, 3)] + ['Song 2 - Artist 2.lrc'])
+    sorter = MusicSorter()
+
+    assert sorter.sort_playlist(str(tmp_path), tracks, 3)['processed'] == 3
+    assert load_sort_map(tmp_path) == {'1': '1. Song 1 - Artist 1.mp3', '2': '2. Song 2 - Artist 2.mp3',
+                                       '3': '3. Song 3 - Artist 3.mp3'}
+    assert (tmp_path / '2. Song 2 - Artist 2.lrc').exists()
+
+    # 歌单开头新增一首、歌曲改名：记录中的歌曲直接按映射找到文件，不需要模糊匹配
+    tracks = [track(4), track(1), track(2, name='Renamed'), track(3)]
+    make_files(tmp_path, ['Song 4 - Artist 4.mp3'])
+    titles = []
+    match = sorter_module.FilenameMatcher.match
+    monkeypatch.setattr(sorter_module.FilenameMatcher, 'match',
+                        lambda self, title: titles.append(title) or match(self, title))
+
+    result = sorter.sort_playlist(str(tmp_path), tracks, 4)
+    assert titles == ['Song 4 - Artist 4']
+    assert result == {'processed': 4, 'unchanged': 0, 'not_found': 0, 'errors': 0}
+    assert contents(tmp_path) == {
+        '1. Song 4 - Artist 4.mp3': 'Song 4 - Artist 4.mp3',
+        '2. Song 1 - Artist 1.mp3': 'Song 1 - Artist 1.mp3',
+        '3. Renamed - Artist 2.mp3': 'Song 2 - Artist 2.mp3',
+        '3. Renamed - Artist 2.lrc': 'Song 2 - Artist 2.lrc',
+        '4. Song 3 - Artist 3.mp3': 'Song 3 - Artist 3.mp3',
+    }
+    assert load_sort_map(tmp_path)['2'] == '3. Renamed - Artist 2.mp3'
+
+    # 再次排序时全部文件名不变，不建立匹配索引
+    monkeypatch.setattr(sorter_module, 'FilenameMatcher', None)
+    assert sorter.sort_playlist(str(tmp_path), tracks, 4) == {'processed': 0, 'unchanged': 4, 'not_found': 0, 'errors': 0}
+
+
+def test_remove_numbers_clears_the_sort_map(tmp_path):
+    make_files(tmp_path, ['Song 1 - Artist 1.mp3'])
+    sorter = MusicSorter()
+    sorter.sort_playlist(str(tmp_path), [track(1)], 1)
+    assert (tmp_path / SORT_MAP_NAME).exists()
+
+    assert sorter.remove_numbers(str(tmp_path)) == {'processed': 1, 'errors': 0}
+    assert contents(tmp_path) == {'Song 1 - Artist 1.mp3': 'Song 1 - Artist 1.mp3'}
+    assert not (tmp_path / SORTED_NAME).exists()
+    assert not (tmp_path / SORT_MAP_NAME).exists()
@@ -0,0 +1,49 @@
+# tests/test_resolver.py
+"""ProviderResolver 的熔断：冷却期间不再请求，冷却结束后只放行一个试探请求"""
+import time
+
+from modules import resolver
+from modules.resolver import ProviderResolver, FAILURE_THRESHOLD
+
+
+def make_resolver(calls):
+    def good(song_id, level):
+        calls.append('good')
+        return {'url': f"http://example.com/{song_id}"}
+
+    def flaky(song_id, level):
+        calls.append('flaky')
+        return None
+
+    return ProviderResolver({'good': good, 'flaky': flaky}, hedge_after=None)
+
+
+def test_open_provider_gets_no_traffic_during_cooldown():
+    calls = []
+    r = make_resolver(calls)
+    for _ in range(FAILURE_THRESHOLD):
+        r.record('flaky', False, 0.1)
+    assert 'flaky' not in r.ranked('flaky')
+    for i in range(10):
+        assert r.resolve(i, 'exhigh', preferred='flaky')['provider'] == 'good'
+    assert calls.count('flaky') == 0
+
+
+def test_single_half_open_probe_after_cooldown(monkeypatch):
+    monkeypatch.setattr(resolver, 'COOLDOWN_SECONDS', 0.05)
+    r = make_resolver([])
+    for _ in range(FAILURE_THRESHOLD):
+        r.record('flaky', False, 0.1)
+    time.sleep(0.06)
+
+    assert 'flaky' in r.ranked()
+    assert r.claim('flaky')
+    assert not r.claim('flaky')
+    # 试探失败后重新熔断
+    r.record('flaky', False, 0.1)
+    assert not r.claim('flaky')
+
+    time.sleep(0.06)
+    assert r.claim('flaky')
+    r.record('flaky', True, 0.1)
+    assert r.claim('flaky') and r.claim('flaky')
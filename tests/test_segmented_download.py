@@ -0,0 +1,120 @@
+# tests/test_segmented_download.py
+"""MusicDownloader._download_file 的分段下载、续传与服务器不支持 Range 时的回退"""
+import json
+
+from benchmarks.stub_server import etag
+from modules.downloader import MusicDownloader, PART_SUFFIX, PART_INFO_SUFFIX, SEGMENT_STATE_SUFFIX
+
+SEGMENTS = 4
+
+
+def make_downloader(tmp_path, segments=SEGMENTS):
+    return MusicDownloader(tmp_path, segments=segments, segment_min_size=1)
+
+
+def audio_url(stub):
+    return f"{stub.base_url}/audio/1.mp3"
+
+
+def test_segmented_download_is_byte_identical(tmp_path, stub):
+    dl = make_downloader(tmp_path)
+    target = tmp_path / 'song.mp3'
+
+    assert dl._download_file(audio_url(stub), target)
+    assert target.read_bytes() == stub.audio
+    assert dl.metrics.bytes == len(stub.audio)
+    # 一次 Range 探测加每段一个请求
+    assert stub.requests == 1 + SEGMENTS
+    assert not (tmp_path / ('song.mp3' + PART_SUFFIX)).exists()
+    assert not (tmp_path / ('song.mp3' + SEGMENT_STATE_SUFFIX)).exists()
+
+
+def test_segmented_download_resumes_from_part_and_sidecar(tmp_path, stub):
+    data = stub.audio
+    size = len(data)
+    step = -(-size // SEGMENTS)
+    # 每段已完成一半：.part 中只有这些字节是正确的，其余为预分配的 0
+    segments = [[start, min(start + step, size) - 1, step // 2] for start in range(0, size, step)]
+    part = bytearray(size)
+    for start, _, done in segments:
+        part[start:start + done] = data[start:start + done]
+    target = tmp_path / 'song.mp3'
+    (tmp_path / ('song.mp3' + PART_SUFFIX)).write_bytes(bytes(part))
+    (tmp_path / ('song.mp3' + SEGMENT_STATE_SUFFIX)).write_text(json.dumps({'size': size, 'segments': segments}))
+
+    dl = make_downloader(tmp_path)
+    assert dl._download_file(audio_url(stub), target)
+    assert target.read_bytes() == data
+    # 只补齐了未完成的部分
+    assert dl.metrics.bytes == size - sum(done for _, _, done in segments)
+    assert not (tmp_path / ('song.mp3' + SEGMENT_STATE_SUFFIX)).exists()
+
+
+def write_part(tmp_path, content, info=None):
+    """写入单连接下载残留的 .part 与校验信息"""
+    (tmp_path / ('song.mp3' + PART_SUFFIX)).write_bytes(content)
+    if info is not None:
+        (tmp_path / ('song.mp3' + PART_INFO_SUFFIX)).write_text(json.dumps(info))
+
+
+def test_single_stream_resumes_from_part(tmp_path, stub):
+    data = stub.audio
+    target = tmp_path / 'song.mp3'
+    write_part(tmp_path, data[:1000], {'size': len(data), 'validator': etag(data)})
+
+    dl = make_downloader(tmp_path, segments=1)
+    assert dl._download_file(audio_url(stub), target)
+    assert target.read_bytes() == data
+    assert dl.metrics.bytes == len(data) - 1000
+    assert not (tmp_path / ('song.mp3' + PART_INFO_SUFFIX)).exists()
+
+
+def test_single_stream_restarts_when_total_size_changed(tmp_path, stub):
+    data = stub.audio
+    target = tmp_path / 'song.mp3'
+    # 上次下载的文件更大：续传得到的 Content-Range 总长度与记录不符，不能拼接
+    write_part(tmp_path, b'\x00' * 1000, {'size': len(data) + 4096, 'validator': None})
+
+    dl = make_downloader(tmp_path, segments=1)
+    assert dl._download_file(audio_url(stub), target)
+    assert target.read_bytes() == data
+    assert dl.metrics.bytes == len(data)
+
+
+def test_single_stream_restarts_when_validator_changed(tmp_path, stub):
+    data = stub.audio
+    target = tmp_path / 'song.mp3'
+    write_part(tmp_path, b'\x00' * 1000, {'size': len(data), 'validator': etag(b'old')})
+
+    dl = make_downloader(tmp_path, segments=1)
+    assert dl._download_file(audio_url(stub), target)
+    assert target.read_bytes() == data
+    assert dl.metrics.bytes == len(data)
+
+
+def test_single_stream_restarts_without_part_info(tmp_path, stub):
+    data = stub.audio
+    target = tmp_path / 'song.mp3'
+    # 无法确认来源的 .part 不续写
+    write_part(tmp_path, b'\x00' * 1000)
+
+    dl = make_downloader(tmp_path, segments=1)
+    assert dl._download_file(audio_url(stub), target)
+    assert target.read_bytes() == data
+    assert dl.metrics.bytes == len(data)
+
+
+def test_falls_back_when_server_ignores_range(tmp_path, stub):
+    stub.ranges = False
+    data = stub.audio
+    target = tmp_path / 'song.mp3'
+    # 残留的 .part 不能按 Range 续写，应从头下载
+    (tmp_path / ('song.mp3' + PART_SUFFIX)).write_bytes(b'\x00' * 1000)
+
+    dl = make_downloader(tmp_path)
+    assert dl._download_file(audio_url(stub), target)
+    assert target.read_bytes() == data
+    # 探测失败后只用一个完整请求下载
+    assert stub.requests == 2
+    assert dl.metrics.bytes == len(data)
+    assert not (tmp_path / ('song.mp3' + PART_SUFFIX)).exists()
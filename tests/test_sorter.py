@@ -0,0 +1,37 @@
+# tests/test_sorter.py
+"""排序时歌曲与文件的匹配：FilenameMatcher 与逐个比较（find_best_match）的结果相同"""
+import pytest
+
+from benchmarks.bench_sort import make_library, match_all
+from modules.sorter import FilenameMatcher, MusicSorter
+
+TITLE = 'Love Night - Artist 1'
+
+
+def matcher_for(*names):
+    return FilenameMatcher({name: '.mp3' for name in names}, MusicSorter().number_pattern)
+
+
+def test_number_prefix_does_not_beat_a_closer_file():
+    # 去掉编号后同名的文件只作为初始候选，分数更高的文件仍然优先
+    names = ('12. Love Night - Artist 1', 'Love Night - Artist 1x')
+    assert matcher_for(*names).match(TITLE) == ('Love Night - Artist 1x', '.mp3')
+    assert MusicSorter().find_best_match(TITLE, {name: '.mp3' for name in names}) == ('Love Night - Artist 1x', '.mp3')
+
+
+def test_ties_pick_the_same_file_as_difflib():
+    # 同分时 difflib 取文件名较大者
+    assert matcher_for('Love Night - Artist 2', 'Love Night - Artist 3').match(TITLE) == ('Love Night - Artist 3', '.mp3')
+
+
+def test_below_cutoff_is_not_matched():
+    assert matcher_for('Completely Different').match(TITLE) is None
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_agrees_with_brute_force(seed):
+    # 超过 MATCH_CANDIDATES 的目录，含编号、改名和缺失的文件
+    titles, files, _ = make_library(400, fuzzy_rate=0.5, missing_rate=0.1, seed=seed)
+    _, indexed = match_all(titles, files, indexed=True)
+    _, brute = match_all(titles, files, indexed=False)
+    assert indexed == brute
@@ -0,0 +1,63 @@
+# tests/test_sync.py
+"""歌单增量同步：对比新旧歌单与本地文件，归档已移除的歌曲"""
+from modules.library import LibraryIndex
+from modules.sync import ARCHIVE_DIR_NAME, archive_tracks, diff_playlist, find_local_file
+
+
+def track(i):
+    return {'id': i, 'name': f"Song {i}", 'ar': f"Artist {i}"}
+
+
+def make_audio(directory, i, ext='.mp3', lrc=False):
+    path = directory / f"Song {i} - Artist {i}{ext}"
+    path.write_bytes(b'audio')
+    if lrc:
+        path.with_suffix('.lrc').write_text('[00:01.00]x', encoding='utf-8')
+    return path
+
+
+def test_diff_playlist(tmp_path):
+    for i in (1, 2, 4):
+        make_audio(tmp_path, i, ext='.flac' if i == 2 else '.mp3')
+    previous = [track(1), track(2), track(3), track(4)]
+    current = [track(5), track(1), track(2), track(3)]
+
+    delta = diff_playlist(tmp_path, current, previous)
+    # 5 是新歌；3 上次已在歌单中但本地文件缺失，同样需要下载
+    assert [t['id'] for t in delta['added']] == [5, 3]
+    assert [t['id'] for t in delta['removed']] == [4]
+    assert delta['unchanged'] == 2
+
+
+def test_diff_playlist_uses_the_library_for_renamed_files(tmp_path):
+    library = LibraryIndex(tmp_path / 'library.db')
+    renamed = tmp_path / '7. Song 1 - Artist 1.mp3'
+    renamed.write_bytes(b'audio')
+    library.record('1', renamed)
+
+    assert find_local_file(tmp_path, track(1)) is None
+    assert find_local_file(tmp_path, track(1), library) == renamed
+    assert diff_playlist(tmp_path, [track(1)], [track(1)], library)['unchanged'] == 1
+
+
+def test_find_local_file_uses_the_sort_map(tmp_path):
+    sorted_path = tmp_path / '3. Song 1 - Artist 1.mp3'
+    sorted_path.write_bytes(b'audio')
+    assert find_local_file(tmp_path, track(1), sort_map={'1': sorted_path.name}) == sorted_path
+    # 映射中的文件不存在时按歌名查找
+    assert find_local_file(tmp_path, track(1), sort_map={'1': 'missing.mp3'}) is None
+
+
+def test_archive_tracks(tmp_path):
+    library = LibraryIndex(tmp_path / 'library.db')
+    audio = make_audio(tmp_path, 1, lrc=True)
+    library.record('1', audio)
+    make_audio(tmp_path, 2)
+
+    assert archive_tracks(tmp_path, [track(1), track(3)], library) == 1
+    archive = tmp_path / ARCHIVE_DIR_NAME
+    assert sorted(p.name for p in archive.iterdir()) == ['Song 1 - Artist 1.lrc', 'Song 1 - Artist 1.mp3']
+    assert not audio.exists()
+    assert (tmp_path / 'Song 2 - Artist 2.mp3').exists()
+    # 曲库索引跟随文件移动
+    assert [entry['path'] for entry in library.lookup('1')] == [str(archive / audio.name)]